@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+#
+# Compare the latency of tab completion with a linear scan of the sorted keyword list
+# and with the bisect prefix index, on a synthetic mapping.
+#
+#   python bench/completion_bench.py [fields]
+#
+
+from __future__ import print_function
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from elseql.completion import Completer  # noqa: E402
+from elseql.mapping import field_paths  # noqa: E402
+
+
+def make_mapping(fields):
+    # 100 objects with 10 sub-objects each, with the fields spread among them
+    properties = {}
+    groups = 100
+    subgroups = 10
+    per_group = max(1, fields / (groups * subgroups))
+
+    n = 0
+    for g in range(groups):
+        group = properties['group%d' % g] = {'properties': {}}
+        for s in range(subgroups):
+            sub = group['properties']['sub%d' % s] = {'properties': {}}
+            for f in range(per_group):
+                sub['properties']['field%d' % n] = {'type': 'keyword'}
+                n += 1
+
+    return {'bench': {'mappings': {'doc': {'properties': properties}}}}
+
+
+def linear_complete(keywords, text):
+    # the original completion: scan all the keywords
+    return [k for k in keywords if k.startswith(text)]
+
+
+def main():
+    fields = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    calls = 200
+
+    mapping = make_mapping(fields)
+
+    start = time.time()
+    completer = Completer()
+    completer.add_indices(['bench'])
+    completer.add_mapping('bench', mapping)
+    build = time.time() - start
+
+    keywords = sorted(completer.keywords.words + [p for p, _ in field_paths(mapping['bench']['mappings']['doc'])])
+    print("fields: %d, index build: %.3fs" % (len(keywords), build))
+
+    random.seed(42)
+    prefixes = []
+    for _ in range(calls):
+        word = random.choice(keywords)
+        prefixes.append(word[:random.randint(max(1, len(word) - 4), len(word))])
+    line = "select * from bench where "
+
+    results = []
+
+    for name, complete in (('linear', lambda text: linear_complete(keywords, text)),
+                           ('prefix', lambda text: completer.complete(text, line, 'bench'))):
+        start = time.time()
+        matches = 0
+        for text in prefixes:
+            matches += len(complete(text))
+        elapsed = time.time() - start
+
+        results.append(elapsed)
+        print("%-8s %10.3f ms/completion (%d matches)" % (name, elapsed * 1000 / calls, matches))
+
+    print("speedup: %.1fx" % (results[0] / results[1]))
+
+
+if __name__ == '__main__':
+    main()
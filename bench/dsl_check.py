@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+#
+# Check the query DSL compiled from WHERE and FILTER clauses against the expected (golden) queries,
+# for all the operators and with both parser engines, and the aggregations compiled from aggregate
+# functions.
+#
+#   python bench/dsl_check.py [-v]
+#
+
+from __future__ import print_function
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'elseql'))
+
+from parser import ElseParser, Operator, query_dsl  # noqa: E402
+from rdparser import RDParser  # noqa: E402
+from search import ElseSearch  # noqa: E402
+
+# the fields that are not analyzed (compared with term queries)
+EXACT = set(['k', 'n', 'd', 'name.raw'])
+
+
+def match(field, value):
+    return {'match': {field: {'query': value, 'operator': 'and'}}}
+
+
+def must_not(*queries):
+    return {'bool': {'must_not': list(queries)}}
+
+
+def should(*queries):
+    return {'bool': {'should': list(queries), 'minimum_should_match': 1}}
+
+
+def must(*queries):
+    return {'bool': {'must': list(queries)}}
+
+
+def query_string(query, field):
+    return {'query_string': {'query': query, 'default_field': field, 'default_operator': 'AND',
+                             'analyze_wildcard': True}}
+
+
+# (where or filter clause, expected query)
+GOLDEN = [
+    # =, != and <>: term on exact fields, match on analyzed (or unknown) fields
+    ("where k = 'x'", {'term': {'k': 'x'}}),
+    ("where n = 42", {'term': {'n': 42}}),
+    ("where name.raw = 'John Smith'", {'term': {'name.raw': 'John Smith'}}),
+    ("where name = 'John Smith'", match('name', 'John Smith')),
+    ("where k != 'x'", must_not({'term': {'k': 'x'}})),
+    ("where k <> 'x'", must_not({'term': {'k': 'x'}})),
+    ("where t != 'x'", must_not(match('t', 'x'))),
+    ("where k = true", {'term': {'k': True}}),
+
+    # comparisons
+    ("where n < 10", {'range': {'n': {'lt': 10}}}),
+    ("where n <= 10", {'range': {'n': {'lte': 10}}}),
+    ("where n > 1.5", {'range': {'n': {'gt': 1.5}}}),
+    ("where n >= -3", {'range': {'n': {'gte': -3}}}),
+    ("where n LT 10", {'range': {'n': {'lt': 10}}}),
+    ("where n LTE 10", {'range': {'n': {'lte': 10}}}),
+    ("where n LE 10", {'range': {'n': {'lte': 10}}}),
+    ("where n GT 10", {'range': {'n': {'gt': 10}}}),
+    ("where n GTE 10", {'range': {'n': {'gte': 10}}}),
+    ("where n GE 10", {'range': {'n': {'gte': 10}}}),
+    ("where d between '2020-01-01' and '2020-12-31'", {'range': {'d': {'gte': '2020-01-01', 'lte': '2020-12-31'}}}),
+
+    # IN: terms on exact fields
+    ("where k in ('a', 'b', 'c')", {'terms': {'k': ['a', 'b', 'c']}}),
+    ("where n in (1, 2)", {'terms': {'n': [1, 2]}}),
+    ("where t in ('a', 'b')", should(match('t', 'a'), match('t', 'b'))),
+
+    # LIKE: wildcard on exact fields (or their not analyzed multi-field), query_string on analyzed fields
+    ("where k like 'ab%'", {'wildcard': {'k': 'ab*'}}),
+    ("where k like 'a_c%'", {'wildcard': {'k': 'a?c*'}}),
+    ("where k like 'a*b?%'", {'wildcard': {'k': 'a\\*b\\?*'}}),
+    ("where name like 'John%'", {'wildcard': {'name.raw': 'John*'}}),
+    ("where t like 'foo bar%'", query_string('foo bar*', 't')),
+    ("where t like 'a:b_(c)%'", query_string('a\\:b?\\(c\\)*', 't')),
+
+    # boolean operators (OR binds tighter than AND)
+    ("where k = 'x' and n > 1", must({'term': {'k': 'x'}}, {'range': {'n': {'gt': 1}}})),
+    ("where k = 'x' or n > 1", should({'term': {'k': 'x'}}, {'range': {'n': {'gt': 1}}})),
+    ("where k = 'x' and n = 1 or n = 2", must({'term': {'k': 'x'}}, should({'term': {'n': 1}}, {'term': {'n': 2}}))),
+    ("where not k = 'x'", must_not({'term': {'k': 'x'}})),
+    ("where not n > 1 and k = 'x'", must(must_not({'range': {'n': {'gt': 1}}}), {'term': {'k': 'x'}})),
+    ("where not (n > 1 or k = 'x')", must_not(should({'range': {'n': {'gt': 1}}}, {'term': {'k': 'x'}}))),
+
+    # Lucene query string: query_string fallback
+    ("where 'k:x AND t:y'", {'query_string': {'query': 'k:x AND t:y', 'default_operator': 'AND'}}),
+
+    # filters
+    ("filter query n > 1", {'range': {'n': {'gt': 1}}}),
+    ("filter query k = 'x' and n in (1, 2)", must({'term': {'k': 'x'}}, {'terms': {'n': [1, 2]}})),
+    ("filter query 'k:x'", {'query_string': {'query': 'k:x', 'default_operator': 'AND'}}),
+    ("filter exist k", {'exists': {'field': 'k'}}),
+    ("filter missing k", must_not({'exists': {'field': 'k'}})),
+]
+
+# (statement, expected aggregations) for ElasticSearch 6.8
+AGGS = [
+    ("select sum(x) from i", {'m0': {'sum': {'field': 'x'}}}),
+    ("select count(x) from i", {'m0': {'value_count': {'field': 'x'}}}),
+    ("select max(x) from i where k = 'a'", {'m0': {'max': {'field': 'x'}}}),
+    ("select count(*) from i", None),
+    ("select count(*), avg(x) from i", {'m0': {'avg': {'field': 'x'}}}),
+    ("select count(*) from i group by k", {'groups': {'composite': {
+        'size': 1000, 'sources': [{'g0': {'terms': {'field': 'k', 'order': 'asc'}}}]}}}),
+    ("select k, count(*) from i group by k limit 10", {'groups': {'composite': {
+        'size': 10, 'sources': [{'g0': {'terms': {'field': 'k', 'order': 'asc'}}}]}}}),
+]
+
+
+def compile_clause(parser, clause):
+    result = parser.parse("select * from i " + clause)
+
+    if clause.startswith('filter'):
+        filter = result.filter
+        if not isinstance(filter, Operator):
+            filter = filter[0]
+        return filter.dsl(EXACT)
+
+    return query_dsl(result.query, EXACT)
+
+
+def compile_aggs(parser, statement):
+    search = ElseSearch()
+    search.version, search.major, search.v5 = '6.8.0', 6, True
+    search.parser = 'rd' if parser is RDParser else 'pyparsing'
+
+    return search.build_request(search.parse(statement))['data'].get('aggs')
+
+
+def check(name, compile, parser, clause, expected, verbose):
+    try:
+        actual = compile(parser, clause)
+    except Exception as err:
+        actual = "%s: %s" % (type(err).__name__, err)
+
+    if actual != expected:
+        print("FAIL %-10s %s" % (name, clause))
+        print("  expected:", json.dumps(expected, sort_keys=True))
+        print("  actual:  ", json.dumps(actual, sort_keys=True))
+        return 1
+
+    if verbose:
+        print("ok   %-10s %s" % (name, clause))
+    return 0
+
+
+def main():
+    verbose = '-v' in sys.argv[1:]
+    errors = 0
+
+    for parser in (ElseParser, RDParser):
+        for clause, expected in GOLDEN:
+            errors += check(parser.__name__, compile_clause, parser, clause, expected, verbose)
+
+        for statement, expected in AGGS:
+            errors += check(parser.__name__, compile_aggs, parser, statement, expected, verbose)
+
+    print("%d checks, %d errors" % (2 * (len(GOLDEN) + len(AGGS)), errors))
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
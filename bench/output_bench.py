@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+#
+# Compare the per-row print() rendering of search results with the buffered CSV writer.
+#
+#   python bench/output_bench.py [rows] [columns] [output-file]
+#
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from elseql.output import CsvWriter, csval  # noqa: E402
+
+PAGE_SIZE = 1000
+
+
+def make_hits(rows, columns):
+    values = [u'simple', u'with space', u'quoted "value"', 12345, 3.14, None, u'caf\xe9']
+
+    return [{'_source': dict(('field%d' % c, values[(r + c) % len(values)]) for c in range(columns))}
+            for r in range(rows)]
+
+
+def pages(hits):
+    for i in range(0, len(hits), PAGE_SIZE):
+        yield hits[i:i + PAGE_SIZE]
+
+
+def print_rows(hits, stream):
+    # the original rendering: one print() per row
+    def csvline(l):
+        return ",".join([csval(v).encode("utf-8") for v in l])
+
+    saved, sys.stdout = sys.stdout, stream
+    try:
+        for page in pages(hits):
+            for _ in page:
+                print(csvline(_['_source'].values()))
+    finally:
+        sys.stdout = saved
+
+
+def write_rows(hits, stream):
+    out = CsvWriter(stream)
+    for page in pages(hits):
+        out.write_rows([_['_source'].values() for _ in page])
+    out.flush()
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    columns = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    path = sys.argv[3] if len(sys.argv) > 3 else os.devnull
+
+    hits = make_hits(rows, columns)
+    results = []
+
+    for name, render in (('print', print_rows), ('writer', write_rows)):
+        with open(path, 'wb') as stream:
+            start = time.time()
+            render(hits, stream)
+            elapsed = time.time() - start
+
+        results.append(elapsed)
+        print("%-8s %8.3fs %12.1f rows/s" % (name, elapsed, rows / elapsed))
+
+    print("speedup: %.1fx" % (results[0] / results[1]))
+
+
+if __name__ == '__main__':
+    main()
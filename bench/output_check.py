@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+#
+# Check the rows written by the CSV and TSV writers against the expected lines, and that the CSV lines
+# read back (with the csv module) as the same number of columns.
+#
+#   python bench/output_check.py [-v]
+#
+
+from __future__ import print_function
+
+import csv
+import os
+import sys
+
+from StringIO import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from elseql.output import CsvWriter, TsvWriter  # noqa: E402
+
+# (row, expected CSV line, expected TSV line)
+ROWS = [
+    ([u'abc', 1, None], u'abc,1,', u'abc\t1\t'),
+    ([0, 0.0, 2.5, -1], u'0,"0.0","2.5","-1"', u'0\t0.0\t2.5\t-1'),
+    ([True, False, u''], u'True,False,', u'True\tFalse\t'),
+    ([u'a b', u'x,y', u'say "hi"'], u'"a b","x,y","say ""hi"""', u'a b\tx,y\tsay "hi"'),
+    ([1, [u'x', u'y'], u'z'], u'1,"[""x"", ""y""]",z', u'1\t["x", "y"]\tz'),
+    ([[], {}, [1]], u',,"[1]"', u'[]\t{}\t[1]'),
+    ([{u'a': 1}, u'caf\xe9'], u'"{""a"": 1}",caf\xe9', u'{"a": 1}\tcaf\xe9'),
+    ([u'tab\there', u'line\nbreak'], u'"tab\there","line\nbreak"', u'tab\\there\tline\\nbreak'),
+]
+
+
+def render(writer, row):
+    stream = StringIO()
+    out = writer(stream)
+    out.write_rows([row])
+    out.flush()
+    return stream.getvalue().decode('utf-8')[:-1]
+
+
+def main():
+    verbose = '-v' in sys.argv[1:]
+    checks = errors = 0
+
+    for row, csv_line, tsv_line in ROWS:
+        for name, writer, expected in (('csv', CsvWriter, csv_line), ('tsv', TsvWriter, tsv_line)):
+            actual = render(writer, row)
+
+            checks += 1
+            if actual != expected:
+                errors += 1
+                print("FAIL %s %r" % (name, row))
+                print("  expected: %r" % expected)
+                print("  actual:   %r" % actual)
+            elif verbose:
+                print("ok   %s %r" % (name, row))
+
+        columns = list(csv.reader(StringIO(render(CsvWriter, row).encode('utf-8'))))
+
+        checks += 1
+        if len(columns) != 1 or len(columns[0]) != len(row):
+            errors += 1
+            print("FAIL columns %r: %r" % (row, columns))
+
+    print("%d checks, %d errors" % (checks, errors))
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+#
+# Check that the pyparsing and the recursive-descent parser engines produce the same
+# results on a corpus of statements, then compare their speed.
+#
+#   python bench/parser_bench.py [iterations]
+#
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from elseql.parser import ElseParser, Operator  # noqa: E402
+from elseql.rdparser import RDParser  # noqa: E402
+
+CORPUS = [
+    "select * from index",
+    "SELECT * FROM index.type",
+    "select a from i",
+    "select count(*) from i",
+    "select COUNT ( * ) from i where a = 1 filter exist b routing 'r'",
+    "select count, b from i",
+    "select a, count(*), sum(b), AVG(c.d), min(e), max(f), count(g) from i group by a",
+    "select * from i where a = 1 into outfile '/tmp/out.csv'",
+    "select a, b from i limit -1, 1000 routing 'r' into outfile 'out.ndjson.gz' FORMAT NDJSON compress GZIP",
+    "select a from i into outfile \"o.tsv\" format tsv",
+    "select a from i into outfile 'o.gz' compress gzip",
+    "select a facets b from i where c = 'x' cache 600",
+    "select a from i limit 10 routing 'r' cache 0 into outfile 'o.csv'",
+    "select a, b, count(*) from i where c = 1 filter exist d group by a, b order by a desc limit 100",
+    "select sum(x), summary, maxed from i",
+    "select a,b,c.d from i where a = 1",
+    "select a facets b,c from i",
+    "select a script s = 'doc[\"x\"].value * 2' from i",
+    "select * from i where 'a:1 AND b:[1 TO 5]'",
+    "select * from i where a != 'x y'",
+    "select * from i where a > 1 and b >= 2.5 and c < -3 and d <= .5 and e <> 1",
+    "select * from i where a gt 1 and b gte 2 and c lt 3 and d lte 4 and e le 5 and f ge 6",
+    "select * from i where a = true or b = False",
+    "select * from i where a in (1, 2.5, 'x', \"y\", true)",
+    "select * from i where a between 1 and 10",
+    "select * from i where a between 'a' and 'z' and b = 1",
+    "select * from i where a like 'abc%'",
+    "select * from i where a like '*x%'",
+    "select * from i where not a = 1",
+    "select * from i where not not a = 1",
+    "select * from i where a = 1 and b = 2 or c = 3",
+    "select * from i where a = 1 or b = 2 and c = 3 or not d = 4",
+    "select * from i where a = 1 and not b in (1,2,3) or c like 'x%' and d between 1 and 2",
+    "select * from i where not (a = 1 or b = 2)",
+    "select * from i where (a = 1 and b = 2) or c = 3",
+    "select * from i where not (a = 1 and not (b = 2 or c in (1, 2)))",
+    "select * from i where ((a = 1))",
+    "select * from i filter exist a",
+    "select * from i filter missing a.b",
+    "select * from i filter query a = 1 and b = 2",
+    "select * from i filter query 'a:1'",
+    "select * from i order by a",
+    "select * from i order by a desc, b ASC, c",
+    "select * from i limit 10",
+    "select * from i limit 5, 10",
+    "select * from i limit -1, 100",
+    "select * from i routing 'r1'",
+    "select a,b facets c script s = 'x' from i.t where a = 1 filter exist b order by a desc limit 1,2 routing 'r'",
+    "select * from i where a = 1 and " + " and ".join("f%d = %d" % (n, n) for n in range(50)),
+    "select * from i where a = 1 or " + " or ".join("f%d = 'v%d'" % (n, n) for n in range(50)),
+    "select * from i where a in (%s)" % ", ".join(str(n) for n in range(500)),
+    "select a.x, b.y from a join b on a.k = b.k",
+    "select o.id, c.name from orders o inner join customers as c on o.customer = c._id where o.total > 10 limit 5",
+    "select * from i.t x JOIN j y ON x.a.b = y.c where x.d = 1 and y.e in (1, 2) into outfile 'j.csv'",
+    "select * from i as x where x = 1",
+    "select distinct a, b.c from i limit -1, 1000",
+    "SELECT Distinct * from i order by a desc, b limit -1, 100",
+]
+
+# (where clause, query_string query) for both parsers
+QUERY_STRINGS = [
+    ("a = 1", "a:1"),
+    ("not a = 1", "NOT a:1"),
+    ("not not a = 1", "NOT (NOT a:1)"),
+    ("not (a = 1 or b = 2)", "NOT (a:1 OR b:2)"),
+    ("not a = 1 or b = 2", "(NOT a:1) OR b:2"),
+    ("(a = 1 and b = 2) or c = 3", "(a:1 AND b:2) OR c:3"),
+    ("a = 1 and b = 2 or c = 3", "a:1 AND (b:2 OR c:3)"),
+    ("a = 1 and (b = 2 and c = 3)", "a:1 AND (b:2 AND c:3)"),
+    ("not (a = 1 and not (b = 2 or c in (1, 2)))", "NOT (a:1 AND (NOT (b:2 OR c:(1 OR 2))))"),
+    ("a != 1 or b between 1 and 2", "NOT (a:1) OR b:[1 TO 2]"),
+]
+
+INVALID = [
+    "",
+    "select",
+    "select * from",
+    "select * index",
+    "select sum(*) from",
+    "select a from i group by",
+    "select a from i into outfile",
+    "select a from i into outfile 'x' format xml",
+    "select a from i into outfile 'x' compress zip",
+    "select a from i into 'x'",
+    "select a from i cache",
+    "select a from i cache '10'",
+    "select * from i where",
+    "select * from i where a",
+    "select * from i where a = ",
+    "select * from i limit",
+    "select * from i limit 1,",
+    "select * from i routing r",
+    "select * from i where a = 1 junk",
+    "select * from i where (a = 1",
+    "select * from i where (a = 1))",
+    "select * from i where ()",
+    "select * from i where not (a)",
+    "select * from i join j",
+    "select * from i join j on a = ",
+    "select * from i join j on a.b",
+    "select * from i as",
+    "select * from i as where a = 1",
+    "select * from i x.y",
+    "select distinct from i",
+]
+
+
+def normalize(result):
+    def strval(x):
+        return str(x) if isinstance(x, Operator) else x
+
+    def aslist(x):
+        return [aslist(v) for v in x] if hasattr(x, '__iter__') else x
+
+    fields = aslist(result.fields)
+    if len(fields) == 1 and isinstance(fields[0], list):
+        fields = fields[0]
+
+    filter = result.filter
+    if filter and not isinstance(filter, Operator):
+        filter = filter[0]
+
+    return {
+        'distinct': bool(result.distinct),
+        'fields': fields,
+        'facets': aslist(result.facets),
+        'script': aslist(result.script),
+        'index': result.index,
+        'alias': result.alias,
+        'join_index': result.join_index,
+        'join_alias': result.join_alias,
+        'join_on': aslist(result.join_on),
+        'query': strval(result.query),
+        'query_tree': repr(result.query),
+        'filter': (filter.name, str(filter)) if filter else '',
+        'groupby': aslist(result.groupby),
+        'order': aslist(result.order),
+        'limit': aslist(result.limit),
+        'routing': result.routing,
+        'cache': result.cache,
+        'outfile': result.outfile,
+        'format': result.format,
+        'compress': result.compress,
+    }
+
+
+def check_parity():
+    errors = 0
+
+    for stmt in CORPUS:
+        expected = normalize(ElseParser.parse(stmt))
+        actual = normalize(RDParser.parse(stmt))
+
+        if expected != actual:
+            errors += 1
+            print("MISMATCH:", stmt)
+            for k in sorted(expected):
+                if expected[k] != actual[k]:
+                    print("  %s: pyparsing=%r rd=%r" % (k, expected[k], actual[k]))
+
+    for clause, expected in QUERY_STRINGS:
+        for parser in (ElseParser, RDParser):
+            actual = str(parser.parse("select * from i where " + clause).query)
+            if actual != expected:
+                errors += 1
+                print("QUERY STRING:", parser.__name__, clause)
+                print("  expected=%r actual=%r" % (expected, actual))
+
+    for stmt in INVALID:
+        for parser in (ElseParser, RDParser):
+            try:
+                parser.parse(stmt)
+            except Exception:
+                continue
+
+            errors += 1
+            print("NO ERROR:", parser.__name__, repr(stmt))
+
+    print("parity: %d statements, %d query strings, %d invalid, %d errors" % (len(CORPUS), len(QUERY_STRINGS),
+                                                                            len(INVALID), errors))
+    return errors == 0
+
+
+def bench(parser, iterations):
+    start = time.time()
+    for _ in range(iterations):
+        for stmt in CORPUS:
+            parser.parse(stmt)
+    return time.time() - start
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    if not check_parity():
+        return 1
+
+    count = iterations * len(CORPUS)
+    results = []
+
+    for parser in (ElseParser, RDParser):
+        elapsed = bench(parser, iterations)
+        results.append(elapsed)
+        print("%-12s %8.3fs %10.1f statements/s" % (parser.__name__, elapsed, count / elapsed))
+
+    print("speedup: %.1fx" % (results[0] / results[1]))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
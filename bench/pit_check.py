@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+#
+# Check that deep-paged (search_after) queries return the same rows with and without a point in time, against
+# a stub ElasticSearch server (bench/stubes.py) before and after 7.12, that ROUTING reaches the _pit request
+# (or every page, before 7.12) and that the points in time are closed.
+#
+#   python bench/pit_check.py [--docs=5000] [-v]
+#
+
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+
+from StringIO import StringIO
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'elseql'))
+sys.path.insert(0, BENCH_DIR)
+
+import stubes  # noqa: E402
+from search import ElseSearch  # noqa: E402
+
+VERSIONS = ['7.10.0', '7.17.0', '8.11.0']
+
+STATEMENT = "select _id, field0, field1 from test order by field0 limit 10, 2500"
+
+
+def export(search, path, statement):
+    """
+    Run statement, return (status, output lines)
+    """
+    search.output = path
+
+    stdout, sys.stdout = sys.stdout, StringIO()
+    try:
+        status = search.search(statement)
+    finally:
+        sys.stdout = stdout
+
+    with open(path) as f:
+        return status, f.read().splitlines()
+
+
+def main():
+    docs = 5000
+    verbose = False
+
+    for arg in sys.argv[1:]:
+        if arg == '-v':
+            verbose = True
+        elif arg.startswith('--docs='):
+            docs = int(arg[7:])
+        else:
+            print("invalid argument", arg)
+            return 2
+
+    checks = errors = 0
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, 'export.csv')
+    expected = None
+
+    def check(name, ok, detail=''):
+        if not ok:
+            print("FAIL", name, detail)
+        elif verbose:
+            print("ok  ", name)
+        return 0 if ok else 1
+
+    try:
+        for version in VERSIONS:
+            server = stubes.start(docs=docs, width=5, version=version)
+            stub = server.stub
+            search = ElseSearch('localhost:%d' % server.port, mappings=False)
+            pit = search.has_pit()
+
+            try:
+                for routing in ('', " routing 'r1'"):
+                    status, lines = export(search, path, STATEMENT + routing)
+                    expected = expected or lines
+
+                    checks += 1
+                    errors += check("%s%s" % (version, routing), status is None and lines == expected,
+                                    "(status %s, %d rows)" % (status, len(lines) - 1))
+
+                routed = [p.get('routing') for p in stub.pit_params[1:]]
+                searches = stub.requests.get('search/routed', 0)
+
+                checks += 1
+                if pit:
+                    errors += check("%s routing in _pit" % version, routed == ['r1'] and not searches,
+                                    "(_pit routing %s, %d routed searches)" % (routed, searches))
+                else:
+                    errors += check("%s routing in every page" % version, not routed and searches == 3,
+                                    "(%d routed searches)" % searches)
+
+                checks += 1
+                errors += check("%s points in time closed" % version, not stub.pits,
+                                "(%d left)" % len(stub.pits))
+            finally:
+                server.stop()
+    finally:
+        shutil.rmtree(tmp)
+
+    print("%d checks, %d errors" % (checks, errors))
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
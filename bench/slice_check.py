@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+#
+# Check that sliced scrolls ("set slices n") return the same rows as the sequential scroll, against
+# a stub ElasticSearch server (bench/stubes.py) for each version, and that a slice failing halfway
+# (with an error response, or a broken connection) fails the query instead of truncating the export.
+#
+#   python bench/slice_check.py [--docs=5000] [-v]
+#
+
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from StringIO import StringIO
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'elseql'))
+sys.path.insert(0, BENCH_DIR)
+
+import stubes  # noqa: E402
+from search import ElseSearch  # noqa: E402
+
+VERSIONS = ['5.6.0', '6.8.0', '7.10.0']
+SLICES = [2, 3, 8]
+
+STATEMENT = "select _id, field0, field1 from test limit -1, 100"
+
+
+def export(search, path, slices):
+    """
+    Run STATEMENT with {slices} slices, return (status, output lines, printed text)
+    """
+    search.slices = slices
+    search.output = path
+
+    stdout, sys.stdout = sys.stdout, StringIO()
+    try:
+        status = search.search(STATEMENT)
+    finally:
+        printed, sys.stdout = sys.stdout.getvalue(), stdout
+
+    with open(path) as f:
+        return status, f.read().splitlines(), printed
+
+
+def open_scrolls(stub, wait=2.0):
+    # the slices still fetching a page when the query stops clear their scroll after the request
+    deadline = time.time() + wait
+    while stub.scrolls and time.time() < deadline:
+        time.sleep(0.05)
+    return len(stub.scrolls)
+
+
+def fail_scroll(stub, after, broken):
+    """
+    Make the scroll request number {after} fail: the scroll context is lost (an error response)
+    or the connection is closed without a response
+    """
+    scroll = stub.scroll
+    calls = [0]
+
+    def failing(params, body):
+        calls[0] += 1
+        if calls[0] == after:
+            if broken:
+                raise Exception("connection closed")
+            stub.scrolls.pop(body.get('scroll_id', params.get('scroll_id')), None)
+        return scroll(params, body)
+
+    stub.scroll = failing
+    return scroll
+
+
+def main():
+    docs = 5000
+    verbose = False
+
+    for arg in sys.argv[1:]:
+        if arg == '-v':
+            verbose = True
+        elif arg.startswith('--docs='):
+            docs = int(arg[7:])
+        else:
+            print("invalid argument", arg)
+            return 2
+
+    checks = errors = 0
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, 'export.csv')
+
+    def check(name, ok, detail=''):
+        if not ok:
+            print("FAIL", name, detail)
+        elif verbose:
+            print("ok  ", name)
+        return 0 if ok else 1
+
+    try:
+        for version in VERSIONS:
+            server = stubes.start(docs=docs, width=5, version=version)
+            search = ElseSearch('localhost:%d' % server.port, mappings=False)
+
+            try:
+                status, lines, _ = export(search, path, 1)
+                header, expected = lines[0], sorted(lines[1:-2])
+
+                checks += 1
+                errors += check("%s sequential" % version, status is None and len(expected) == docs,
+                                "(status %s, %d rows)" % (status, len(expected)))
+
+                for slices in SLICES:
+                    status, lines, _ = export(search, path, slices)
+                    left = open_scrolls(server.stub)
+
+                    checks += 1
+                    errors += check("%s slices=%d" % (version, slices),
+                                    status is None and lines[0] == header and sorted(lines[1:-2]) == expected
+                                    and lines[-1] == "total:  %d" % docs and not left,
+                                    "(status %s, %d rows, %d scrolls left)" % (status, len(lines) - 3, left))
+
+                for broken in (False, True):
+                    scroll = fail_scroll(server.stub, 5, broken)
+                    try:
+                        status, lines, printed = export(search, path, 4)
+                    finally:
+                        server.stub.scroll = scroll
+
+                    left = open_scrolls(server.stub)
+
+                    checks += 1
+                    errors += check("%s failed slice (%s)" % (version, "connection" if broken else "error"),
+                                    status == 1 and 'ERROR' in printed and not lines[-1].startswith('total:')
+                                    and not left, "(status %s, %d scrolls left)" % (status, left))
+            finally:
+                server.stop()
+    finally:
+        shutil.rmtree(tmp)
+
+    print("%d checks, %d errors" % (checks, errors))
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+#
+# Compare the wall clock time of running a single statement with the one-shot mode (elseql -e) and
+# by piping it to the interactive shell, against a stub ElasticSearch server (bench/stubes.py).
+#
+#   python bench/startup_bench.py [--runs=10] [--version=6.8.0]
+#
+# Each run is a new process (with a warm mapping cache in a temporary HOME); the interpreter
+# startup alone is reported as a baseline.
+#
+
+from __future__ import print_function
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ELSEQL_DIR = os.path.join(BENCH_DIR, '..', 'elseql')
+
+sys.path.insert(0, BENCH_DIR)
+
+from suite import start_stub  # noqa: E402
+
+OPTIONS = {'runs': '10', 'version': '6.8.0'}
+
+STATEMENT = "select field0, field1 from test where field1 = 'value 1' limit 10"
+
+
+def run(args, stdin, expect, env):
+    start = time.time()
+
+    process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env)
+    output, _ = process.communicate(stdin)
+
+    if process.returncode or expect not in output or 'Traceback' in output:
+        raise Exception("%s failed:\n%s" % (' '.join(args), output))
+
+    return time.time() - start
+
+
+def main():
+    options = dict(OPTIONS)
+
+    for arg in sys.argv[1:]:
+        k, _, v = arg.lstrip('-').partition('=')
+        if k not in options:
+            print("invalid argument", arg)
+            return 2
+        options[k] = v
+
+    runs = int(options['runs'])
+    home = tempfile.mkdtemp()
+    env = dict(os.environ, HOME=home)
+
+    process, port = start_stub(1000, 10, options['version'], 0)
+    host = '--port=localhost:%d' % port
+
+    cli = [sys.executable, os.path.join(ELSEQL_DIR, 'cli.py'), host]
+
+    # (name, command, stdin, expected output)
+    modes = [
+        ('python', [sys.executable, '-c', 'pass'], None, ''),
+        ('one-shot', cli + ['-e', STATEMENT], None, 'total:'),
+        ('one-shot (rd)', cli + ['--parser=rd', '-e', STATEMENT], None, 'total:'),
+        ('shell', cli, STATEMENT + '\n', 'total:'),
+    ]
+
+    try:
+        results = {}
+
+        for name, args, stdin, expect in modes:
+            run(args, stdin, expect, env)  # warm up (and the mapping cache)
+
+            times = sorted(run(args, stdin, expect, env) for _ in range(runs))
+            results[name] = times[len(times) / 2]
+
+            print("%-14s min %8.1f ms   median %8.1f ms" % (name, times[0] * 1000, results[name] * 1000))
+
+        print("one-shot is %.1fx faster than the shell (%.1f ms less)" % (
+            results['shell'] / results['one-shot'], (results['shell'] - results['one-shot']) * 1000))
+    finally:
+        process.kill()
+        process.wait()
+        shutil.rmtree(home)
+
+
+if __name__ == '__main__':
+    main()
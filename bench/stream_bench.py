@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+#
+# Compare the peak memory (RSS) and time of decoding a large search response at once (json.loads)
+# with the incremental decoding of the hits (jsonstream), rendering the results to /dev/null.
+#
+#   python bench/stream_bench.py [hits] [source-size]
+#
+# Each mode runs in its own process, reading a canned response from a temporary file in 64KB chunks.
+#
+
+from __future__ import print_function
+
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from elseql.output import CsvWriter  # noqa: E402
+from elseql.jsonstream import stream_response  # noqa: E402
+
+CHUNK_SIZE = 64 * 1024
+
+
+def make_response(path, hits, size):
+    text = u'lorem ipsum dolor sit amet caf\xe9 ' * (size / 64 + 1)
+
+    with open(path, 'wb') as f:
+        f.write('{"took":10,"timed_out":false,"_shards":{"total":5,"successful":5,"failed":0},')
+        f.write('"hits":{"total":%d,"max_score":1.0,"hits":[' % hits)
+
+        for n in range(hits):
+            source = {'id': n, 'name': 'document %d' % n, 'price': n * 0.5, 'tags': ['a', 'b', 'c'],
+                      'text': text[n % 64:n % 64 + size / 2], 'body': text[:size / 2]}
+            hit = {'_index': 'test', '_type': 'doc', '_id': str(n), '_score': 1.0, '_source': source}
+            f.write((',' if n else '') + json.dumps(hit))
+
+        f.write(']}}')
+
+
+def chunks(path):
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+def render(batches):
+    with open(os.devnull, 'wb') as stream:
+        out = CsvWriter(stream)
+        for batch in batches:
+            out.write_rows([_['_source'].values() for _ in batch])
+        out.flush()
+
+
+def run(mode, path):
+    if mode == 'loads':
+        result = json.loads(''.join(chunks(path)))
+        render([result['hits']['hits']])
+    else:
+        result = stream_response(chunks(path))
+        render(result['hits']['hits'].batches())
+
+
+def peak_rss():
+    # KB on Linux, bytes on OS X
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 if sys.platform == 'darwin' else rss
+
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == '--run':
+        base = peak_rss()
+        start = time.time()
+        run(sys.argv[2], sys.argv[3])
+        print(json.dumps({'time': time.time() - start, 'rss': peak_rss() - base}))
+        return
+
+    hits = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 4096
+
+    fd, path = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+
+    try:
+        make_response(path, hits, size)
+        print("response: %d hits, %.1f MB" % (hits, os.path.getsize(path) / 1048576.0))
+
+        results = {}
+        for mode in ('loads', 'stream'):
+            output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--run', mode, path])
+            results[mode] = json.loads(output)
+            print("%-8s %8.3fs   peak RSS +%8.1f MB" % (mode, results[mode]['time'], results[mode]['rss'] / 1024.0))
+
+        print("memory: %.1fx less" % (float(results['loads']['rss']) / max(results['stream']['rss'], 1)))
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,555 @@
+#!/usr/bin/env python
+#
+# A fake ElasticSearch HTTP server, replaying canned responses for elseql testing and benchmarks.
+#
+#   python bench/stubes.py [--port=9200] [--docs=10000] [--width=10] [--version=5.6.0] [--delay=0] [--nodes=1]
+#                          [--queries=1]
+#
+# The index is called "test" (with a single type "doc") and contains {docs} documents,
+# each one with {width} fields (field0 ... field{width-1}).
+#
+# Search queries are ignored (all the documents match), unless --queries=1: then match_all, term,
+# terms, match, range, ids, exists and bool queries are evaluated (any other query matches all documents).
+#
+# With --nodes=n the cluster has n HTTP nodes (on consecutive ports, or random ports with --port=0),
+# sharing the same state (i.e. a scroll can continue on any node) and listed by _nodes/http.
+#
+
+from __future__ import print_function
+
+import gzip
+import io
+import json
+import socket
+import sys
+import threading
+import time
+
+from collections import OrderedDict
+
+try:  # for Python 3
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+INDEX = 'test'
+DOCTYPE = 'doc'
+MAX_RESULT_WINDOW = 10000
+
+
+def with_scroll_id(result, scroll_id):
+    # like ElasticSearch, _scroll_id is the first key of the response
+    return OrderedDict([('_scroll_id', scroll_id)] + list(result.items()))
+
+
+class StubES(object):
+    """
+    The fake cluster state: documents, open scroll contexts and points in time, and request counters
+    """
+
+    def __init__(self, docs=10000, width=10, version='5.6.0', delay=0, queries=False):
+        self.docs = docs
+        self.queries = queries
+        self.width = width
+        self.version = version
+        self.major = int(version.split('.')[0])
+        self.minor = int(version.split('.')[1])
+        self.delay = delay
+
+        self.lock = threading.Lock()
+        self.scrolls = {}
+        self.next_scroll = 0
+        self.pits = set()
+        self.next_pit = 0
+        self.pit_params = []  # the parameters of the _pit requests
+        self.requests = {}
+        self.nodes = []  # the ports of the HTTP nodes
+
+    def count(self, name):
+        with self.lock:
+            self.requests[name] = self.requests.get(name, 0) + 1
+
+    def source(self, n):
+        doc = {}
+        for f in range(self.width):
+            if f % 3 == 0:
+                doc['field%d' % f] = n * self.width + f
+            elif f % 3 == 1:
+                doc['field%d' % f] = 'value %d' % (n % 100)
+            else:
+                doc['field%d' % f] = 'v%d' % f
+        return doc
+
+    def matches(self, query, n, doc=None):
+        if doc is None:
+            doc = dict(self.source(n), _id=str(n))
+
+        kind, q = list(query.items())[0]
+
+        def same(a, b):
+            return a == b or u'%s' % a == u'%s' % b
+
+        if kind == 'match_all':
+            return True
+
+        if kind == 'bool':
+            clauses = lambda k: q.get(k) if isinstance(q.get(k), list) else [q[k]] if k in q else []
+            return (all(self.matches(c, n, doc) for c in clauses('must') + clauses('filter')) and
+                    not any(self.matches(c, n, doc) for c in clauses('must_not')) and
+                    (not clauses('should') or any(self.matches(c, n, doc) for c in clauses('should'))))
+
+        if kind == 'ids':
+            return doc['_id'] in q['values']
+
+        if kind == 'exists':
+            return q['field'] in doc
+
+        field, value = list(q.items())[0]
+
+        if kind in ('term', 'match'):
+            return same(doc.get(field), value.get('value', value.get('query')) if isinstance(value, dict) else value)
+
+        if kind == 'terms':
+            return any(same(doc.get(field), v) for v in value)
+
+        if kind == 'range':
+            v = doc.get(field)
+            return v is not None and all({'gt': v > b, 'gte': v >= b, 'lt': v < b, 'lte': v <= b}.get(op, True)
+                                         for op, b in value.items())
+
+        return True
+
+    def search_ids(self, body):
+        # the documents matching the query of a request
+        query = body.get('query')
+        if not self.queries or not query or 'match_all' in query:
+            return list(range(self.docs))
+        return [n for n in range(self.docs) if self.matches(query, n)]
+
+    def hit(self, n, body=None):
+        hit = {'_index': INDEX, '_type': DOCTYPE, '_id': str(n), '_score': 1.0}
+        source = self.source(n)
+        includes = (body or {}).get('_source', True)
+
+        if includes is True:
+            hit['_source'] = source
+        elif includes:
+            hit['_source'] = dict((k, v) for k, v in source.items() if k in includes)
+
+        docvalues = [f['field'] if isinstance(f, dict) else f for f in (body or {}).get('docvalue_fields', [])]
+        if docvalues:
+            hit['fields'] = dict((f, [source[f]]) for f in docvalues if f in source)
+
+        return hit
+
+    def total(self, value):
+        if self.major >= 7:
+            return {'value': value, 'relation': 'eq'}
+        return value
+
+    def page(self, ids, body=None, took=1):
+        return {'took': took, 'timed_out': False,
+                '_shards': {'total': 1, 'successful': 1, 'failed': 0},
+                'hits': {'total': self.total(len(ids)), 'max_score': 1.0, 'hits': [self.hit(n, body) for n in ids]}}
+
+    def mapping(self):
+        properties = {}
+        for f in range(self.width):
+            properties['field%d' % f] = {'type': 'long' if f % 3 == 0 else 'keyword'}
+
+        if self.major >= 7:
+            return {INDEX: {'mappings': {'properties': properties}}}
+        return {INDEX: {'mappings': {DOCTYPE: {'properties': properties}}}}
+
+    def metric(self, kind, field, ids):
+        values = [self.source(n).get(field) for n in ids]
+        values = [v for v in values if v is not None]
+
+        if kind == 'value_count':
+            return {'value': len(values)}
+        if not values:
+            return {'value': None}
+        if kind == 'sum':
+            return {'value': float(sum(values))}
+        if kind == 'avg':
+            return {'value': float(sum(values)) / len(values)}
+        return {'value': float(min(values) if kind == 'min' else max(values))}
+
+    def aggregate(self, aggs, ids):
+        """
+        Compute the (terms, composite and metric) aggregations over the documents ids
+        """
+        result = {}
+
+        for name, agg in aggs.items():
+            sub = agg.get('aggs', agg.get('aggregations', {}))
+
+            if 'terms' in agg:
+                field = agg['terms']['field']
+                groups = {}
+                for n in ids:
+                    groups.setdefault(self.source(n).get(field), []).append(n)
+
+                keys = sorted(k for k in groups if k is not None)
+                if list(agg['terms'].get('order', {}).values()) == ['desc']:
+                    keys.reverse()
+
+                buckets = []
+                for k in keys[:agg['terms'].get('size', 10)]:
+                    bucket = {'key': k, 'doc_count': len(groups[k])}
+                    bucket.update(self.aggregate(sub, groups[k]))
+                    buckets.append(bucket)
+
+                result[name] = {'doc_count_error_upper_bound': 0, 'sum_other_doc_count': 0, 'buckets': buckets}
+
+            elif 'composite' in agg:
+                sources = [list(source.items())[0] for source in agg['composite']['sources']]
+                groups = {}
+                for n in ids:
+                    doc = self.source(n)
+                    groups.setdefault(tuple(doc.get(s['terms']['field']) for _, s in sources), []).append(n)
+
+                # sort by each source (stable sorts, from the last source to the first)
+                keys = [k for k in groups if None not in k]
+                for i in reversed(range(len(sources))):
+                    keys.sort(key=lambda k: k[i], reverse=sources[i][1]['terms'].get('order', 'asc') == 'desc')
+
+                after = agg['composite'].get('after')
+                if after:
+                    after = tuple(after[sname] for sname, _ in sources)
+                    keys = keys[keys.index(after) + 1:] if after in keys else []
+
+                buckets = []
+                for k in keys[:agg['composite'].get('size', 10)]:
+                    bucket = {'key': dict((sname, v) for (sname, _), v in zip(sources, k)), 'doc_count': len(groups[k])}
+                    bucket.update(self.aggregate(sub, groups[k]))
+                    buckets.append(bucket)
+
+                result[name] = {'buckets': buckets}
+                if buckets:
+                    result[name]['after_key'] = buckets[-1]['key']
+
+            else:
+                kind, spec = list(agg.items())[0]
+                result[name] = self.metric(kind, spec['field'], ids)
+
+        return result
+
+    def profile(self, body):
+        query = {'type': 'BooleanQuery', 'description': json.dumps(body.get('query')), 'time_in_nanos': 120000,
+                 'breakdown': {}, 'children': [{'type': 'TermQuery', 'description': 'field1:value', 'time_in_nanos': 80000,
+                                                'breakdown': {}}]}
+        collector = {'name': 'CancellableCollector', 'reason': 'search_cancelled', 'time_in_nanos': 30000,
+                     'children': [{'name': 'SimpleTopScoreDocCollector', 'reason': 'search_top_hits',
+                                   'time_in_nanos': 20000}]}
+
+        return {'shards': [{'id': '[stub][%s][%d]' % (INDEX, n),
+                            'searches': [{'query': [query], 'rewrite_time': 5000, 'collector': [collector]}],
+                            'aggregations': []} for n in range(2)]}
+
+    def search(self, params, body):
+        size = int(body.get('size', params.get('size', 10)))
+        start = int(body.get('from', params.get('from', 0)))
+
+        if 'pit' in body and ('routing' in params or 'preference' in params):
+            return 400, {'error': {'type': 'action_request_validation_exception',
+                                   'reason': '[routing] cannot be used with point in time'}, 'status': 400}
+
+        if 'routing' in params:
+            self.count('search/routed')
+
+        ids = self.search_ids(body)
+
+        if 'slice' in body:
+            sid, smax = body['slice']['id'], body['slice']['max']
+            ids = [n for n in ids if n % smax == sid]
+
+        if 'aggs' in body or 'aggregations' in body:
+            self.count('search/aggs')
+            result = self.page(ids[:size])
+            result['hits']['total'] = self.total(len(ids))
+            result['aggregations'] = self.aggregate(body.get('aggs', body.get('aggregations')), ids)
+            return 200, result
+
+        if 'scroll' in params:
+            self.count('search/scroll')
+            with self.lock:
+                self.next_scroll += 1
+                scroll_id = 'scroll-%d' % self.next_scroll
+                self.scrolls[scroll_id] = (ids, size, size, body)
+
+            result = self.page(ids[:size], body)
+            result['hits']['total'] = self.total(len(ids))
+            return 200, with_scroll_id(result, scroll_id)
+
+        self.count('search')
+
+        if start + size > MAX_RESULT_WINDOW:
+            return 400, {'error': {'type': 'query_phase_execution_exception',
+                                   'reason': 'Result window is too large, from + size must be less than or equal '
+                                             'to: [%d] but was [%d].' % (MAX_RESULT_WINDOW, start + size)},
+                         'status': 400}
+
+        sort = [s for s in body.get('sort', []) if s != '_doc']
+        total = len(ids)
+
+        if sort and 'search_after' in body:
+            # documents are always sorted by their number (the first sort value)
+            after = body['search_after'][0]
+            ids = [n for n in ids if n > after]
+
+        result = self.page(ids[start:start + size], body)
+
+        if body.get('profile'):
+            result['profile'] = self.profile(body)
+
+        if 'pit' in body:
+            if body['pit'].get('id') not in self.pits:
+                return 404, {'error': {'type': 'search_context_missing_exception',
+                                       'reason': 'No search context found for id [%s]' % body['pit'].get('id')},
+                             'status': 404}
+            result['pit_id'] = body['pit']['id']
+
+        if sort:
+            for hit in result['hits']['hits']:
+                n = int(hit['_id'])
+                hit['sort'] = [n] + [hit['_id']] * (len(sort) - 1)
+                if 'pit' in body:
+                    hit['sort'].append(n)  # _shard_doc
+
+        result['hits']['total'] = self.total(total)
+        return 200, result
+
+    def point_in_time(self, method, params, body):
+        if (self.major, self.minor) < (7, 12):
+            return 400, {'error': {'type': 'illegal_argument_exception', 'reason': 'unrecognized endpoint _pit'},
+                         'status': 400}
+
+        self.count('pit')
+        with self.lock:
+            if method == 'DELETE':
+                freed = 1 if body.get('id') in self.pits else 0
+                self.pits.discard(body.get('id'))
+                return 200, {'succeeded': True, 'num_freed': freed}
+
+            self.next_pit += 1
+            pit_id = 'pit-%d' % self.next_pit
+            self.pits.add(pit_id)
+            self.pit_params.append(params)
+
+        return 200, {'id': pit_id}
+
+    def scroll(self, params, body):
+        self.count('scroll')
+        scroll_id = body.get('scroll_id', params.get('scroll_id'))
+
+        with self.lock:
+            if scroll_id not in self.scrolls:
+                return 404, {'error': 'search_context_missing_exception', 'status': 404}
+
+            ids, size, pos, search = self.scrolls[scroll_id]
+            self.scrolls[scroll_id] = (ids, size, pos + size, search)
+
+        result = self.page(ids[pos:pos + size], search)
+        result['hits']['total'] = self.total(len(ids))
+        return 200, with_scroll_id(result, scroll_id)
+
+    def clear_scroll(self, params, body):
+        self.count('clear_scroll')
+        scroll_ids = body.get('scroll_id', params.get('scroll_id', ''))
+        if not isinstance(scroll_ids, list):
+            scroll_ids = scroll_ids.split(',')
+
+        freed = 0
+        with self.lock:
+            for scroll_id in scroll_ids:
+                if self.scrolls.pop(scroll_id, None):
+                    freed += 1
+
+        return 200, {'succeeded': True, 'num_freed': freed}
+
+    def handle(self, method, path, params, body):
+        if self.delay:
+            time.sleep(self.delay)
+
+        parts = [p for p in path.split('/') if p]
+
+        if not parts:
+            self.count('info')
+            return 200, {'name': 'stub', 'version': {'number': self.version}}
+
+        if parts[-1] == '_mapping':
+            self.count('mapping')
+            return 200, self.mapping()
+
+        if parts == ['_nodes', 'http']:
+            self.count('nodes')
+            return 200, {'cluster_name': 'stub', 'nodes': dict(
+                ('node%d' % n, {'name': 'node%d' % n, 'http': {'publish_address': 'localhost/127.0.0.1:%d' % port}})
+                for n, port in enumerate(self.nodes))}
+
+        if parts == ['_aliases']:
+            self.count('aliases')
+            return 200, {INDEX: {'aliases': {}}}
+
+        if parts == ['_cluster', 'state', 'version']:
+            self.count('cluster_state')
+            return 200, {'cluster_name': 'stub', 'version': 1, 'state_uuid': 'stub'}
+
+        if parts[:2] == ['_search', 'scroll']:
+            if method == 'DELETE':
+                return self.clear_scroll(params, body)
+            return self.scroll(params, body)
+
+        if parts[-1] == '_search':
+            return self.search(params, body)
+
+        if parts[-1] == '_pit':
+            return self.point_in_time(method, params, body)
+
+        if parts[-1] == '_count':
+            self.count('count')
+            return 200, {'count': len(self.search_ids(body)), '_shards': {'total': 1, 'successful': 1, 'failed': 0}}
+
+        if parts[-1] == '_msearch':
+            self.count('msearch')
+            responses = []
+            for i in range(0, len(body), 2):
+                status, result = self.search({}, body[i + 1])
+                result['status'] = status
+                responses.append(result)
+            return 200, {'took': 1, 'responses': responses}
+
+        return 404, {'error': 'no handler for %s %s' % (method, path), 'status': 404}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.connections.add(self.connection)
+
+    def finish(self):
+        self.server.connections.discard(self.connection)
+        BaseHTTPRequestHandler.finish(self)
+
+    def do_request(self, method):
+        self.server.served += 1
+
+        url = urlparse(self.path)
+        params = dict((k, v[-1]) for k, v in parse_qs(url.query).items())
+
+        length = int(self.headers.get('content-length') or 0)
+        body = self.rfile.read(length) if length else b''
+
+        if self.headers.get('content-encoding') == 'gzip':
+            body = gzip.GzipFile(fileobj=io.BytesIO(body)).read()
+
+        if url.path.endswith('/_msearch'):
+            body = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            body = json.loads(body) if body.strip() else {}
+
+        status, result = self.server.stub.handle(method, url.path, params, body)
+
+        response = json.dumps(result).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+
+        if 'gzip' in (self.headers.get('accept-encoding') or ''):
+            buf = io.BytesIO()
+            with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+                f.write(response)
+            response = buf.getvalue()
+            self.send_header('Content-Encoding', 'gzip')
+
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def do_GET(self):
+        self.do_request('GET')
+
+    def do_POST(self):
+        self.do_request('POST')
+
+    def do_DELETE(self):
+        self.do_request('DELETE')
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def handle_error(self, request, client_address):
+        pass  # i.e. client disconnected
+
+    def stop(self):
+        """
+        Stop the node: close the listening socket and the open (keep-alive) connections
+        """
+        self.shutdown()
+        self.server_close()
+
+        for connection in list(self.connections):
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+
+def start(port=0, cluster=None, **kwargs):
+    """
+    Start a stub server in a background thread and return it (server.port is the listening port).
+    If cluster (another stub server) is given, the new server is a node of the same cluster
+    """
+    server = StubServer(('localhost', port), StubHandler)
+    server.stub = cluster.stub if cluster else StubES(**kwargs)
+    server.port = server.server_address[1]
+    server.served = 0
+    server.connections = set()
+    server.stub.nodes.append(server.port)
+
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def main():
+    options = {'port': '9200', 'docs': '10000', 'width': '10', 'version': '5.6.0', 'delay': '0', 'nodes': '1',
+               'queries': '0'}
+
+    for arg in sys.argv[1:]:
+        k, _, v = arg.lstrip('-').partition('=')
+        if k not in options:
+            print("invalid argument", arg)
+            return 1
+        options[k] = v
+
+    server = start(int(options['port']), docs=int(options['docs']), width=int(options['width']),
+                   version=options['version'], delay=float(options['delay']), queries=bool(int(options['queries'])))
+    print("stub elasticsearch listening on localhost:%d" % server.port)
+
+    port = int(options['port'])
+    for n in range(1, int(options['nodes'])):
+        node = start(port + n if port else 0, cluster=server)
+        print("stub elasticsearch listening on localhost:%d" % node.port)
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    sys.exit(main())
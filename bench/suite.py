@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+#
+# Benchmark suite: parser throughput, request building, scroll loop and rendering,
+# run against a stub ElasticSearch server (bench/stubes.py) started in a separate process
+# (with {delay} seconds of latency on each request).
+#
+#   python bench/suite.py [--docs=20000] [--width=10] [--version=6.8.0] [--delay=0.01] [--repeat=3]
+#                         [--output=results.json] [--compare=baseline.json] [--threshold=10]
+#
+# The results are printed, and written as JSON with --output. With --compare the results are
+# compared with a previous run and the exit status is 1 if any benchmark is slower than the
+# baseline by more than --threshold percent.
+#
+
+from __future__ import print_function
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+
+from elseql.parser import ElseParser  # noqa: E402
+from elseql.rdparser import RDParser  # noqa: E402
+from elseql.search import ElseSearch  # noqa: E402
+from elseql.output import CsvWriter  # noqa: E402
+from elseql.version import __version__  # noqa: E402
+
+from parser_bench import CORPUS  # noqa: E402
+
+OPTIONS = {'docs': '20000', 'width': '10', 'version': '6.8.0', 'delay': '0.01', 'repeat': '3',
+           'output': '', 'compare': '', 'threshold': '10'}
+
+# micro benchmarks are repeated for at least MIN_TIME seconds
+MIN_TIME = 1.0
+
+BUILD_STATEMENTS = [
+    "select * from test where field1 = 'value 1' and field0 > 10",
+    "select field0, field1 from test where field0 between 1 and 100 order by field0 desc limit 10",
+    "select * from test where field1 in ('value 1', 'value 2', 'value 3') filter exist field2",
+    "select field1, count(*), avg(field0) from test where field0 > 5 group by field1",
+    "select * from test where field1 like 'value 1%' limit -1, 1000",
+]
+
+
+def start_stub(docs, width, version, delay):
+    """
+    Start the stub server in a new process, return (process, port)
+    """
+    process = subprocess.Popen([sys.executable, os.path.join(BENCH_DIR, 'stubes.py'), '--port=0',
+                                '--docs=%d' % docs, '--width=%d' % width, '--version=%s' % version,
+                                '--delay=%s' % delay],
+                               stdout=subprocess.PIPE)
+
+    line = process.stdout.readline()
+    if 'listening' not in line:
+        process.kill()
+        raise Exception("cannot start stub server: %r" % line)
+
+    return process, int(line.strip().rsplit(':', 1)[1])
+
+
+def best(repeat, fn, min_time=0):
+    """
+    Run fn repeat times (each time calling it again until min_time has elapsed),
+    return (calls, time, result of the last call) for the fastest run
+    """
+    runs = []
+    for _ in range(repeat):
+        calls = 0
+        start = time.time()
+
+        while True:
+            result = fn()
+            calls += 1
+            elapsed = time.time() - start
+            if elapsed >= min_time:
+                break
+
+        runs.append((elapsed / calls, calls, elapsed, result))
+
+    _, calls, elapsed, result = min(runs)
+    return calls, elapsed, result
+
+
+class Suite(object):
+
+    def __init__(self, options):
+        self.options = options
+        self.repeat = int(options['repeat'])
+        self.results = []
+
+    def add(self, name, count, elapsed, unit):
+        rate = count / elapsed if elapsed else 0
+        self.results.append({'name': name, 'value': round(rate, 1), 'unit': unit,
+                             'count': count, 'seconds': round(elapsed, 6)})
+        print("%-28s %12.1f %-14s (%d in %.3fs)" % (name, rate, unit, count, elapsed))
+
+    def bench_parse(self):
+        for parser in (ElseParser, RDParser):
+            def parse():
+                for stmt in CORPUS:
+                    parser.parse(stmt)
+
+            calls, elapsed, _ = best(self.repeat, parse, MIN_TIME)
+            self.add('parse.%s' % parser.__name__, calls * len(CORPUS), elapsed, 'statements/s')
+
+    def bench_build(self, search):
+        requests = [RDParser.parse(stmt) for stmt in BUILD_STATEMENTS]
+
+        def build():
+            for request in requests:
+                # build_request consumes the limit
+                request.limit = list(request.limit) if request.limit else ''
+                search.build_request(request)
+
+        calls, elapsed, _ = best(self.repeat, build, MIN_TIME)
+        self.add('build.build_request', calls * len(requests), elapsed, 'requests/s')
+
+        literals = iter(xrange(sys.maxint))
+
+        def compile_cached():
+            n = next(literals)
+            for stmt in BUILD_STATEMENTS:
+                search.compile(stmt.replace("value 1", "value %d" % n))
+
+        calls, elapsed, _ = best(self.repeat, compile_cached, MIN_TIME)
+        self.add('build.compile_cached', calls * len(BUILD_STATEMENTS), elapsed, 'requests/s')
+
+    def bench_scroll(self, search):
+        docs = int(self.options['docs'])
+
+        def scroll(prefetch, stream):
+            def run():
+                search.prefetch = prefetch
+                search.stream = stream
+                search.search("select * from test limit -1, 1000")
+            return run
+
+        search.output = os.devnull
+        prefetch = search.prefetch
+
+        for name, depth, stream in (('scroll', 0, False), ('scroll.prefetch', 1, False), ('scroll.stream', 0, True)):
+            calls, elapsed, _ = best(self.repeat, scroll(depth, stream))
+            self.add(name, calls * docs, elapsed, 'docs/s')
+
+        search.prefetch = prefetch
+        search.stream = False
+
+    def bench_render(self, search):
+        docs = min(int(self.options['docs']), 10000)
+        result = search.es.get('test/_search', data={'size': docs})
+        pages = [result] * 5
+
+        def render():
+            with open(os.devnull, 'wb') as stream:
+                out = CsvWriter(stream)
+                search.render(iter(pages), None, out)
+                out.close()
+            return out.rows
+
+        calls, elapsed, rows = best(self.repeat, render, MIN_TIME)
+        self.add('render.csv', calls * rows, elapsed, 'rows/s')
+
+    def run(self):
+        docs, width = int(self.options['docs']), int(self.options['width'])
+
+        self.bench_parse()
+
+        process, port = start_stub(docs, width, self.options['version'], self.options['delay'])
+        try:
+            devnull = open(os.devnull, 'w')
+            saved, sys.stdout = sys.stdout, devnull
+            try:
+                search = ElseSearch('localhost:%d' % port)
+            finally:
+                sys.stdout = saved
+
+            if not search.es:
+                raise Exception("cannot connect to the stub server")
+
+            self.bench_build(search)
+            self.bench_scroll(search)
+            self.bench_render(search)
+        finally:
+            process.kill()
+            process.wait()
+
+        return {
+            'elseql': __version__,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'options': dict((k, v) for k, v in self.options.iteritems() if k not in ('output', 'compare')),
+            'results': self.results
+        }
+
+
+def compare(report, baseline, threshold):
+    """
+    Print the change of each result against the baseline, return the number of regressions
+    """
+    previous = dict((r['name'], r) for r in baseline['results'])
+    regressions = 0
+
+    print()
+    print("compared to %s (elseql %s):" % (baseline.get('time'), baseline.get('elseql')))
+
+    for r in report['results']:
+        if r['name'] not in previous or not previous[r['name']]['value']:
+            continue
+
+        change = (r['value'] - previous[r['name']]['value']) * 100.0 / previous[r['name']]['value']
+        status = ''
+        if change < -threshold:
+            status = 'REGRESSION'
+            regressions += 1
+
+        print("%-28s %+8.1f%%  %s" % (r['name'], change, status))
+
+    return regressions
+
+
+def main():
+    options = dict(OPTIONS)
+
+    for arg in sys.argv[1:]:
+        k, _, v = arg.lstrip('-').partition('=')
+        if k not in options:
+            print("invalid argument", arg)
+            return 2
+        options[k] = v
+
+    report = Suite(options).run()
+
+    if options['output']:
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if options['compare']:
+        with open(options['compare']) as f:
+            baseline = json.load(f)
+
+        if compare(report, baseline, float(options['threshold'])):
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+#
+# Non-interactive batch execution of a file of statements (one per line).
+#
+# All the statements are compiled first; the simple searches are grouped in _msearch requests
+# that are executed concurrently, while scroll and search_after queries run one at a time.
+# Results are written in statement order, each one to its own file or to a labeled section
+# of the standard output, followed by a timing report.
+#
+
+from __future__ import print_function
+
+import json
+import os
+import os.path
+import sys
+import time
+
+from requests.exceptions import ConnectionError, Timeout
+
+from output import open_output
+from scroll import parallel_pages
+
+DEFAULT_JOBS = 4
+MSEARCH_SIZE = 100
+
+
+def read_statements(path):
+    """
+    Return the statements in file (one per line, skipping empty lines and comments)
+    """
+    f = sys.stdin if path == '-' else open(path)
+
+    try:
+        lines = [line.strip() for line in f]
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+    return [line.rstrip(';') for line in lines if line and line[0] not in '#;']
+
+
+def msearch_header(plan):
+    parts = plan['path'].split('/')[:-1]  # drop _search
+
+    header = {'index': parts[0]}
+    if len(parts) > 1:
+        header['type'] = parts[1]
+
+    if 'routing' in plan['params']:
+        header['routing'] = plan['params']['routing']
+
+    return header
+
+
+def can_msearch(plan):
+    return (plan['path'].endswith('/_search') and
+            'scroll' not in plan['params'] and not plan['search_after'] and
+            not (plan['aggs'] and plan['aggs']['mode'] == 'composite'))
+
+
+class Job(object):
+
+    def __init__(self, n, statement, plan):
+        self.n = n
+        self.statement = statement
+        self.plan = plan
+        self.group = None
+        self.result = None
+        self.request_time = 0.0
+        self.render_time = 0.0
+        self.took = None
+        self.rows = 0
+
+
+def run_msearch(search, jobs):
+    """
+    Execute a group of jobs with a single _msearch request
+    """
+    body = ''.join(json.dumps(msearch_header(j.plan)) + '\n' + json.dumps(j.plan['data']) + '\n' for j in jobs)
+
+    start = time.time()
+    result = search.es.post('_msearch', data=body, headers={'Content-Type': 'application/x-ndjson'})
+    elapsed = time.time() - start
+
+    responses = result.get('responses') if isinstance(result, dict) else None
+    if responses is None:
+        responses = [result] * len(jobs)
+
+    for job, response in zip(jobs, responses):
+        job.result = response
+        job.request_time = elapsed
+        job.took = response.get('took')
+
+    return jobs
+
+
+def run_batch(search, path, jobs=DEFAULT_JOBS, outdir=None):
+    try:
+        statements = read_statements(path)
+    except IOError as err:
+        print("cannot read", path, ":", err)
+        return 1
+
+    # compile all the statements first
+    batch = []
+    for n, statement in enumerate(statements):
+        plan = search.compile(statement)
+        if plan is None:
+            print("ERROR in statement %d, nothing executed" % (n + 1))
+            return 1
+
+        batch.append(Job(n + 1, statement, plan))
+
+    if not search.es:
+        print("not connected")
+        return 1
+
+    if outdir and not os.path.isdir(outdir):
+        os.makedirs(outdir)
+
+    # group the simple searches and run the groups concurrently
+    msearch = [j for j in batch if can_msearch(j.plan)]
+    groups = [msearch[i:i + MSEARCH_SIZE] for i in range(0, len(msearch), MSEARCH_SIZE)]
+
+    for g, group in enumerate(groups):
+        for job in group:
+            job.group = g + 1
+
+    def worker(k):
+        return lambda: (run_msearch(search, group) for group in groups[k::jobs])
+
+    workers = [worker(k) for k in range(min(jobs, len(groups)))]
+
+    try:
+        for _ in parallel_pages(workers):
+            pass
+    except (ConnectionError, Timeout) as err:
+        print("cannot connect to", search.es.url)
+        print(err)
+        return 1
+
+    # write the results (and run the other queries) in statement order
+    start_time = time.time()
+    status = 0
+
+    for job in batch:
+        try:
+            if job.plan['output']:
+                out = open_output(**job.plan['output'])
+            elif outdir:
+                out = open_output(os.path.join(outdir, "query-%d.csv" % job.n))
+            else:
+                out = open_output()
+                out.write_text("-- [%d] %s" % (job.n, job.statement))
+        except IOError as err:
+            print("ERROR in statement %d, cannot open output: %s" % (job.n, err))
+            status = 1
+            continue
+
+        try:
+            start = time.time()
+
+            if job.result is not None:
+                failed = search.render(iter([job.result]), job.plan['fields'], out, job.plan['aggs'],
+                                       job.plan['hit_fields'], job.plan['post'])
+                job.render_time = time.time() - start
+            else:
+                requests_time = search.es.stats.elapsed
+                failed = search.execute(job.plan, out)
+                job.request_time = search.es.stats.elapsed - requests_time
+                # (requests of prefetched pages overlap rendering)
+                job.render_time = max(0.0, time.time() - start - job.request_time)
+
+            job.rows = out.rows
+            if failed:
+                status = 1
+
+            if not outdir:
+                out.write_text()
+        finally:
+            out.close()
+
+    report(batch, time.time() - start_time)
+    return status
+
+
+def report(batch, elapsed):
+    print()
+    print("%4s %-8s %10s %10s %8s %8s  %s" % ('#', 'mode', 'request', 'render', 'took', 'rows', 'statement'))
+
+    for job in batch:
+        mode = 'msearch%d' % job.group if job.group else 'search'
+        took = '%dms' % job.took if job.took is not None else '-'
+        statement = job.statement if len(job.statement) <= 60 else job.statement[:57] + '...'
+
+        print("%4d %-8s %8.1fms %8.1fms %8s %8d  %s" % (job.n, mode, job.request_time * 1000, job.render_time * 1000,
+                                                        took, job.rows, statement))
+
+    print()
+    print("%d statements, %.3fs" % (len(batch), elapsed))
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+#
+# Command line entry point: the interactive shell, batch mode or one-shot execution of statements.
+#
+#   elseql [--debug] [--port=host:port]
+#   elseql [--debug] [--port=host:port] --batch=queries.sql [--jobs=n] [--outdir=directory]
+#   elseql [--debug] [--port=host:port] [--parser=rd] [--output=file] -e "select ..." [-e ...]
+#
+# --port can be a comma separated list of nodes; with --sniff the nodes are discovered from the
+# cluster, and --balance=latency sends each request to the fastest node (default: round-robin).
+#
+# Modules are imported only when needed: one-shot runs (i.e. from cron) don't load the shell
+# (cmd2 and readline), don't build the pyparsing grammar unless they use it, and don't load the
+# index mappings.
+#
+
+from __future__ import print_function
+
+import sys
+
+
+def connect_nodes(search, sniff, balance):
+    if search.es and balance:
+        search.es.balance = balance
+
+    if sniff and search.host:
+        search.sniff()
+
+
+def run_statements(port, debug, statements, output=None, parser=None, sniff=False, balance=None):
+    """
+    Execute the statements (without the shell and without loading the index mappings),
+    return the exit status (1 if any statement failed)
+    """
+    from search import ElseSearch, PARSERS
+
+    if parser and parser not in PARSERS:
+        print("invalid parser", parser)
+        return 1
+
+    search = ElseSearch(port, debug, mappings=False)
+    if not search.host:
+        return 1
+
+    connect_nodes(search, sniff, balance)
+
+    search.output = output or None
+    if parser:
+        search.parser = parser
+
+    status = 0
+    for statement in statements:
+        if search.search(statement):
+            status = 1
+
+    return status
+
+
+def run_command():
+    args = sys.argv[1:]
+    debug = False
+
+    port = None
+    batch = None
+    jobs = None
+    outdir = None
+    statements = []
+    output = None
+    parser = None
+    sniff = False
+    balance = None
+
+    while args:
+        if args[0][0] == '-':
+            arg = args.pop(0)
+
+            if arg in ['-e', '--execute'] and args:
+                statements.append(args.pop(0))
+                continue
+
+            if arg in ['--batch', '--jobs', '--outdir', '--output', '--parser', '--balance'] and args:
+                arg += '=' + args.pop(0)
+
+            if arg.startswith('--port=') or arg.startswith('--host='):
+                port = arg[7:]
+
+            elif arg == '--debug':
+                debug = True
+
+            elif arg == '--sniff':
+                sniff = True
+
+            elif arg.startswith('--balance='):
+                balance = arg[10:]
+
+            elif arg.startswith('--batch='):
+                batch = arg[8:]
+
+            elif arg.startswith('--jobs='):
+                jobs = max(1, int(arg[7:]))
+
+            elif arg.startswith('--outdir='):
+                outdir = arg[9:]
+
+            elif arg.startswith('--output='):
+                output = arg[9:]
+
+            elif arg.startswith('--parser='):
+                parser = arg[9:]
+
+            elif arg == '--':
+                break
+
+            else:
+                print("invalid argument ", arg)
+                return 1
+        else:
+            break
+
+    if balance:
+        from transport import BALANCE
+
+        if balance not in BALANCE:
+            print("invalid balance", balance)
+            return 1
+
+    if statements:
+        if '-' in statements:
+            # statements from stdin, one per line
+            from batch import read_statements
+
+            stdin = read_statements('-')
+            statements = sum(([s] if s != '-' else stdin for s in statements), [])
+
+        from search import DEFAULT_PORT
+        return run_statements(port or DEFAULT_PORT, debug, statements, output, parser, sniff, balance)
+
+    if batch:
+        from search import ElseSearch, DEFAULT_PORT
+        from batch import run_batch, DEFAULT_JOBS
+
+        search = ElseSearch(port or DEFAULT_PORT, debug)
+        connect_nodes(search, sniff, balance)
+        return run_batch(search, batch, jobs or DEFAULT_JOBS, outdir)
+
+    from elseql import ElseShell
+    from search import DEFAULT_PORT
+
+    # the remaining arguments are shell commands
+    sys.argv[1:] = args
+    shell = ElseShell(port or DEFAULT_PORT, debug)
+
+    if balance:
+        shell._onchange_balance(shell.balance, balance)
+    if sniff:
+        shell._onchange_sniff(shell.sniff, sniff)
+
+    shell.cmdloop()
+
+
+if __name__ == "__main__":
+    sys.exit(run_command())
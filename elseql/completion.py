@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+#
+# Tab completion: sorted word lists searched with bisect (instead of scanning every keyword),
+# updated as index names and mappings are loaded, and selected by the clause being completed
+# (index names after FROM, the fields of the FROM index in the other clauses).
+#
+
+from __future__ import print_function
+
+import re
+
+from bisect import bisect_left
+
+from mapping import doc_types, field_paths
+
+KEYWORDS = ['select', 'facets', 'filter', 'query', 'exist', 'missing', 'script',
+            'from', 'where', 'in', 'between', 'like', 'group by', 'order by', 'limit', 'and', 'or', 'not',
+            'routing', 'asc', 'desc', 'true', 'false', 'count', 'sum', 'avg', 'min', 'max']
+
+FIELD_CLAUSES = set(['select', 'facets', 'script', 'where', 'filter', 'query', 'exist', 'missing', 'group by', 'order by'])
+
+_clause_re = re.compile(r'\b(select|facets|script|from|where|filter|query|exist|missing|group\s+by|order\s+by|limit|routing)\b',
+                        re.IGNORECASE)
+
+_from_re = re.compile(r'\bfrom\s+([\w.$]+)', re.IGNORECASE)
+
+
+def from_index(line, begidx=None):
+    """
+    Return the index name in the FROM clause of line (or None). If begidx (the start of the word being
+    completed) is in the index name, the name is still being typed and None is returned
+    """
+    m = _from_re.search(line)
+    if not m or (begidx is not None and m.start(1) <= begidx <= m.end(1)):
+        return None
+    return m.group(1).split(".")[0]
+
+
+def current_clause(line):
+    """
+    Return the (lowercase) name of the last clause keyword in line
+    """
+    clauses = _clause_re.findall(line)
+    return " ".join(clauses[-1].lower().split()) if clauses else None
+
+
+class PrefixIndex(object):
+    """
+    A sorted list of words, searched by prefix with bisect
+    """
+
+    def __init__(self, words=()):
+        self.words = sorted(set(words))
+
+    def __len__(self):
+        return len(self.words)
+
+    def add(self, words):
+        words = set(words).difference(self.words)
+        if words:
+            self.words = sorted(words.union(self.words))
+
+    def complete(self, prefix):
+        if not prefix:
+            return list(self.words)
+
+        # all the words between prefix and the first string after all the words starting with prefix
+        upper = prefix[:-1] + unichr(ord(prefix[-1]) + 1)
+        return self.words[bisect_left(self.words, prefix):bisect_left(self.words, upper)]
+
+
+class Completer(object):
+
+    def __init__(self):
+        self.keywords = PrefixIndex(KEYWORDS)
+        self.indices = PrefixIndex()
+        self.fields = {}
+        self.all_fields = PrefixIndex(['_score', '_all'])
+
+    def add_indices(self, names):
+        self.indices.add(names)
+
+    def has_mapping(self, index):
+        return index in self.fields
+
+    def add_mapping(self, index, mapping):
+        """
+        Add the field paths of an index mapping ({index: mapping} as returned by {index}/_mapping)
+        """
+        paths = ['_score', '_all', '_id']
+
+        for m in mapping.itervalues():
+            for t, document in doc_types(m).iteritems():
+                paths.extend(p for p, _ in field_paths(document))
+
+        self.fields[index] = PrefixIndex(paths)
+        self.all_fields.add(paths)
+
+    def complete(self, text, line, index=None):
+        """
+        Return the completions for text, where line is the statement up to text
+        """
+        clause = current_clause(line)
+
+        if clause == 'from':
+            return self.indices.complete(text)
+
+        words = self.keywords.complete(text)
+
+        if clause in FIELD_CLAUSES:
+            fields = self.fields.get(index) or self.all_fields
+            words = fields.complete(text) + words
+
+        return words
@@ -48,6 +48,7 @@ else:
 
 import os
 import os.path
+import re
 import shlex
 import traceback
 
@@ -60,7 +61,12 @@ else:
         print(json.dumps(obj, indent=2))
 
 from cmd2 import Cmd
-from search import ElseSearch, DEFAULT_PORT
+from search import ElseSearch, DEFAULT_PORT, DEFAULT_PARSER, PARSERS, PREFETCH, SCROLL_KEEPALIVE, PROJECTIONS
+from transport import BALANCE
+from join import JOIN_MEMORY
+from sorter import SORT_MEMORY
+from scroll import PAGE_TIME
+from resultcache import DEFAULT_TTL
 from version import __version__
 
 HISTORY_FILE = ".elseql_history"
@@ -76,18 +82,54 @@ class ElseShell(Cmd):
     prompt = "elseql> "
     port = DEFAULT_PORT
     creds = None
+    sniff = False
+    balance = BALANCE[0]
     debug = False
     query = False
+    parser = DEFAULT_PARSER
+    output = ''
+    slices = 1
+    prefetch = PREFETCH
+    keepalive = SCROLL_KEEPALIVE
+    adaptive = False
+    pagetime = PAGE_TIME
+    projection = PROJECTIONS[0]
+    joinmemory = JOIN_MEMORY / (1024 * 1024)
+    sortmemory = SORT_MEMORY / (1024 * 1024)
+    compress = False
+    stream = False
+    cache = False
+    cachettl = DEFAULT_TTL
+    dsl = True
+    timing = False
 
     def __init__(self, port, debug):
         Cmd.__init__(self)
 
         self.settable.update({
             "prompt": "Set command prompt",
-            "port": "Set service [host:]port",
+            "port": "Set service [host:]port (or a comma separated list of nodes)",
             "creds": "Set credentials (user:password)",
+            "sniff": "Discover the cluster nodes (from _nodes/http) when connecting",
+            "balance": "Spread the requests across the nodes %s" % " or ".join(BALANCE),
             "debug": "Set debug mode",
-            "query": "Display query before results"
+            "query": "Display query before results",
+            "output": "Set output file (empty for stdout)",
+            "compress": "Compress (gzip) request bodies",
+            "stream": "Decode search results incrementally (bounded memory for large pages)",
+            "timing": "Display the time spent in each phase of a query",
+            "dsl": "Compile where/filter clauses to query DSL (off: Lucene query_string)",
+            "cache": "Cache search results (not scroll queries)",
+            "cachettl": "Set the default time to live (seconds) of cached results",
+            "slices": "Set number of parallel slices for scroll queries (LIMIT -1,n)",
+            "prefetch": "Set number of result pages fetched while rendering (0 to disable)",
+            "keepalive": "Set how long scroll contexts are kept between pages (i.e. 30s, 1m)",
+            "adaptive": "Tune the page size of scroll and sorted queries from the observed page times",
+            "pagetime": "Set the target time (seconds) of a page, for the adaptive page size",
+            "projection": "Fetch the selected columns from doc values or _source (%s)" % " or ".join(PROJECTIONS),
+            "joinmemory": "Set the memory (MB) for the rows of the hash table of a JOIN",
+            "sortmemory": "Set the memory (MB) for sorting rows (ORDER BY of scroll queries, DISTINCT) before using temporary files",
+            "parser": "Set parser engine (%s)" % " or ".join(sorted(PARSERS))
         })
 
         if readline:
@@ -101,10 +143,32 @@ class ElseShell(Cmd):
         self.init_search()
 
     def init_search(self):
-        self.search = ElseSearch(self.port, self.debug)
+        self.search = ElseSearch(self.port, self.debug, self.creds)
+        self.search.parser = self.parser
+        self.search.output = self.output
+        self.search.slices = self.slices
+        self.search.prefetch = self.prefetch
+        self.search.keepalive = self.keepalive
+        self.search.adaptive = self.adaptive
+        self.search.page_sizer.target = self.pagetime
+        self.search.projection = self.projection
+        self.search.join_memory = self.joinmemory * 1024 * 1024
+        self.search.sort_memory = self.sortmemory * 1024 * 1024
+        self.search.stream = self.stream
+        self.search.cache = self.cache
+        self.search.dsl = self.dsl
+        self.search.timing = self.timing
+        self.search.result_cache.ttl = self.cachettl
+
+        if self.search.es:
+            self.search.es.compress = self.compress
+            self.search.es.balance = self.balance
 
         if self.search.host:
             print("connected to", self.search.host)
+
+            if self.sniff:
+                print("nodes:", ", ".join(self.search.sniff()))
         else:
             print("not connected")
 
@@ -119,6 +183,22 @@ class ElseShell(Cmd):
         print("creds:", self.creds)
         self.init_search()
 
+    def _onchange_sniff(self, old=None, new=None):
+        self.sniff = new
+
+        if self.sniff and self.search.host:
+            print("nodes:", ", ".join(self.search.sniff()))
+
+    def _onchange_balance(self, old=None, new=None):
+        if new not in BALANCE:
+            print("invalid balance", new)
+            self.balance = old
+        else:
+            self.balance = new
+
+            if self.search.es:
+                self.search.es.balance = self.balance
+
     def _onchange_debug(self, old=None, new=None):
         self.debug = new
         self.search.debug = self.debug
@@ -127,6 +207,84 @@ class ElseShell(Cmd):
         self.query = new
         self.search.print_query = self.query
 
+    def _onchange_parser(self, old=None, new=None):
+        if new not in PARSERS:
+            print("invalid parser", new)
+            self.parser = old
+        else:
+            self.parser = new
+            self.search.parser = self.parser
+
+    def _onchange_output(self, old=None, new=None):
+        self.output = new
+        self.search.output = self.output
+
+    def _onchange_slices(self, old=None, new=None):
+        self.slices = max(1, new)
+        self.search.slices = self.slices
+
+    def _onchange_prefetch(self, old=None, new=None):
+        self.prefetch = max(0, new)
+        self.search.prefetch = self.prefetch
+
+    def _onchange_keepalive(self, old=None, new=None):
+        if not re.match(r'^\d+(ms|s|m|h|d)$', new):
+            print("invalid keepalive", new)
+            self.keepalive = old
+        else:
+            self.keepalive = new
+            self.search.keepalive = self.keepalive
+
+    def _onchange_adaptive(self, old=None, new=None):
+        self.adaptive = new
+        self.search.adaptive = self.adaptive
+
+    def _onchange_pagetime(self, old=None, new=None):
+        self.pagetime = new if new > 0 else old
+        self.search.page_sizer.target = self.pagetime
+
+    def _onchange_projection(self, old=None, new=None):
+        if new not in PROJECTIONS:
+            print("invalid projection", new)
+            self.projection = old
+        else:
+            self.projection = new
+            self.search.projection = self.projection
+
+    def _onchange_joinmemory(self, old=None, new=None):
+        self.joinmemory = new if new > 0 else old
+        self.search.join_memory = self.joinmemory * 1024 * 1024
+
+    def _onchange_sortmemory(self, old=None, new=None):
+        self.sortmemory = new if new > 0 else old
+        self.search.sort_memory = self.sortmemory * 1024 * 1024
+
+    def _onchange_stream(self, old=None, new=None):
+        self.stream = new
+        self.search.stream = self.stream
+
+    def _onchange_timing(self, old=None, new=None):
+        self.timing = new
+        self.search.timing = self.timing
+
+    def _onchange_dsl(self, old=None, new=None):
+        self.dsl = new
+        self.search.dsl = self.dsl
+
+    def _onchange_cache(self, old=None, new=None):
+        self.cache = new
+        self.search.cache = self.cache
+
+    def _onchange_cachettl(self, old=None, new=None):
+        self.cachettl = new
+        self.search.result_cache.ttl = self.cachettl
+
+    def _onchange_compress(self, old=None, new=None):
+        self.compress = new
+
+        if self.search.es:
+            self.search.es.compress = self.compress
+
     def getargs(self, line):
         return shlex.split(str(line.decode('string-escape')))
 
@@ -143,20 +301,57 @@ class ElseShell(Cmd):
         print(self.search.get_keywords())
 
     def do_mapping(self, line):
-        "mapping [index-name]"
-        mapping = self.search.get_mapping()
-
+        "mapping [--list | --refresh | index-name]"
         if line == "--list":
-            for k in mapping:
+            for k in self.search.get_indices():
                 print(k)
+        elif line == "--refresh":
+            if self.search.mappings:
+                self.search.mappings.clear()
         elif line:
-            pprint(mapping[line])
+            pprint(self.search.get_mapping(line))
+        else:
+            pprint(self.search.get_mapping())
+
+    def do_plancache(self, line):
+        "plancache [clear]"
+        if line == "clear":
+            self.search.plan_cache.clear()
+            return
+
+        for k, v in self.search.plan_cache.stats().iteritems():
+            print("%s: %s" % (k, v))
+
+    def do_resultcache(self, line):
+        "resultcache [clear]"
+        if line == "clear":
+            self.search.result_cache.clear()
+            return
+
+        for k, v in self.search.result_cache.stats().iteritems():
+            print("%s: %s" % (k, v))
+
+    def do_transport(self, line):
+        "transport [reset]"
+        if not self.search.es:
+            print("not connected")
+        elif line == "reset":
+            self.search.es.stats.reset()
         else:
-            pprint(mapping)
+            for k, v in self.search.es.stats.stats().iteritems():
+                print("%s: %s" % (k, v))
+
+            print()
+            for url, status, requests, failures, latency in self.search.es.node_stats():
+                print("%s: %s, %d requests, %d failures, latency %s ms" % (url, status, requests, failures, latency))
 
     def do_select(self, line):
         self.search.search('select ' + line)
 
+    def do_profile(self, line):
+        "profile select ..."
+        self.search.profile(line)
+
     def do_explain(self, line):
         self.search.search(line, explain=True)
 
@@ -199,14 +394,8 @@ class ElseShell(Cmd):
         else:
             return Cmd.default(self, line)
 
-    def completedefault(self, test, line, beginidx, endidx):
-        list = []
-
-        for k in self.search.get_keywords():
-            if k.startswith(test):
-                list.append(k)
-
-        return list
+    def completedefault(self, text, line, beginidx, endidx):
+        return self.search.complete(text, line, beginidx)
 
     def preloop(self):
         if self.history_file and os.path.exists(self.history_file):
@@ -224,35 +413,10 @@ class ElseShell(Cmd):
 
 
 def run_command():
-    import sys
-
-    args = sys.argv
-    args.pop(0)  # drop progname
-    debug = False
-
-    port = DEFAULT_PORT
-
-    while args:
-        if args[0][0] == '-':
-            arg = args.pop(0)
-
-            if arg.startswith('--port=') or arg.startswith('--host='):
-                port = arg[7:]
-
-            elif arg == '--debug':
-                debug = True
-
-            elif arg == '--':
-                break
-
-            else:
-                print("invalid argument ", arg)
-                return 1
-        else:
-            break
-
-    ElseShell(port, debug).cmdloop()
+    # the console script is elseql.cli:run_command (that only loads the shell when needed)
+    from cli import run_command
+    return run_command()
 
 
 if __name__ == "__main__":
-    run_command()
+    sys.exit(run_command())
@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+#
+# Client-side (inner) hash join between two indexes:
+#
+#   select o.id, c.name from orders o join customers c on o.customer = c._id where o.total > 100
+#
+# The columns and WHERE conditions are qualified with the index name (or alias) and the conditions
+# (AND-ed) are pushed down to the search on their index. The side with fewer matching documents
+# (from _count) is the build side: it's scrolled and its rows are put in a hash table by join key,
+# up to a memory budget. The keys in the table are then looked up, in batches, with terms queries on
+# the other (probe) index, and each probe hit is joined with the build rows with the same key.
+#
+# The build scroll is idle while a table is probed: for a large memory budget probing can take longer
+# than the scroll keepalive, so the next build pages are fetched (and kept until the table is probed)
+# every {refresh} seconds, to keep the build scroll alive.
+#
+
+from __future__ import print_function
+
+import time
+
+from copy import copy
+
+from parser import Operator, AndOperator, OrOperator, NotOperator
+from projector import METADATA, compile_projector, path_getter, row_size
+
+# memory budget (estimated size of the build rows) of the hash table, and number of keys per terms query
+JOIN_MEMORY = 64 * 1024 * 1024
+JOIN_BATCH = 1000
+
+
+class JoinError(Exception):
+    pass
+
+
+def side_names(request):
+    # the name of each side: its alias, or the index name
+    return [request.alias or request.index, request.join_alias or request.join_index]
+
+
+def resolve(column, names):
+    """
+    Return (side, column in the index) for a column qualified with the name of one of the sides
+    """
+    matches = sorted(((len(name), n) for n, name in enumerate(names) if column.startswith(name + '.')), reverse=True)
+    if not matches:
+        raise JoinError("column %s must be qualified with %s" % (column, " or ".join(names)))
+
+    size, side = matches[0]
+    if len(matches) > 1 and matches[1][0] == size:
+        raise JoinError("ambiguous column %s (use an alias)" % column)
+
+    return side, column[size + 1:]
+
+
+def conjuncts(query):
+    if isinstance(query, AndOperator):
+        return sum((conjuncts(x) for x in query.operands), [])
+    return [query]
+
+
+def condition_columns(x):
+    if isinstance(x, (AndOperator, OrOperator, NotOperator)):
+        return sum((condition_columns(o) for o in x.operands), [])
+    if isinstance(x, Operator):
+        return [x.operands[0]]
+    return []
+
+
+def rename_columns(x, rename):
+    """
+    Return a copy of the condition x with the columns renamed
+    """
+    if isinstance(x, (AndOperator, OrOperator, NotOperator)):
+        y = copy(x)
+        y.operands = [rename_columns(o, rename) for o in x.operands]
+        return y
+
+    if isinstance(x, Operator):
+        y = copy(x)
+        y.operands = [rename(x.operands[0])] + x.operands[1:]
+        return y
+
+    return x
+
+
+def split_conditions(query, names):
+    """
+    Return the list of the conditions (on the unqualified columns) of each side, for a WHERE expression
+    made of AND-ed conditions on one side each
+    """
+    sides = [[] for _ in names]
+
+    if not query:
+        return sides
+
+    if not isinstance(query, (Operator, bool)):
+        raise JoinError("the WHERE clause of a JOIN can't be a Lucene query string")
+
+    for condition in conjuncts(query):
+        columns = [resolve(c, names) for c in condition_columns(condition)]
+        side = set(s for s, _ in columns)
+
+        if len(side) > 1:
+            raise JoinError("condition %s refers to both indexes (only AND-ed conditions on one index each "
+                            "are supported)" % condition)
+
+        sides[side.pop() if side else 0].append(rename_columns(condition, lambda c: resolve(c, names)[1]))
+
+    return sides
+
+
+def join_keys(value):
+    """
+    Return the (hash key, value) pairs for a join key value (a list for multi-valued fields). Numbers are
+    compared as text, since the same key can be a number in one index and a keyword in the other
+    """
+    pairs = []
+
+    for v in value if isinstance(value, list) else [value]:
+        if v is None or isinstance(v, (dict, list)):
+            continue
+        if isinstance(v, bool):
+            key = 'true' if v else 'false'
+        elif isinstance(v, float) and v.is_integer():
+            key = unicode(int(v))
+        elif isinstance(v, (int, long, float)):
+            key = unicode(v)
+        else:
+            key = v
+        pairs.append((key, v))
+
+    return pairs
+
+
+def key_getter(column):
+    if column in METADATA:
+        return lambda hit: hit.get(column)
+
+    get = path_getter(column)
+    return lambda hit: get(hit.get('_source') or {})
+
+
+def row_projector(columns):
+    if not columns:
+        return lambda hit: ()
+    return compile_projector(columns)
+
+
+def probe_batch(table, keys, hits_pages, probe):
+    """
+    Yield the lists of (build row, probe row) pairs for the probe hits matching a batch of keys
+    """
+    get_key = key_getter(probe['key'])
+    project = row_projector(probe['columns'])
+    batch = set(k for k, _ in keys)
+
+    for hits in hits_pages(probe, [v for _, v in keys]):
+        pairs = []
+
+        for hit in hits:
+            found = [k for k, _ in join_keys(get_key(hit)) if k in batch]
+            if not found:
+                continue
+
+            if len(found) == 1:
+                matched = table[found[0]]
+            else:
+                # a multi-valued key: each build row is joined once
+                seen = set()
+                matched = [r for k in found for r in table[k] if id(r) not in seen and not seen.add(id(r))]
+
+            row = project(hit)
+            pairs.extend((r, row) for r in matched)
+
+        if pairs:
+            yield pairs
+
+
+def hash_join(build_pages, hits_pages, build, probe, memory=JOIN_MEMORY, batch_size=JOIN_BATCH, refresh=None):
+    """
+    Join the hits of the build side (build_pages, an iterator of lists of hits) with the hits of the probe side
+    (hits_pages(probe, values) returns an iterator of lists of probe hits with a key in values). Yield the lists
+    of (build row, probe row) pairs, with the build['columns'] and probe['columns'] of the hits.
+
+    The build rows are kept in a hash table up to {memory} (estimated) bytes, then looked up and dropped.
+    If refresh is set, the next build page is fetched every {refresh} seconds while looking up a table
+    """
+    get_key = key_getter(build['key'])
+    project = row_projector(build['columns'])
+
+    build_pages = iter(build_pages)
+    pending = []  # the build pages fetched while looking up a table
+    fetched = [time.time()]
+
+    def next_page():
+        fetched[0] = time.time()
+        return next(build_pages, None)
+
+    def lookup(table, keys):
+        for n in range(0, len(keys), batch_size):
+            for pairs in probe_batch(table, keys[n:n + batch_size], hits_pages, probe):
+                yield pairs
+
+            if refresh and time.time() - fetched[0] >= refresh:
+                pending.append(next_page())
+
+    table, keys, size = {}, [], 0
+
+    while True:
+        hits = pending.pop(0) if pending else next_page()
+        if hits is None:
+            break
+
+        for hit in hits:
+            pairs = join_keys(get_key(hit))
+            if not pairs:
+                continue
+
+            row = project(hit)
+            size += row_size(row)
+
+            for k, v in pairs:
+                rows = table.get(k)
+                if rows is None:
+                    rows = table[k] = []
+                    keys.append((k, v))
+                if not rows or rows[-1] is not row:
+                    rows.append(row)
+
+        if size >= memory:
+            for pairs in lookup(table, keys):
+                yield pairs
+
+            table, keys, size = {}, [], 0
+
+    if table:
+        for pairs in lookup(table, keys):
+            yield pairs
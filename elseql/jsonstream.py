@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+#
+# Incremental decoding of search responses.
+#
+# The response is read from the HTTP stream a chunk at a time. Everything but hits.hits is
+# decoded as usual, while the hits are decoded one at a time and handed to the caller in
+# batches of (at most) batch_size bytes of JSON, so that only the current batch of documents
+# (and a chunk of input) is ever in memory, whatever the size of the page.
+#
+
+from __future__ import print_function
+
+import json
+import re
+
+DEFAULT_BATCH_SIZE = 4 * 1024 * 1024
+
+_ws_re = re.compile(r'[ \t\n\r]*')
+
+_number_chars = set('0123456789.eE+-')
+
+
+class HitStream(object):
+    """
+    The hits of a search response, available as batches of (decoded) hits.
+    When all the batches have been read, the rest of the response has been decoded too.
+    """
+
+    def __init__(self, batches):
+        self._batches = batches
+        self.count = 0
+
+    def __len__(self):
+        # the number of hits read so far
+        return self.count
+
+    def __repr__(self):
+        return "<HitStream: %d hits read>" % self.count
+
+    def batches(self):
+        for batch in self._batches:
+            self.count += len(batch)
+            yield batch
+
+    def drain(self):
+        for _ in self.batches():
+            pass
+
+
+class JsonStream(object):
+
+    def __init__(self, chunks, batch_size=DEFAULT_BATCH_SIZE):
+        self.chunks = iter(chunks)
+        self.batch_size = batch_size
+        self.decoder = json.JSONDecoder()
+
+        self.buf = ''
+        self.pos = 0
+        self.consumed = 0
+        self.eof = False
+
+    def read(self):
+        """
+        Append the next chunk to the (unread part of the) buffer. Return False at the end of the input
+        """
+        while not self.eof:
+            try:
+                chunk = next(self.chunks)
+            except StopIteration:
+                self.eof = True
+                break
+
+            if chunk:
+                self.consumed += self.pos
+                self.buf = self.buf[self.pos:] + chunk
+                self.pos = 0
+                return True
+
+        return False
+
+    def error(self, msg):
+        raise ValueError("%s at %d: %r" % (msg, self.pos, self.buf[self.pos:self.pos + 20]))
+
+    def peek(self):
+        while True:
+            self.pos = _ws_re.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+
+            if not self.read():
+                self.error("unexpected end of response")
+
+    def expect(self, c):
+        if self.peek() != c:
+            self.error("expected %r" % c)
+        self.pos += 1
+
+    def value(self):
+        """
+        Decode the next value, reading more input until it's complete
+        """
+        self.peek()
+
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+
+                # a number may continue in the next chunk
+                if (end < len(self.buf) and self.buf[end] not in _number_chars) or not self.read():
+                    self.pos = end
+                    return value
+            except ValueError as err:
+                # incomplete value: read until the unread input doubles, to avoid decoding
+                # a large value again for every chunk
+                size = 2 * (len(self.buf) - self.pos)
+                if not self.read():
+                    raise err
+
+                while len(self.buf) - self.pos < size and self.read():
+                    pass
+
+    def members(self):
+        """
+        Yield the keys of the object members (the caller consumes the values)
+        """
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+
+            c = self.peek()
+            self.pos += 1
+            if c == '}':
+                return
+            if c != ',':
+                self.pos -= 1
+                self.error("expected ',' or '}'")
+
+    def elements(self):
+        """
+        Yield (decoded element, size in bytes) for the elements of an array
+        """
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+
+        while True:
+            start = self.buf_offset()
+            value = self.value()
+            yield value, self.buf_offset() - start
+
+            c = self.peek()
+            self.pos += 1
+            if c == ']':
+                return
+            if c != ',':
+                self.pos -= 1
+                self.error("expected ',' or ']'")
+
+    def buf_offset(self):
+        # the position in the input (the buffer is shifted as chunks are read)
+        return self.consumed + self.pos
+
+    def parse(self, result):
+        """
+        Decode the response into result, yielding the batches of hits.hits (after a None marker
+        for the start of the hits)
+        """
+        for key in self.members():
+            if key != 'hits' or self.peek() != '{':
+                result[key] = self.value()
+                continue
+
+            hits = result['hits'] = {}
+
+            for k in self.members():
+                if k != 'hits' or self.peek() != '[':
+                    hits[k] = self.value()
+                    continue
+
+                yield None
+
+                batch, size = [], 0
+                for hit, n in self.elements():
+                    batch.append(hit)
+                    size += n
+
+                    if size >= self.batch_size:
+                        yield batch
+                        batch, size = [], 0
+
+                if batch:
+                    yield batch
+
+        while True:
+            self.pos = _ws_re.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                self.error("unexpected data after response")
+            if not self.read():
+                break
+
+
+def stream_response(chunks, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Decode a search response from an iterator of chunks of JSON.
+
+    The returned result is complete up to hits.hits, that is a HitStream: the rest
+    of the response is decoded when the hits are read.
+    """
+    stream = JsonStream(chunks, batch_size)
+    result = {}
+    parser = stream.parse(result)
+
+    # decode up to the hits (or the whole response, if there are no hits)
+    for _ in parser:
+        result['hits']['hits'] = HitStream(parser)
+        break
+
+    return result
@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+#
+# Lazy, per-index mapping loading with an on-disk cache.
+#
+# Mappings are fetched one index at a time, the first time an index is needed, and saved
+# in a cache file per host (in ~/.elseql_cache). Cached mappings expire after a TTL, or when
+# the cluster state version changes. Indexes without a mapping are remembered (in memory) for
+# MISSING_TTL seconds, so that i.e. tab completion doesn't request them again.
+#
+
+from __future__ import print_function
+
+import json
+import os
+import os.path
+import re
+import tempfile
+import threading
+import time
+
+CACHE_DIR = ".elseql_cache"
+DEFAULT_TTL = 3600
+
+# indexes without a mapping (i.e. that don't exist) are not requested again for MISSING_TTL seconds
+MISSING_TTL = 60
+
+# field types that have doc values (unless disabled in the mapping), and the ones whose doc values
+# are not the same as the _source values (single precision and scaled numbers).
+# The doc values of multi-valued fields are sorted and deduplicated, whatever the type
+DOCVALUE_TYPES = set(['keyword', 'long', 'integer', 'short', 'byte', 'double', 'float', 'half_float',
+                      'scaled_float', 'unsigned_long', 'date', 'date_nanos', 'boolean', 'ip'])
+LOSSY_TYPES = set(['float', 'half_float', 'scaled_float'])
+
+
+def cache_path(host):
+    name = re.sub(r'[^A-Za-z0-9_.-]+', '_', host)
+    return os.path.join(os.environ.get('HOME', ''), CACHE_DIR, name + '.json')
+
+
+def doc_types(mapping):
+    """
+    Return {type: document-mapping} for an index mapping, for all the mapping formats
+    ({type: doc}, {'mappings': {type: doc}} and the typeless {'mappings': doc} of 7.0)
+    """
+    if 'mappings' in mapping:
+        mapping = mapping['mappings']
+
+    if 'properties' in mapping:
+        return {'_doc': mapping}
+
+    return mapping
+
+
+def field_paths(doc, prefix=''):
+    """
+    Return the list of (full path, field mapping) for all the (nested) properties of a document mapping
+    """
+    paths = []
+
+    for name, prop in doc.get('properties', {}).iteritems():
+        path = prefix + name
+        paths.append((path, prop))
+        paths.extend(field_paths(prop, path + '.'))
+
+    return paths
+
+
+def is_analyzed(prop):
+    # text fields (and the analyzed strings before 5.0)
+    return prop.get('type') == 'text' or (prop.get('type') == 'string' and prop.get('index') != 'not_analyzed')
+
+
+def exact_fields(mapping):
+    """
+    Return the set of the (full paths of the) fields of an index mapping that are not analyzed,
+    including multi-fields (i.e. "name.raw")
+    """
+    exact = set(['_id', '_type', '_index', '_routing'])
+
+    for m in mapping.itervalues():
+        for t, document in doc_types(m).iteritems():
+            for path, prop in field_paths(document):
+                if 'type' in prop and not is_analyzed(prop):
+                    exact.add(path)
+
+                for name, sub in prop.get('fields', {}).iteritems():
+                    if not is_analyzed(sub):
+                        exact.add(path + '.' + name)
+
+    return exact
+
+
+def has_docvalues(prop, lossless=False):
+    if prop.get('type') not in DOCVALUE_TYPES or prop.get('doc_values') is False:
+        return False
+
+    if lossless:
+        # normalized keywords, and keywords longer than ignore_above (that have no doc values), differ from the _source
+        return prop['type'] not in LOSSY_TYPES and 'normalizer' not in prop and 'ignore_above' not in prop
+
+    return True
+
+
+def docvalue_fields(mapping, lossless=False):
+    """
+    Return {full path: type} for the fields of an index mapping that have doc values (in all the document types),
+    including multi-fields. If lossless is True, only the fields whose doc values are the same as the _source values
+    (for single values: the mapping doesn't tell the fields that are arrays)
+    """
+    types = {}
+    excluded = set()
+
+    for m in mapping.itervalues():
+        for t, document in doc_types(m).iteritems():
+            fields = list(field_paths(document))
+            for path, prop in list(fields):
+                fields.extend((path + '.' + name, sub) for name, sub in prop.get('fields', {}).iteritems())
+
+            for path, prop in fields:
+                if 'type' not in prop:
+                    continue  # object
+                elif has_docvalues(prop, lossless) and types.get(path, prop['type']) == prop['type']:
+                    types[path] = prop['type']
+                else:
+                    excluded.add(path)
+
+    return dict((path, t) for path, t in types.iteritems() if path not in excluded)
+
+
+class MappingCache(object):
+
+    def __init__(self, es, host, ttl=DEFAULT_TTL, path=None):
+        self.es = es
+        self.ttl = ttl
+        self.path = path or cache_path(host)
+        self.lock = threading.Lock()
+
+        self.version = None
+        self.indices = None
+        self.mappings = {}
+        self.missing = {}  # index: time (not saved)
+        self.loaded = False
+
+    #
+    # cache file
+    #
+
+    def load(self):
+        """
+        Load the cache file (once), dropping it if the cluster state version changed
+        """
+        if self.loaded:
+            return
+
+        self.loaded = True
+        self.version = self.cluster_version()
+
+        try:
+            with open(self.path) as f:
+                cache = json.load(f)
+        except (IOError, ValueError):
+            return
+
+        if cache.get('version') != self.version:
+            return
+
+        now = time.time()
+
+        if cache.get('indices') and now - cache['indices']['time'] < self.ttl:
+            self.indices = cache['indices']
+
+        self.mappings = dict((k, v) for k, v in cache.get('mappings', {}).iteritems()
+                             if now - v['time'] < self.ttl)
+
+    def save(self):
+        cache = {'version': self.version, 'indices': self.indices, 'mappings': self.mappings}
+
+        try:
+            dirname = os.path.dirname(self.path)
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+
+            fd, tmp = tempfile.mkstemp(dir=dirname)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(cache, f)
+
+            os.rename(tmp, self.path)
+        except (IOError, OSError) as err:
+            print("cannot save mapping cache:", err)
+
+    def clear(self):
+        with self.lock:
+            self.indices = None
+            self.mappings = {}
+            self.missing = {}
+            self.loaded = True
+            self.version = self.cluster_version()
+
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    #
+    # ElasticSearch requests
+    #
+
+    def cluster_version(self):
+        try:
+            state = self.es.get('_cluster/state/version')
+            return state.get('version') if isinstance(state, dict) else None
+        except Exception:
+            return None
+
+    def fetch_indices(self):
+        result = self.es.get('_aliases')
+        if not isinstance(result, dict) or 'error' in result:
+            return []
+
+        names = set(result)
+        for index in result.itervalues():
+            names.update(index.get('aliases', {}))
+
+        return sorted(names)
+
+    #
+    # public API
+    #
+
+    def get_indices(self):
+        """
+        Return the list of index (and alias) names
+        """
+        with self.lock:
+            self.load()
+
+            if self.indices is None:
+                self.indices = {'time': time.time(), 'names': self.fetch_indices()}
+                self.save()
+
+            return self.indices['names']
+
+    def get(self, index):
+        """
+        Return the mapping for index (the ElasticSearch response for {index}/_mapping)
+        """
+        with self.lock:
+            self.load()
+
+            if index not in self.mappings:
+                if time.time() - self.missing.get(index, 0) < MISSING_TTL:
+                    return None
+
+                mapping = self.es.get(index + '/_mapping')
+                if not isinstance(mapping, dict) or 'error' in mapping:
+                    self.missing[index] = time.time()
+                    return None
+
+                self.missing.pop(index, None)
+
+                self.mappings[index] = {'time': time.time(), 'mapping': mapping}
+                self.save()
+
+            return self.mappings[index]['mapping']
+
+    def loaded_mappings(self):
+        """
+        Return the mappings loaded so far, as {index: mapping}
+        """
+        mappings = {}
+        for m in self.mappings.itervalues():
+            mappings.update(m['mapping'])
+        return mappings
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+#
+# Output sinks for search results.
+#
+# A writer buffers the formatted rows and writes a whole page (or more) to the
+# output stream at once, instead of calling print() for every row.
+# Output files can be written as CSV, TSV or NDJSON, optionally gzip-compressed.
+#
+
+from __future__ import print_function
+
+import gzip
+import json
+import sys
+
+DEFAULT_BUFSIZE = 256 * 1024
+
+
+def csval(v):
+    if not v and not isinstance(v, (int, long, float)):
+        return ''
+
+    if isinstance(v, (list, dict)):
+        # multi-valued fields and objects
+        v = json.dumps(v, ensure_ascii=False)
+    elif not isinstance(v, basestring):
+        v = str(v)
+
+    if v.isalnum():
+        return v
+
+    return '"%s"' % v.replace('"', '""')
+
+
+class Writer(object):
+    """
+    Base class for output sinks. Subclasses implement format_rows (and optionally format_header)
+    """
+
+    def __init__(self, stream=None, bufsize=DEFAULT_BUFSIZE, close_stream=False, text=True):
+        self.stream = stream or sys.stdout
+        self.bufsize = bufsize
+        self.close_stream = close_stream
+        self.text = text
+
+        self.buffer = []
+        self.buffered = 0
+        self.rows = 0
+
+    def format_header(self, fields):
+        return self.format_rows([fields])
+
+    def format_rows(self, rows):
+        raise NotImplementedError("format_rows")
+
+    def write(self, s):
+        if isinstance(s, unicode):
+            s = s.encode("utf-8")
+
+        self.buffer.append(s)
+        self.buffered += len(s)
+
+        if self.buffered >= self.bufsize:
+            self.flush()
+
+    def write_header(self, fields):
+        self.write(self.format_header(fields))
+
+    def write_rows(self, rows):
+        if rows:
+            self.write(self.format_rows(rows))
+            self.rows += len(rows)
+
+    def write_text(self, text=''):
+        # text lines (totals, facet headers) are not written to data files
+        if self.text:
+            self.write(text + '\n')
+
+    def flush(self):
+        if self.buffer:
+            self.stream.write(''.join(self.buffer))
+            self.buffer = []
+            self.buffered = 0
+
+        self.stream.flush()
+
+    def close(self):
+        self.flush()
+
+        if self.close_stream:
+            self.stream.close()
+
+
+class CsvWriter(Writer):
+
+    def format_rows(self, rows):
+        try:
+            return u''.join([u','.join(map(csval, row)) + u'\n' for row in rows])
+        except UnicodeDecodeError:
+            raise Exception("UnicodeDecodeError for %s" % rows)
+
+
+def tsval(v):
+    if v is None:
+        return ''
+
+    if isinstance(v, (list, dict)):
+        v = json.dumps(v, ensure_ascii=False)
+    elif not isinstance(v, basestring):
+        return str(v)
+
+    # tabs and newlines are escaped (as in the PostgreSQL/MySQL text format)
+    return v.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+class TsvWriter(Writer):
+
+    def format_rows(self, rows):
+        return u''.join([u'\t'.join(map(tsval, row)) + u'\n' for row in rows])
+
+
+class NdjsonWriter(Writer):
+    """
+    Write one JSON object per row, with the header fields as keys
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(NdjsonWriter, self).__init__(*args, **kwargs)
+        self.fields = None
+        self.encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+    def format_header(self, fields):
+        self.fields = list(fields)
+        return ''
+
+    def format_rows(self, rows):
+        encode = self.encoder.encode
+        fields = self.fields or [str(n) for n in range(len(rows[0]))]
+        return u''.join([encode(dict(zip(fields, row))) + u'\n' for row in rows])
+
+
+WRITERS = {
+    'csv': CsvWriter,
+    'tsv': TsvWriter,
+    'ndjson': NdjsonWriter
+}
+
+COMPRESSORS = ['gzip']
+
+
+def open_output(path=None, format='csv', bufsize=DEFAULT_BUFSIZE, compress=None, text=True):
+    """
+    Return a writer for the specified format, writing to path (or stdout if path is not specified).
+    If compress is 'gzip' the file is written gzip-compressed, if text is False only the header
+    and rows are written.
+    """
+    if format not in WRITERS:
+        raise Exception("invalid output format %s" % format)
+
+    if compress and compress not in COMPRESSORS:
+        raise Exception("invalid output compression %s" % compress)
+
+    if path and compress:
+        return WRITERS[format](gzip.open(path, 'wb', 6), bufsize, close_stream=True, text=text)
+    elif path:
+        return WRITERS[format](open(path, 'wb'), bufsize, close_stream=True, text=text)
+    else:
+        return WRITERS[format](sys.stdout, bufsize, text=text)
@@ -7,6 +7,44 @@ from pyparsing import (Optional, Word, delimitedList, Group, quotedString, nums,
                        Forward, ParseBaseException, ParseException, ParseFatalException)
 
 
+def query_dsl(x, exact=()):
+    """
+    Return the query DSL for a where expression (an Operator, a boolean or a query string).
+    exact is the set of the fields that are not analyzed: they are compared with term queries,
+    the other fields with match queries (analyzed, like query_string)
+    """
+    if isinstance(x, Operator):
+        return x.dsl(exact)
+    elif isinstance(x, bool):
+        return {'match_all': {}} if x else {'bool': {'must_not': [{'match_all': {}}]}}
+    else:
+        return {'query_string': {'query': x, 'default_operator': 'AND'}}
+
+
+# characters with a special meaning in a Lucene query string
+_LUCENE_RESERVED = set('+-=&|><!(){}[]^"~*?:\\/')
+
+
+def wildcard(pattern):
+    # SQL LIKE pattern to wildcard pattern
+    pattern = pattern.replace('\\', '\\\\').replace('*', '\\*').replace('?', '\\?')
+    return pattern.replace('%', '*').replace('_', '?')
+
+
+def query_string_wildcard(pattern):
+    # SQL LIKE pattern to query string (with wildcards), escaping the other special characters
+    return ''.join({'%': '*', '_': '?'}.get(c) or ('\\' + c if c in _LUCENE_RESERVED else c) for c in pattern)
+
+
+def keyword_field(field, exact):
+    """
+    Return field if it's not analyzed, or its first not analyzed multi-field (i.e. "name.raw"), or None
+    """
+    if field in exact:
+        return field
+    return ([f for f in sorted(exact) if f.startswith(field + '.')] or [None])[0]
+
+
 class Operator(object):
     name = '<UnknownOperator>'
 
@@ -27,6 +65,17 @@ class Operator(object):
         else:
             return str(x)
 
+    def group(self, x):
+        # compound operands are parenthesized, query_string doesn't know the precedence of the statement
+        if isinstance(x, (AndOperator, OrOperator, NotOperator)):
+            return "(%s)" % x
+        return self.val(x)
+
+    def term(self, field, value, exact):
+        if field in exact:
+            return {'term': {field: value}}
+        return {'match': {field: {'query': value, 'operator': 'and'}}}
+
 
 class BinaryOperator(Operator):
     def __init__(self, operands):
@@ -49,6 +98,22 @@ class BinaryOperator(Operator):
         else:
             return "%s %s %s" % (self.operands[0], self.name, self.op(1))
 
+    def dsl(self, exact=()):
+        field, value = self.operands
+
+        if self.name == '=':
+            return self.term(field, value, exact)
+        elif self.name in ['!=', '<>']:
+            return {'bool': {'must_not': [self.term(field, value, exact)]}}
+        elif self.name in ['<=', 'LTE', 'LE']:
+            return {'range': {field: {'lte': value}}}
+        elif self.name in ['>=', 'GTE', 'GE']:
+            return {'range': {field: {'gte': value}}}
+        elif self.name in ['<', 'LT']:
+            return {'range': {field: {'lt': value}}}
+        else:
+            return {'range': {field: {'gt': value}}}
+
 
 class LikeOperator(Operator):
     name = 'LIKE'
@@ -56,6 +121,17 @@ class LikeOperator(Operator):
     def __str__(self):
         return "%s:%s" % (self.operands[0], self.operands[1].replace('*', '\*').replace('%', '*'))
 
+    def dsl(self, exact=()):
+        field, pattern = self.operands
+
+        keyword = keyword_field(field, exact)
+        if keyword:
+            return {'wildcard': {keyword: wildcard(pattern)}}
+
+        # analyzed (or unknown) fields: the wildcards match the (analyzed) words of the field
+        return {'query_string': {'query': query_string_wildcard(pattern), 'default_field': field,
+                                 'default_operator': 'AND', 'analyze_wildcard': True}}
+
 
 class BetweenOperator(Operator):
     name = 'BETWEEN'
@@ -63,6 +139,9 @@ class BetweenOperator(Operator):
     def __str__(self):
         return "%s:[%s TO %s]" % (self.operands[0], self.op(1), self.op(2))
 
+    def dsl(self, exact=()):
+        return {'range': {self.operands[0]: {'gte': self.operands[1], 'lte': self.operands[2]}}}
+
 
 class InOperator(Operator):
     name = 'IN'
@@ -73,6 +152,13 @@ class InOperator(Operator):
     def __str__(self):
         return "%s:(%s)" % (self.operands[0], ' OR '.join([self.val(x) for x in self.operands[1]]))
 
+    def dsl(self, exact=()):
+        field, values = self.operands
+
+        if field in exact:
+            return {'terms': {field: list(values)}}
+        return {'bool': {'should': [self.term(field, v, exact) for v in values], 'minimum_should_match': 1}}
+
 
 class AndOperator(Operator):
     def __init__(self, operands=None):
@@ -80,7 +166,10 @@ class AndOperator(Operator):
         self.operands = [x for x in operands[0] if not isinstance(x, basestring)]
 
     def __str__(self):
-        return ' AND '.join([self.val(x) for x in self.operands])
+        return ' AND '.join([self.group(x) for x in self.operands])
+
+    def dsl(self, exact=()):
+        return {'bool': {'must': [query_dsl(x, exact) for x in self.operands]}}
 
 
 class OrOperator(Operator):
@@ -89,7 +178,10 @@ class OrOperator(Operator):
         self.operands = [x for x in operands[0] if not isinstance(x, basestring)]
 
     def __str__(self):
-        return ' OR '.join([self.val(x) for x in self.operands])
+        return ' OR '.join([self.group(x) for x in self.operands])
+
+    def dsl(self, exact=()):
+        return {'bool': {'should': [query_dsl(x, exact) for x in self.operands], 'minimum_should_match': 1}}
 
 
 class NotOperator(Operator):
@@ -98,7 +190,10 @@ class NotOperator(Operator):
         self.operands = [operands[0][1]]
 
     def __str__(self):
-        return "NOT %s" % self.operands[0]
+        return "NOT %s" % self.group(self.operands[0])
+
+    def dsl(self, exact=()):
+        return {'bool': {'must_not': [query_dsl(self.operands[0], exact)]}}
 
 
 class QueryFilter(Operator):
@@ -107,7 +202,10 @@ class QueryFilter(Operator):
         self.operands = [operands[0]]
 
     def __str__(self):
-        return self.operands[0]
+        return str(self.operands[0])
+
+    def dsl(self, exact=()):
+        return query_dsl(self.operands[0], exact)
 
 
 class ExistFilter(Operator):
@@ -118,6 +216,9 @@ class ExistFilter(Operator):
     def __str__(self):
         return self.operands[0]
 
+    def dsl(self, exact=()):
+        return {'exists': {'field': self.operands[0]}}
+
 
 class MissingFilter(Operator):
     def __init__(self, operands=None):
@@ -127,6 +228,9 @@ class MissingFilter(Operator):
     def __str__(self):
         return self.operands[0]
 
+    def dsl(self, exact=()):
+        return {'bool': {'must_not': [{'exists': {'field': self.operands[0]}}]}}
+
 
 def makeGroupObject(cls):
     def groupAction(s, loc, tokens):
@@ -164,14 +268,19 @@ class ElseParserException(ParseBaseException):
     pass
 
 
-class ElseParser(object):
+def build_grammar():
+    """
+    Build the pyparsing grammar (on first use, since it takes a while) and return the statement parser
+    """
     # define SQL tokens
     selectStmt   = Forward()
     selectToken  = CaselessKeyword("SELECT")
+    distinctToken = CaselessKeyword("DISTINCT")
     facetToken   = CaselessKeyword("FACETS")
     scriptToken  = CaselessKeyword("SCRIPT")
     fromToken    = CaselessKeyword("FROM")
     whereToken   = CaselessKeyword("WHERE")
+    groupbyToken = CaselessKeyword("GROUP BY")
     orderbyToken = CaselessKeyword("ORDER BY")
     limitToken   = CaselessKeyword("LIMIT")
     between      = CaselessKeyword("BETWEEN")
@@ -188,16 +297,38 @@ class ElseParser(object):
 
     routingToken = CaselessKeyword("ROUTING")
 
+    joinToken    = CaselessKeyword("JOIN")
+    innerToken   = CaselessKeyword("INNER")
+    onToken      = CaselessKeyword("ON")
+    asToken      = CaselessKeyword("AS")
+
+    cacheToken    = CaselessKeyword("CACHE")
+    intoToken     = CaselessKeyword("INTO")
+    outfileToken  = CaselessKeyword("OUTFILE")
+    formatToken   = CaselessKeyword("FORMAT")
+    compressToken = CaselessKeyword("COMPRESS")
+
     ident          = Word(alphas + "_", alphanums + "_$").setName("identifier")
     columnName     = delimitedList(ident, ".", combine=True)
     columnNameList = Group(delimitedList(columnName))
     indexName      = delimitedList(ident, ".", combine=True)
 
+    # an index alias can't be one of the keywords that follow the index name
+    reserved       = (whereToken | filterToken | CaselessKeyword("GROUP") | CaselessKeyword("ORDER") | limitToken |
+                      routingToken | cacheToken | intoToken | joinToken | innerToken | onToken)
+
+    def aliasName(name):
+        return Optional(asToken).suppress() + ~reserved + ident.setResultsName(name)
+
     # likeExpression for SQL LIKE expressions
     likeExpr       = quotedString.setParseAction(removeQuotes)
 
     routingExpr    = quotedString.setParseAction(removeQuotes)
 
+    outfileExpr    = quotedString.setParseAction(removeQuotes)
+    formatExpr     = oneOf("csv ndjson tsv", caseless=True).setParseAction(lambda t: t[0].lower())
+    compressExpr   = CaselessKeyword("GZIP").setParseAction(lambda t: t[0].lower())
+
     E      = CaselessLiteral("E")
     binop  = oneOf("= >= <= < > <> != LT LTE LE GT GTE GE", caseless=True)
     lpar   = Suppress("(")
@@ -222,7 +353,7 @@ class ElseParser(object):
         | (columnName + in_.suppress() + lpar + delimitedList(columnRval) + rpar).setParseAction(makeGroupObject(InOperator)) \
         | (columnName + between.suppress() + columnRval + and_.suppress() + columnRval).setParseAction(makeGroupObject(BetweenOperator)) \
         | (columnName + likeop.suppress() + likeExpr).setParseAction(makeGroupObject(LikeOperator)) \
-        | Empty().setParseAction(invalidSyntax)
+        | (~lpar + Empty()).setParseAction(invalidSyntax)
 
     boolOperand = whereCondition | boolean
 
@@ -244,31 +375,59 @@ class ElseParser(object):
     limitoffset = intNum
     limitcount = intNum
 
-    # selectExpr  = ('count(*)' | columnNameList | '*')
-    selectExpr = (columnNameList | '*')
+    # aggregate functions, returned as "function(field)"
+    aggFunction = oneOf("count sum avg min max", caseless=True)
+    aggExpr = ((CaselessKeyword("COUNT") + lpar + "*" + rpar) |
+               (aggFunction + lpar + columnName + rpar)).setParseAction(lambda t: "%s(%s)" % (t[0].lower(), t[1]))
+
+    selectList = Group(delimitedList(aggExpr | columnName))
+
+    selectExpr = (selectList | '*')
     facetExpr = columnNameList
     scriptExpr = columnName + Suppress("=") + quotedString.setParseAction(removeQuotes)
+    joinExpr = Group(columnName + Suppress("=") + columnName)
 
     # define the grammar
     selectStmt << (selectToken +
+                   Optional(distinctToken.setResultsName("distinct")) +
                    selectExpr.setResultsName("fields") +
                    Optional(facetToken + facetExpr.setResultsName("facets")) +
                    Optional(scriptToken + scriptExpr.setResultsName("script")) +
                    fromToken + indexName.setResultsName("index") +
+                   Optional(aliasName("alias")) +
+                   Optional(Optional(innerToken) + joinToken + indexName.setResultsName("join_index") +
+                            Optional(aliasName("join_alias")) +
+                            onToken + joinExpr.setResultsName("join_on")) +
                    Optional(whereToken + whereExpression.setResultsName("query")) +
                    Optional(filterToken + filterExpression.setResultsName("filter")) +
+                   Optional(groupbyToken + columnNameList.setResultsName("groupby")) +
                    Optional(orderbyToken + orderList.setResultsName("order")) +
                    Optional(limitToken + Group(Optional(limitoffset + comma) + limitcount).setResultsName("limit")) +
-                   Optional(routingToken + routingExpr.setResultsName("routing")))
+                   Optional(routingToken + routingExpr.setResultsName("routing")) +
+                   Optional(cacheToken + intNum.setResultsName("cache")) +
+                   Optional(intoToken + outfileToken + outfileExpr.setResultsName("outfile") +
+                            Optional(formatToken + formatExpr.setResultsName("format")) +
+                            Optional(compressToken + compressExpr.setResultsName("compress"))))
 
-    grammar_parser = selectStmt
+    return selectStmt
+
+
+class ElseParser(object):
+    grammar_parser = None
+
+    @staticmethod
+    def grammar():
+        if ElseParser.grammar_parser is None:
+            ElseParser.grammar_parser = build_grammar()
+        return ElseParser.grammar_parser
 
     @staticmethod
     def parse(stmt, debug=False):
-        ElseParser.grammar_parser.setDebug(debug)
+        grammar = ElseParser.grammar()
+        grammar.setDebug(debug)
 
         try:
-            return ElseParser.grammar_parser.parseString(stmt, parseAll=True)
+            return grammar.parseString(stmt, parseAll=True)
         except (ParseException, ParseFatalException) as err:
             raise ElseParserException(err.pstr, err.loc, err.msg, err.parserElement)
 
@@ -280,10 +439,12 @@ class ElseParser(object):
         try:
             response = ElseParser.parse(stmt)
             print("index  = ", response.index)
+            print("join   = ", response.join_index, response.join_on)
             print("fields = ", response.fields)
             print("query  = ", response.query)
             print("script = ", response.script)
             print("filter = ", response.filter)
+            print("groupby = ", response.groupby)
             print("order  = ", response.order)
             print("limit  = ", response.limit)
             print("facets = ", response.facets)
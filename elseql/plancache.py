@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+#
+# A cache of compiled query plans, keyed on the statement with its literals
+# replaced by placeholders.
+#
+# On a miss the normalized statement is parsed and compiled once into a request
+# template where every literal is a placeholder; on a hit the template is
+# copied and the literals of the new statement are bound into it.
+#
+
+from __future__ import print_function
+
+import re
+import time
+
+from collections import OrderedDict
+
+DEFAULT_SIZE = 256
+
+PLACEHOLDER = "\x01%d\x01"
+
+_placeholder_re = re.compile("\x01(\\d+)\x01")
+
+_token_re = re.compile(r'''
+      (?P<space>\s+)
+    | (?P<string>"(?:[^"\n\r\\]|""|\\.)*"|'(?:[^'\n\r\\]|''|\\.)*')
+    | (?P<number>[+-]?(?:\d+\.\d*|\.\d+|\d+)(?:[eE][+-]?\d+)?)
+    | (?P<word>[A-Za-z_][\w$]*)
+    | (?P<other>.)
+    ''', re.VERBOSE | re.DOTALL)
+
+
+def _number(s):
+    try:
+        return int(s)
+    except ValueError:
+        return float(s)
+
+
+def _render(v):
+    return v if isinstance(v, basestring) else str(v)
+
+
+def lift_literals(stmt):
+    """
+    Return (normalized statement, literals), where the string and number literals
+    in the statement are replaced by quoted placeholders.
+
+    Literals that change the shape of the request (LIKE patterns, LIMIT and CACHE values)
+    are kept in the normalized statement.
+    """
+    parts = []
+    literals = []
+    prev = None
+    in_limit = False
+
+    for m in _token_re.finditer(stmt):
+        kind = m.lastgroup
+        text = m.group(kind)
+
+        if kind == 'space':
+            parts.append(' ')
+            continue
+
+        if kind == 'word':
+            word = text.lower()
+            if word in ('limit', 'cache'):
+                in_limit = True
+            elif word == 'routing':
+                in_limit = False
+            prev = word
+
+        elif kind == 'string' and prev != 'like':
+            literals.append(text[1:-1])
+            text = '"%s"' % (PLACEHOLDER % (len(literals) - 1))
+
+        elif kind == 'number' and not in_limit and prev != 'like':
+            if parts and _token_re.match(parts[-1]).lastgroup in ('word', 'string') and text[0] in '+-':
+                # an arithmetic sign, not part of the number
+                pass
+            else:
+                literals.append(_number(text))
+                text = '"%s"' % (PLACEHOLDER % (len(literals) - 1))
+
+        if kind != 'word':
+            prev = text
+
+        parts.append(text)
+
+    return "".join(parts).strip(), literals
+
+
+def bind(template, literals):
+    """
+    Return a copy of template with all placeholders replaced by the literal values.
+    A string that is exactly a placeholder takes the literal value (and type).
+    """
+    if isinstance(template, dict):
+        return dict((k, bind(v, literals)) for k, v in template.iteritems())
+
+    if isinstance(template, list):
+        return [bind(v, literals) for v in template]
+
+    if isinstance(template, basestring) and "\x01" in template:
+        m = _placeholder_re.match(template)
+        if m and m.end() == len(template):
+            return literals[int(m.group(1))]
+
+        return _placeholder_re.sub(lambda m: _render(literals[int(m.group(1))]), template)
+
+    return template
+
+
+class PlanCache(object):
+
+    def __init__(self, size=DEFAULT_SIZE):
+        self.size = size
+        self.plans = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.compiles = 0
+        self.compile_time = 0.0
+        self.bind_time = 0.0
+
+    def __len__(self):
+        return len(self.plans)
+
+    def clear(self):
+        self.plans.clear()
+
+    def get(self, key, literals):
+        plan = self.plans.pop(key, None)
+        if plan is None:
+            self.misses += 1
+            return None
+
+        self.plans[key] = plan  # move to the end (most recently used)
+        self.hits += 1
+
+        start = time.time()
+        plan = bind(plan, literals)
+        self.bind_time += time.time() - start
+        return plan
+
+    def put(self, key, plan, elapsed=0.0):
+        self.compiles += 1
+        self.compile_time += elapsed
+
+        if self.size <= 0:
+            return
+
+        self.plans.pop(key, None)
+        self.plans[key] = plan
+
+        while len(self.plans) > self.size:
+            self.plans.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        avg_compile = self.compile_time / self.compiles if self.compiles else 0.0
+
+        return OrderedDict([
+            ('size', len(self.plans)),
+            ('max size', self.size),
+            ('hits', self.hits),
+            ('misses', self.misses),
+            ('evictions', self.evictions),
+            ('avg compile (ms)', round(avg_compile * 1000, 3)),
+            ('time saved (ms)', round((avg_compile * self.hits - self.bind_time) * 1000, 3)),
+        ])
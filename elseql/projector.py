@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+#
+# Row projectors: functions compiled once per query that return the values of a fixed list of
+# columns for each search hit, from the _source (a.b.c is the path of a value in nested objects),
+# from doc values or stored fields, or from the hit metadata (_id, _index, ...).
+#
+
+from __future__ import print_function
+
+from operator import itemgetter
+
+from mapping import doc_types, field_paths
+
+METADATA = set(['_id', '_index', '_type', '_score', '_routing', '_version'])
+
+_EMPTY = {}
+
+# rough size in memory of a row (a tuple of values), besides its strings
+ROW_SIZE = 64
+VALUE_SIZE = 24
+
+
+def source_columns(mapping):
+    """
+    Return the sorted list of the full paths of the (leaf) fields of an index mapping, for all the document types.
+    Objects that are not indexed (enabled: false) are a single column
+    """
+    columns = set()
+
+    for m in mapping.itervalues():
+        for t, document in doc_types(m).iteritems():
+            for path, prop in field_paths(document):
+                if 'properties' not in prop:
+                    columns.add(path)
+
+    return sorted(columns)
+
+
+def _paths(source, prefix=''):
+    paths = []
+
+    for k, v in source.iteritems():
+        if isinstance(v, dict) and v:
+            paths.extend(_paths(v, prefix + k + '.'))
+        else:
+            paths.append(prefix + k)
+
+    return paths
+
+
+def hit_columns(hit):
+    """
+    Return the sorted list of the paths of the values in the _source of a hit (when the mapping is not available)
+    """
+    return sorted(_paths(hit.get('_source') or _EMPTY))
+
+
+def unwrap(values):
+    # doc values and stored fields are returned as a list, even for single values
+    if isinstance(values, list) and len(values) == 1:
+        return values[0]
+    return values
+
+
+def row_size(row):
+    """
+    Return an estimate of the memory used by a row (for the memory budget of joins and sorts)
+    """
+    return ROW_SIZE + sum(len(v) if isinstance(v, basestring) else VALUE_SIZE for v in row)
+
+
+def path_getter(path):
+    """
+    Return a function returning the value of path in a _source (a list for paths inside arrays of objects)
+    """
+    keys = path.split('.')
+
+    if len(keys) == 1:
+        return lambda source: source.get(path)
+
+    def get(source):
+        # a dotted name can also be a key of the _source
+        if path in source:
+            return source[path]
+
+        value = source
+        for k in keys:
+            if isinstance(value, dict):
+                value = value.get(k)
+            elif isinstance(value, list):
+                value = [v.get(k) for v in value if isinstance(v, dict)] or None
+            else:
+                return None
+
+        return value
+
+    return get
+
+
+def column_getter(column, fields):
+    # a function returning the value of column for a hit
+    if column in METADATA:
+        return lambda hit: hit.get(column)
+
+    if column in fields:
+        return lambda hit: unwrap((hit.get('fields') or _EMPTY).get(column))
+
+    get = path_getter(column)
+    return lambda hit: get(hit.get('_source') or _EMPTY)
+
+
+def source_projector(keys):
+    # itemgetter when the _source has all the columns (the usual case), dict.get when some are missing
+    get = itemgetter(*keys)
+    single = len(keys) == 1
+
+    def project(hit):
+        source = hit.get('_source') or _EMPTY
+        try:
+            row = get(source)
+        except KeyError:
+            return map(source.get, keys)
+        return (row,) if single else row
+
+    return project
+
+
+def compile_projector(columns, fields=()):
+    """
+    Return a function returning the row of values of columns for a hit. The columns in fields are read
+    from the hit "fields" (doc values, or stored fields before 5.0), metadata columns from the hit
+    and the other ones from the _source
+    """
+    if not any(c in METADATA or c in fields or '.' in c for c in columns):
+        # all top level _source fields
+        return source_projector(list(columns))
+
+    getters = [column_getter(c, fields) for c in columns]
+    return lambda hit: [get(hit) for get in getters]
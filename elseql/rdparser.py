@@ -0,0 +1,412 @@
+#!/usr/bin/env python
+#
+# A hand-written tokenizer and recursive-descent parser for the ElseQL select statement.
+#
+# It accepts the same language as the pyparsing grammar in parser.py and builds the same
+# operator tree, but it doesn't need to build the grammar at import time and it doesn't
+# backtrack, so it's much faster on long AND/OR chains and large IN lists.
+#
+
+from __future__ import print_function
+
+import re
+
+from parser import (ElseParserException, BinaryOperator, LikeOperator, BetweenOperator, InOperator,
+                    AndOperator, OrOperator, NotOperator, QueryFilter, ExistFilter, MissingFilter)
+
+STRING, REAL, INT, WORD, OP, PUNCT, END = 'string', 'real', 'int', 'word', 'op', 'punct', 'end'
+
+_token_re = re.compile(r'''
+      (?P<string>"(?:[^"\n\r\\]|""|\\(?:[^x]|x[0-9a-fA-F]+))*"|'(?:[^'\n\r\\]|''|\\(?:[^x]|x[0-9a-fA-F]+))*')
+    | (?P<real>[+-]?(?:\d+\.\d*|\.\d+)(?:[eE][+-]?\d+)?)
+    | (?P<int>[+-]?\d+(?:[eE]\+?\d+)?)
+    | (?P<word>[A-Za-z_][A-Za-z0-9_$]*(?:\.[A-Za-z_][A-Za-z0-9_$]*)*)
+    | (?P<op>>=|<=|<>|!=|=|<|>)
+    | (?P<punct>[(),*])
+    ''', re.VERBOSE)
+
+_space_re = re.compile(r'\s*')
+
+AGGREGATES = set(['count', 'sum', 'avg', 'min', 'max'])
+
+FORMATS = set(['csv', 'ndjson', 'tsv'])
+
+BINOPS = set(['=', '>=', '<=', '<', '>', '<>', '!=', 'LT', 'LTE', 'LE', 'GT', 'GTE', 'GE'])
+
+# the keywords that can follow an index name (so they are not an alias)
+RESERVED = set(['WHERE', 'FILTER', 'GROUP', 'ORDER', 'LIMIT', 'ROUTING', 'CACHE', 'INTO', 'JOIN', 'INNER', 'ON'])
+
+
+def tokenize(stmt):
+    """
+    Return the list of (kind, text, position) tokens in stmt, terminated by an END token.
+    """
+    tokens = []
+    pos = _space_re.match(stmt).end()
+    end = len(stmt)
+
+    while pos < end:
+        m = _token_re.match(stmt, pos)
+        if not m:
+            raise ElseParserException(stmt, pos, "Invalid character %r" % stmt[pos])
+
+        tokens.append((m.lastgroup, m.group(), pos))
+        pos = _space_re.match(stmt, m.end()).end()
+
+    tokens.append((END, '', end))
+    return tokens
+
+
+class Statement(object):
+    """
+    The parsed select statement, with the same attributes as the pyparsing results
+    (missing clauses are empty strings)
+    """
+
+    def __init__(self):
+        self.distinct = ''
+        self.fields = ''
+        self.facets = ''
+        self.script = ''
+        self.index = ''
+        self.alias = ''
+        self.join_index = ''
+        self.join_alias = ''
+        self.join_on = ''
+        self.query = ''
+        self.filter = ''
+        self.groupby = ''
+        self.order = ''
+        self.limit = ''
+        self.routing = ''
+        self.cache = ''
+        self.outfile = ''
+        self.format = ''
+        self.compress = ''
+
+    def __repr__(self):
+        return "Statement(%r)" % self.__dict__
+
+
+class RDParser(object):
+
+    def __init__(self, stmt):
+        self.stmt = stmt
+        self.tokens = tokenize(stmt)
+        self.pos = 0
+
+    @staticmethod
+    def parse(stmt, debug=False):
+        return RDParser(stmt).select_stmt()
+
+    #
+    # token helpers
+    #
+
+    def error(self, msg, token=None):
+        kind, text, loc = token or self.tokens[self.pos]
+        if kind != END:
+            msg = "%s, found %r" % (msg, text)
+        raise ElseParserException(self.stmt, loc, msg)
+
+    def peek(self):
+        return self.tokens[self.pos]
+
+    def next(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def is_keyword(self, keyword, offset=0):
+        kind, text, _ = self.tokens[self.pos + offset]
+        return kind == WORD and text.upper() == keyword
+
+    def accept_keyword(self, keyword):
+        if self.is_keyword(keyword):
+            self.pos += 1
+            return True
+        return False
+
+    def expect_keyword(self, keyword):
+        if not self.accept_keyword(keyword):
+            self.error('Expected "%s"' % keyword)
+
+    def accept_punct(self, punct):
+        kind, text, _ = self.tokens[self.pos]
+        if kind == PUNCT and text == punct:
+            self.pos += 1
+            return True
+        return False
+
+    def expect_punct(self, punct):
+        if not self.accept_punct(punct):
+            self.error('Expected "%s"' % punct)
+
+    def accept_order_by(self):
+        if self.is_keyword('ORDER') and self.is_keyword('BY', 1):
+            self.pos += 2
+            return True
+        return False
+
+    #
+    # terminals
+    #
+
+    def column_name(self):
+        kind, text, _ = self.peek()
+        if kind != WORD:
+            self.error("Expected identifier")
+        self.pos += 1
+        return text
+
+    def select_item(self):
+        kind, text, _ = self.peek()
+
+        if kind == WORD and text.lower() in AGGREGATES and self.tokens[self.pos + 1][1] == '(':
+            self.pos += 2
+            if text.lower() == 'count' and self.accept_punct('*'):
+                field = '*'
+            else:
+                field = self.column_name()
+            self.expect_punct(')')
+            return "%s(%s)" % (text.lower(), field)
+
+        return self.column_name()
+
+    def alias(self):
+        required = self.accept_keyword('AS')
+
+        kind, text, _ = self.peek()
+        if kind != WORD or text.upper() in RESERVED or '.' in text:
+            if required or (kind == WORD and '.' in text):
+                self.error("Expected identifier")
+            return ''
+
+        self.pos += 1
+        return text
+
+    def column_list(self):
+        names = [self.column_name()]
+        while self.accept_punct(','):
+            names.append(self.column_name())
+        return names
+
+    def string(self):
+        kind, text, _ = self.peek()
+        if kind != STRING:
+            self.error("Expected quotedString")
+        self.pos += 1
+        return text[1:-1]
+
+    def int_value(self):
+        token = self.peek()
+        if token[0] != INT:
+            self.error("Expected integer")
+        self.pos += 1
+        try:
+            return int(token[1])
+        except ValueError:
+            self.error("Invalid integer", token)
+
+    def value(self):
+        token = self.next()
+        kind, text, _ = token
+
+        if kind == REAL:
+            return float(text)
+        if kind == INT:
+            try:
+                return int(text)
+            except ValueError:
+                self.error("Invalid integer", token)
+        if kind == STRING:
+            return text[1:-1]
+        if kind == WORD and text.lower() in ('true', 'false'):
+            return text.lower() == 'true'
+
+        self.pos -= 1
+        self.error("Expected value")
+
+    #
+    # where expression
+    #
+    # note that (like in the pyparsing grammar) OR has higher precedence than AND
+    #
+
+    def where_expression(self):
+        if self.peek()[0] == STRING:
+            return self.string()
+        return self.and_expression()
+
+    def and_expression(self):
+        operands = [self.or_expression()]
+        while self.accept_keyword('AND'):
+            operands.append(self.or_expression())
+        return operands[0] if len(operands) == 1 else AndOperator([operands])
+
+    def or_expression(self):
+        operands = [self.not_expression()]
+        while self.accept_keyword('OR'):
+            operands.append(self.not_expression())
+        return operands[0] if len(operands) == 1 else OrOperator([operands])
+
+    def not_expression(self):
+        if self.accept_keyword('NOT'):
+            return NotOperator([['NOT', self.not_expression()]])
+
+        if self.accept_punct('('):
+            expr = self.and_expression()
+            self.expect_punct(')')
+            return expr
+
+        return self.condition()
+
+    def condition(self):
+        if self.peek()[0] != WORD:
+            self.error("Invalid Syntax")
+
+        name = self.column_name()
+        kind, text, _ = self.peek()
+
+        if kind == OP or (kind == WORD and text.upper() in BINOPS):
+            self.pos += 1
+            return BinaryOperator([name, text.upper(), self.value()])
+
+        if self.accept_keyword('IN'):
+            self.expect_punct('(')
+            values = [self.value()]
+            while self.accept_punct(','):
+                values.append(self.value())
+            self.expect_punct(')')
+            return InOperator([name] + values)
+
+        if self.accept_keyword('BETWEEN'):
+            low = self.value()
+            self.expect_keyword('AND')
+            return BetweenOperator([name, low, self.value()])
+
+        if self.accept_keyword('LIKE'):
+            return LikeOperator([name, self.string()])
+
+        self.error("Invalid Syntax")
+
+    def filter_expression(self):
+        if self.accept_keyword('QUERY'):
+            return QueryFilter([self.where_expression()])
+        if self.accept_keyword('EXIST'):
+            return ExistFilter([self.column_name()])
+        if self.accept_keyword('MISSING'):
+            return MissingFilter([self.column_name()])
+
+        self.error('Expected "QUERY", "EXIST" or "MISSING"')
+
+    def order_list(self):
+        order = []
+        while True:
+            name = self.column_name()
+            seq = 'asc'
+            if self.is_keyword('ASC') or self.is_keyword('DESC'):
+                seq = self.next()[1].lower()
+            order.append([name, seq])
+
+            if not self.accept_punct(','):
+                return order
+
+    #
+    # select statement
+    #
+
+    def join_clause(self, result):
+        result.join_index = self.column_name()
+        result.join_alias = self.alias()
+
+        self.expect_keyword('ON')
+        left = self.column_name()
+
+        kind, text, _ = self.peek()
+        if kind != OP or text != '=':
+            self.error('Expected "="')
+        self.pos += 1
+
+        result.join_on = [left, self.column_name()]
+
+    def select_stmt(self):
+        result = Statement()
+
+        self.expect_keyword('SELECT')
+
+        if self.accept_keyword('DISTINCT'):
+            result.distinct = 'DISTINCT'
+
+        if self.accept_punct('*'):
+            result.fields = ['*']
+        else:
+            result.fields = [self.select_item()]
+            while self.accept_punct(','):
+                result.fields.append(self.select_item())
+
+        if self.accept_keyword('FACETS'):
+            result.facets = self.column_list()
+
+        if self.accept_keyword('SCRIPT'):
+            name = self.column_name()
+            kind, text, _ = self.peek()
+            if kind != OP or text != '=':
+                self.error('Expected "="')
+            self.pos += 1
+            result.script = [name, self.string()]
+
+        self.expect_keyword('FROM')
+        result.index = self.column_name()
+        result.alias = self.alias()
+
+        if self.accept_keyword('INNER'):
+            self.expect_keyword('JOIN')
+            self.join_clause(result)
+        elif self.accept_keyword('JOIN'):
+            self.join_clause(result)
+
+        if self.accept_keyword('WHERE'):
+            result.query = self.where_expression()
+
+        if self.accept_keyword('FILTER'):
+            result.filter = self.filter_expression()
+
+        if self.is_keyword('GROUP') and self.is_keyword('BY', 1):
+            self.pos += 2
+            result.groupby = self.column_list()
+
+        if self.accept_order_by():
+            result.order = self.order_list()
+
+        if self.accept_keyword('LIMIT'):
+            limit = [self.int_value()]
+            if self.accept_punct(','):
+                limit.append(self.int_value())
+            result.limit = limit
+
+        if self.accept_keyword('ROUTING'):
+            result.routing = self.string()
+
+        if self.accept_keyword('CACHE'):
+            result.cache = self.int_value()
+
+        if self.accept_keyword('INTO'):
+            self.expect_keyword('OUTFILE')
+            result.outfile = self.string()
+
+            if self.accept_keyword('FORMAT'):
+                kind, text, _ = self.peek()
+                if kind != WORD or text.lower() not in FORMATS:
+                    self.error('Expected "csv", "ndjson" or "tsv"')
+                self.pos += 1
+                result.format = text.lower()
+
+            if self.accept_keyword('COMPRESS'):
+                self.expect_keyword('GZIP')
+                result.compress = 'gzip'
+
+        if self.peek()[0] != END:
+            self.error("Expected end of text")
+
+        return result
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+#
+# A client-side cache of search results, for statements that are executed over and over.
+#
+# Results are keyed on the request (path, including the index, parameters, including routing, and body)
+# and stored serialized, as the list of result pages. Entries expire after a TTL and the
+# least recently used entries are evicted when the cache is over its size limit (in bytes).
+#
+
+from __future__ import print_function
+
+import hashlib
+import json
+import time
+
+from collections import OrderedDict
+
+DEFAULT_TTL = 300
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def cache_key(path, params, data):
+    request = json.dumps([path, params, data], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(request).hexdigest()
+
+
+def is_error(result):
+    return 'error' in result or result.get('_shards', {}).get('failures')
+
+
+class ResultCache(object):
+
+    def __init__(self, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key: (expires, size, [page, ...])
+        self.bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.bytes_saved = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def remove(self, key):
+        expires, size, pages = self.entries.pop(key)
+        self.bytes -= size
+
+    def get(self, key):
+        """
+        Return the (decoded) result pages for key, or None
+        """
+        entry = self.entries.get(key)
+
+        if entry and entry[0] < time.time():
+            self.remove(key)
+            self.expired += 1
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.entries[key] = self.entries.pop(key)  # move to the end (most recently used)
+        self.hits += 1
+        self.bytes_saved += entry[1]
+
+        return [json.loads(page) for page in entry[2]]
+
+    def put(self, key, pages, size, ttl=None):
+        """
+        Add the (serialized) result pages for key, evicting the least recently used entries if needed
+        """
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0 or size > self.max_bytes:
+            return
+
+        if key in self.entries:
+            self.remove(key)
+
+        self.entries[key] = (time.time() + ttl, size, pages)
+        self.bytes += size
+
+        while self.bytes > self.max_bytes:
+            self.remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def record(self, key, pages, ttl=None):
+        """
+        Yield the result pages, and cache them if they are all returned (and there were no errors)
+        """
+        cached = []
+        size = 0
+
+        for page in pages:
+            if cached is not None:
+                if is_error(page):
+                    cached = None
+                else:
+                    cached.append(json.dumps(page, separators=(',', ':')))
+                    size += len(cached[-1])
+
+                    if size > self.max_bytes:
+                        cached = None
+
+            yield page
+
+        if cached:
+            self.put(key, cached, size, ttl)
+
+    def stats(self):
+        return OrderedDict([
+            ('entries', len(self.entries)),
+            ('bytes', self.bytes),
+            ('max bytes', self.max_bytes),
+            ('ttl (s)', self.ttl),
+            ('hits', self.hits),
+            ('misses', self.misses),
+            ('expired', self.expired),
+            ('evictions', self.evictions),
+            ('bytes saved', self.bytes_saved),
+        ])
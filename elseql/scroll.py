@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+#
+# Run a set of page generators (i.e. the slices of a sliced scroll) on a pool of worker
+# threads and merge their pages, in arrival order, into a single generator, or prefetch
+# the pages of a single generator in the background.
+#
+# PageSizer tunes the number of documents per page from the observed page latency and size.
+#
+
+from __future__ import print_function
+
+import threading
+
+try:  # for Python 3
+    from queue import Queue, Full
+except ImportError:
+    from Queue import Queue, Full
+
+_DONE = object()
+
+# adaptive page size: target time and (decoded) size of a page, and the page size limits
+PAGE_TIME = 1.0
+PAGE_BYTES = 32 * 1024 * 1024
+MIN_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 10000
+
+
+def _put(queue, item, stop):
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=0.1)
+            return True
+        except Full:
+            pass
+
+    return False
+
+
+def parallel_pages(sources, queue_size=None):
+    """
+    Run each source (a function returning an iterator of pages) in its own thread and yield the pages
+    as they arrive. Each page is returned as (source-index, page).
+
+    Exceptions raised by a source are re-raised in the caller. Closing the generator stops the workers.
+    """
+    queue = Queue(maxsize=queue_size or 2 * len(sources))
+    stop = threading.Event()
+
+    def worker(n, source):
+        pages = None
+        try:
+            pages = source()
+            for page in pages:
+                if not _put(queue, (n, page), stop):
+                    return
+        except Exception as err:
+            _put(queue, (n, err), stop)
+        finally:
+            # let the source clean up (i.e. clear its scroll) in this thread
+            if hasattr(pages, 'close'):
+                pages.close()
+            _put(queue, (n, _DONE), stop)
+
+    threads = [threading.Thread(target=worker, args=(n, source)) for n, source in enumerate(sources)]
+    for t in threads:
+        t.daemon = True
+        t.start()
+
+    running = len(threads)
+
+    try:
+        while running:
+            n, page = queue.get()
+
+            if page is _DONE:
+                running -= 1
+            elif isinstance(page, Exception):
+                raise page
+            else:
+                yield n, page
+    finally:
+        stop.set()
+
+
+def prefetch_pages(source, depth=1):
+    """
+    Run source (a function returning an iterator of pages) in a background thread, fetching up to {depth}
+    pages ahead of the caller, so that the next page is requested while the current one is processed.
+
+    Closing the generator stops the fetcher (after the request in progress, if any).
+    """
+    pages = parallel_pages([source], depth)
+
+    try:
+        for _, page in pages:
+            yield page
+    finally:
+        pages.close()
+
+
+class PageSizer(object):
+    """
+    Estimate, for each key (i.e. the index), the time and bytes per document of the pages fetched so far
+    and return the page size that should take about {target} seconds (and stay under {max_bytes})
+    """
+
+    def __init__(self, target=PAGE_TIME, max_bytes=PAGE_BYTES, min_size=MIN_PAGE_SIZE, max_size=MAX_PAGE_SIZE):
+        self.target = target
+        self.max_bytes = max_bytes
+        self.min_size = min_size
+        self.max_size = max_size
+        self.estimates = {}  # key: (seconds per document, bytes per document)
+        self.lock = threading.Lock()
+
+    def observe(self, key, docs, elapsed, size):
+        if docs <= 0:
+            return
+
+        sample = (elapsed / docs, float(size) / docs)
+
+        with self.lock:
+            previous = self.estimates.get(key)
+            if previous:
+                # moving average, so that a single slow page doesn't shrink the next ones too much
+                sample = tuple((p + s) / 2 for p, s in zip(previous, sample))
+            self.estimates[key] = sample
+
+    def size(self, key, default):
+        """
+        Return the page size for key, or default if no page was observed yet
+        """
+        estimate = self.estimates.get(key)
+        if not estimate:
+            return default
+
+        per_doc, bytes_per_doc = estimate
+        size = self.target / per_doc if per_doc else self.max_size
+        if bytes_per_doc:
+            size = min(size, self.max_bytes / bytes_per_doc)
+
+        return int(max(self.min_size, min(self.max_size, size)))
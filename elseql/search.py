@@ -2,11 +2,26 @@
 
 from __future__ import print_function
 
-from requests.exceptions import ConnectionError
-
-from parser import ElseParser, ElseParserException
-import rawes
+from requests.exceptions import ConnectionError, Timeout
+
+from parser import ElseParser, ElseParserException, Operator, query_dsl, keyword_field
+from rdparser import RDParser
+from plancache import PlanCache, lift_literals, bind
+from output import open_output, csval
+from scroll import parallel_pages, prefetch_pages, PageSizer
+from transport import get_transport
+from mapping import MappingCache, doc_types, field_paths, exact_fields, docvalue_fields
+from completion import Completer, from_index
+from jsonstream import HitStream
+from projector import METADATA, source_columns, hit_columns, compile_projector
+from join import JoinError, JOIN_MEMORY, side_names, resolve, split_conditions, hash_join
+from sorter import RowSorter, SortError, SORT_MEMORY
+from resultcache import ResultCache, cache_key
+from timing import Timing, format_profile
 import pprint
+import re
+import threading
+import time
 
 try:  # for Python 3
     from http.client import HTTPConnection
@@ -14,47 +29,152 @@ except ImportError:
     from httplib import HTTPConnection
 
 DEFAULT_PORT = 'localhost:9200'
+DEFAULT_PARSER = 'pyparsing'
+
+# sorted queries that need more than PAGE_SIZE results are paged with search_after
+# (and composite aggregations return PAGE_SIZE buckets at a time)
+PAGE_SIZE = 1000
+
+# search_after pages are searched in a point in time since 7.12, opened with these search parameters
+PIT_VERSION = [7, 12]
+PIT_PARAMS = ('routing', 'preference')
+
+# the number of terms buckets per group column, when composite aggregations are not available
+MAX_BUCKETS = 10000
+
+# how the selected columns are fetched: from doc values when they all have (lossless) doc values,
+# from the _source, or from doc values when available
+PROJECTIONS = ('auto', 'source', 'docvalues')
+
+# how long scroll contexts are kept alive between pages (they are cleared when the statement completes)
+SCROLL_KEEPALIVE = '1m'
+
+# number of pages fetched ahead of rendering (for scroll, search_after and composite requests)
+PREFETCH = 1
+
+# "function(field)" select expressions and the corresponding ElasticSearch metric aggregations
+_aggregate_re = re.compile(r'^(count|sum|avg|min|max)\((.+)\)$')
+
+AGGREGATES = {
+    'count': 'value_count',
+    'sum': 'sum',
+    'avg': 'avg',
+    'min': 'min',
+    'max': 'max'
+}
+
+PARSERS = {
+    'pyparsing': ElseParser,
+    'rd': RDParser
+}
+
+
+def _total(total):
+    # since 7.0 hits.total is an object
+    return total['value'] if isinstance(total, dict) else total
+
+
+def _seconds(duration):
+    # an ElasticSearch time value (30s, 1m, ...) in seconds
+    m = re.match(r'^(\d+)(ms|s|m|h|d)$', duration)
+    return int(m.group(1)) * {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}[m.group(2)]
+
+
+def outfile(request):
+    # the output of INTO OUTFILE
+    if not request.outfile:
+        return None
+
+    return {'path': request.outfile, 'format': request.format or 'csv', 'compress': request.compress or None,
+            'text': False}
 
 
-def _csval(v):
-    if not v:
-        return ''
+def hit_batches(hits):
+    # streamed responses are read a batch of hits at a time
+    return hits.batches() if isinstance(hits, HitStream) else [hits]
 
-    if not isinstance(v, basestring):
-        return str(v)
 
-    if v.isalnum():
-        return v
+def agg_rows(result, aggs):
+    """
+    Return the rows for the aggregations in a search result (one per bucket)
+    """
+    aggregations = result.get('aggregations', {})
 
-    return '"%s"' % v.replace('"', '""')
+    def row(keys, bucket):
+        values = []
+        for kind, arg in aggs['columns']:
+            if kind == 'key':
+                values.append(keys[arg])
+            elif kind == 'count':
+                values.append(bucket['doc_count'])
+            else:
+                values.append(bucket[arg]['value'])
+        return values
+
+    if aggs['mode'] == 'metrics':
+        return [row([], dict(aggregations, doc_count=_total(result['hits']['total'])))]
+
+    if aggs['mode'] == 'composite':
+        return [row([b['key']['g%d' % n] for n in range(aggs['groups'])], b)
+                for b in aggregations['groups']['buckets']]
 
+    rows = []
+
+    def walk(agg, n, keys):
+        for b in agg['g%d' % n]['buckets']:
+            bkeys = keys + [b.get('key_as_string', b['key'])]
+            if n + 1 == aggs['groups']:
+                rows.append(row(bkeys, b))
+            else:
+                walk(b, n + 1, bkeys)
 
-def _csvline(l):
-    try:
-        return ",".join([_csval(v).encode("utf-8") for v in l])
-    except UnicodeDecodeError:
-        raise Exception("UnicodeDecodeError for %s" % l)
+    walk(aggregations, 0, [])
+    return rows
 
 
 class ElseSearch(object):
 
-    def __init__(self, port=None, debug=False):
+    def __init__(self, port=None, debug=False, creds=None, mappings=True):
         self.debug = debug
         self.print_query = False
 
         self.es = None
-        self.mapping = None
-        self.keywords = None
+        self.mappings = None
+        self.completer = Completer()
         self.host = None
         self.version = None
         self.v5 = None
+        self.major = None
+        self.plan_cache = PlanCache()
+        self.parser = DEFAULT_PARSER
+        self.output = None
+        self.slices = 1
+        self.prefetch = PREFETCH
+        self.keepalive = SCROLL_KEEPALIVE
+        self.adaptive = False
+        self.projection = 'auto'
+        self.page_sizer = PageSizer()
+        self.join_memory = JOIN_MEMORY
+        self.sort_memory = SORT_MEMORY
+        self.scrolls = set()  # open scroll contexts
+        self.scroll_lock = threading.Lock()
+        self.stream = False
+        self.cache = False
+        self.dsl = True
+        self.timing = False
+        self.result_cache = ResultCache()
 
         if port:
             try:
-                self.es = rawes.Elastic(port, headers={'content-type': 'application/json'})
-                self.get_mapping()
-                self.get_version()
-            except ConnectionError as err:
+                self.es = get_transport(port, creds)
+
+                if self.get_version():
+                    self.host = self.es.url
+
+                    # without mappings, conditions compile to match queries and projections to the _source
+                    if mappings:
+                        self.mappings = MappingCache(self.es, self.host)
+            except (ConnectionError, Timeout) as err:
                 print("init: cannot connect to", port)
                 print(err)
 
@@ -66,92 +186,246 @@ class ElseSearch(object):
             try:
                 info = self.es.get("")
                 self.version = info["version"]["number"]
-                self.v5 = self.version[:2] >= "5."
-            except ConnectionError as err:
+                self.major = int(self.version.split(".")[0])
+                self.v5 = self.major >= 5
+            except (ConnectionError, Timeout) as err:
                 print("mapping: cannot connect to", self.es.url)
                 print(err)
 
         return self.version
 
-    def get_mapping(self):
-        if not self.mapping:
-            try:
-                self.mapping = self.es.get("_mapping")
-                self.keywords = []
-                self.host = self.es.url
-            except ConnectionError as err:
-                print("mapping: cannot connect to", self.es.url)
-                print(err)
+    def has_pit(self):
+        return bool(self.version) and [int(x) for x in self.version.split('.')[:2]] >= PIT_VERSION
 
-        return self.mapping
+    def sniff(self):
+        """
+        Discover the nodes of the cluster (from _nodes/http) to spread the requests across them,
+        return the list of node urls
+        """
+        if not self.es:
+            return []
 
-    def get_keywords(self):
-        if self.keywords:
-            return self.keywords
+        try:
+            return self.es.sniff()
+        except (ConnectionError, Timeout) as err:
+            print("sniff: cannot connect to", self.es.url)
+            print(err)
 
-        keywords = ['facets', 'filter', 'query', 'exist', 'missing', 'script',
-                    'from', 'where', 'in', 'between', 'like', 'order by', 'limit', 'and', 'or', 'not']
+        return []
 
-        if not self.mapping:
-            return sorted(keywords)
+    def get_mapping(self, index=None):
+        """
+        Return the mapping for index (loaded and cached on first use) or the full cluster mapping
+        """
+        if not self.mappings:
+            return None
 
-        def add_properties(plist, doc):
-            if 'properties' in doc:
-                props = doc['properties']
+        try:
+            if index:
+                mapping = self.mappings.get(index)
 
-                for p in props:
-                    plist.append(p)  # property name
-                    add_properties(plist, props[p])
+                if mapping and not self.completer.has_mapping(index):
+                    self.completer.add_mapping(index, mapping)
 
-        keywords.extend(['_score', '_all'])
+                return mapping
 
-        for i in self.mapping:
-            keywords.append(i)  # index name
+            return self.es.get("_mapping")
+        except (ConnectionError, Timeout) as err:
+            print("mapping: cannot connect to", self.es.url)
+            print(err)
 
-            index = self.mapping[i]
+        return None
 
-            for t in index:
-                keywords.append(t)  # document type
+    def get_indices(self):
+        if not self.mappings:
+            return []
+
+        try:
+            indices = self.mappings.get_indices()
+            self.completer.add_indices(indices)
+            return indices
+        except (ConnectionError, Timeout) as err:
+            print("mapping: cannot connect to", self.es.url)
+            print(err)
 
-                document = index[t]
+        return []
+
+    def get_keywords(self):
+        keywords = ['facets', 'filter', 'query', 'exist', 'missing', 'script',
+                    'from', 'where', 'in', 'between', 'like', 'group by', 'order by', 'limit', 'and', 'or', 'not']
+
+        if not self.mappings:
+            return sorted(keywords)
+
+        keywords.extend(['_score', '_all'])
+        keywords.extend(self.get_indices())
+
+        # only the mappings loaded so far (the indexes used in queries or completion)
+        mapping = self.mappings.loaded_mappings()
+
+        for i in mapping:
+            for t, document in doc_types(mapping[i]).iteritems():
+                keywords.append(t)  # document type
 
                 if '_source' in document:
                     source = document['_source']
                     if 'enabled' not in source or source['enabled']:
                         keywords.append('_source')  # _source is enabled by default
 
-                add_properties(keywords, document)
+                keywords.extend(p.split('.')[-1] for p, _ in field_paths(document))
 
-        self.keywords = sorted(set(keywords))
-        return self.keywords
+        return sorted(set(keywords))
 
-    def search(self, query, explain=False, validate=False):
+    def complete(self, text, line, begidx):
+        """
+        Return the completions for text, based on the clause being completed
+        """
+        index = from_index(line, begidx)
+        if index:
+            self.get_mapping(index)
+
+        if not len(self.completer.indices):
+            self.get_indices()
+
+        return self.completer.complete(text, line[:begidx], index)
+
+    def exact_fields(self, index):
+        """
+        Return the set of not analyzed fields of index (empty if the mapping is not available)
+        """
+        mapping = self.get_mapping(index)
+        return exact_fields(mapping) if mapping else set()
+
+    def parse(self, query):
         try:
-            request = ElseParser.parse(query)
+            return PARSERS[self.parser].parse(query)
         except ElseParserException as err:
             print(err.pstr)
             print(" " * err.loc + "^\n")
             print("ERROR:", err)
-            return 1
+            return None
+
+    def compile(self, query, explain=False, validate=False, timing=None):
+        """
+        Return the request plan (path, params, data, fields) for query, from the plan cache if possible
+        """
+        start = time.time()
+
+        stmt, literals = lift_literals(query)
+        key = (stmt, explain, validate, self.version, self.parser, self.dsl, self.keepalive, self.projection)
+
+        plan = self.plan_cache.get(key, literals)
+        if plan is not None:
+            if timing:
+                timing.add('build', time.time() - start)
+            return plan
+
+        try:
+            request = PARSERS[self.parser].parse(stmt)
+            parsed = time.time()
+            template = self.build_request(request, explain, validate)
+        except (ElseParserException, JoinError, SortError):
+            # report errors (or compile the statement as is) using the original statement
+            return self.compile_statement(query, explain, validate)
+
+        built = time.time()
+        self.plan_cache.put(key, template, built - start)
+
+        if timing:
+            timing.add('parse', parsed - start)
+            timing.add('build', built - parsed)
+
+        return bind(template, literals)
+
+    def compile_statement(self, query, explain=False, validate=False):
+        """
+        Return the request plan for query (not cached), or None after printing the parser, JOIN or sort error
+        """
+        request = self.parse(query)
+        if request is None:
+            return None
+
+        try:
+            return self.build_request(request, explain, validate)
+        except (JoinError, SortError) as err:
+            print("ERROR:", err)
+            return None
+
+    def docvalue_columns(self, index, fields):
+        """
+        Return {column: docvalue_fields entry} for the columns to fetch from doc values: in auto mode all the
+        columns or none (when the _source is needed anyway), in docvalues mode the ones that have doc values.
+        In both modes multi-valued columns are sorted and deduplicated
+        """
+        mapping = self.get_mapping(index)
+        if not mapping:
+            return {}
+
+        auto = self.projection == 'auto'
+        available = docvalue_fields(mapping, lossless=auto)
+        version = [int(x) for x in self.version.split('.')[:2]]
+
+        columns = {}
+        for f in fields:
+            if f not in available:
+                continue
+
+            if available[f] in ('date', 'date_nanos') and version < [7, 0]:
+                # dates are formatted as in the mapping since 7.0 (or on request since 6.4), epoch millis before
+                if version >= [6, 4]:
+                    columns[f] = {'field': f, 'format': 'use_field_mapping'}
+                elif not auto:
+                    columns[f] = f
+            else:
+                columns[f] = f
+
+        if auto and len(columns) < len(fields):
+            return {}
+
+        return columns
+
+    def build_request(self, request, explain=False, validate=False):
+        if request.join_index:
+            return self.build_join(request)
 
         params = {}
         data_fields = None
+        hit_fields = None
+        search_after = None
+        aggs = None
+        output = None
+        count = False
 
-        if request.query:
-            data = {'query': {'query_string': {'query': str(request.query), 'default_operator': 'AND'}}}
-        else:
-            data = {'query': {'match_all': {}}}
+        filter = request.filter
+        if filter and not isinstance(filter, Operator):
+            filter = filter[0]
 
-        if explain:
-            data['explain'] = True
+        if self.dsl and self.major >= 2:
+            #
+            # compile the where expression to query DSL, and the filter to a (non-scoring) bool filter
+            #
+            exact = self.exact_fields(request.index.split(".")[0])
+            query = query_dsl(request.query, exact) if request.query else None
 
-        if request.filter:
-            filter = request.filter
+            if filter:
+                query = {'bool': dict({'filter': [filter.dsl(exact)]}, **({'must': [query]} if query else {}))}
 
-            if filter.name == 'query':
-                data['filter'] = {'query': {'query_string': {'query': str(filter), 'default_operator': 'AND'}}}
+            data = {'query': query or {'match_all': {}}}
+
+        else:
+            if request.query:
+                data = {'query': {'query_string': {'query': str(request.query), 'default_operator': 'AND'}}}
             else:
-                data['filter'] = {filter.name: {'field': str(filter)}}
+                data = {'query': {'match_all': {}}}
+
+            if filter:
+                if filter.name == 'query':
+                    data['filter'] = {'query': {'query_string': {'query': str(filter), 'default_operator': 'AND'}}}
+                else:
+                    data['filter'] = {filter.name: {'field': str(filter)}}
+
+        if explain:
+            data['explain'] = True
 
         if request.facets:
             # data['facets'] = {f: {"terms": {"field": f}} for f in request.facets}  -- not in python 2.6
@@ -162,14 +436,16 @@ class ElseSearch(object):
 
         if request.fields:
             fields = request.fields
+            if len(fields) == 1 and not isinstance(fields[0], basestring):
+                fields = fields[0]  # grouped column list
+
             fields_k = '_source' if self.v5 else 'fields'
             if len(fields) == 1:
                 if fields[0] == '*':
                     # all fields
                     pass
-                elif fields[0] == 'count(*)':
-                    # TODO: only get count
-                    pass
+                elif fields[0] == 'count(*)' and not request.groupby:
+                    count = True
                 else:
                     data[fields_k] = [fields[0]]
             else:
@@ -177,6 +453,18 @@ class ElseSearch(object):
 
             data_fields = data.get(fields_k)
 
+            if fields_k == 'fields' and data_fields:
+                hit_fields = data_fields  # stored fields
+
+            if len(fields) == 1 and fields[0] == '*':
+                # all the fields of the mapping, for a stable list of columns (or those of the first result)
+                mapping = self.get_mapping(request.index.split(".")[0])
+                data_fields = source_columns(mapping) if mapping else None
+
+            if request.groupby or (not count and any(_aggregate_re.match(f) for f in fields)):
+                aggs = self.build_aggs(fields, request.groupby, request.order, request.limit)
+                data_fields = [x for x in fields]
+
         if request.order:
             data['sort'] = [{x[0]:x[1]} for x in request.order]
 
@@ -189,18 +477,108 @@ class ElseSearch(object):
 
             qsize = request.limit[0]
 
-            if qfrom is None:
+            if (qfrom or 0) >= 0 and (qfrom or 0) + qsize > PAGE_SIZE and request.order and self.v5:
+                #
+                # deep pagination: get PAGE_SIZE results at a time, starting after the sort values
+                # of the last result of the previous page (and skip the first qfrom results).
+                # Ties are sorted on _shard_doc in a point in time (7.12 and later), before that on the
+                # document id (that needs fielddata on _id, deprecated in 7.x)
+                #
+                tiebreaker = '_uid' if self.major < 6 else '_id'
+                if not self.has_pit() and tiebreaker not in [x[0] for x in request.order]:
+                    data['sort'].append({tiebreaker: 'asc'})
+
+                data['size'] = PAGE_SIZE
+                search_after = [qfrom or 0, qsize]
+
+            elif qfrom is None:
                 data['size'] = qsize
 
             elif qfrom >= 0:
                 data['from'] = qfrom
                 data['size'] = qsize
 
+            elif self.v5:
+                #
+                # limit -1, 1000 => scroll request, 1000 items at a time (scan was removed in 5.0)
+                #
+                params.update({'scroll': self.keepalive})
+                data['size'] = qsize
+                data['sort'] = ['_doc']
+
             else:
                 #
                 # limit -1, 1000 => scan request, 1000 items at a time
                 #
-                params.update({'search_type': 'scan', 'scroll': '10m', 'size': qsize})
+                params.update({'search_type': 'scan', 'scroll': self.keepalive, 'size': qsize})
+
+        if (count or aggs) and not validate:
+            #
+            # count(*) and aggregations: don't fetch any document
+            #
+            search_after = None
+            params.pop('scroll', None)
+            params.pop('search_type', None)
+            params.pop('size', None)
+
+            for k in ['size', 'from', 'sort', '_source', 'fields']:
+                data.pop(k, None)
+
+            if count:
+                data_fields = ['count(*)']
+            else:
+                data['aggs'] = aggs.pop('request')
+
+        elif isinstance(data.get('_source'), list) and self.projection != 'source' and not validate:
+            #
+            # fetch the selected columns from doc values, loading the _source only for the other ones (if any)
+            #
+            columns = self.docvalue_columns(request.index.split(".")[0], data_fields)
+
+            if columns:
+                data['docvalue_fields'] = [columns[f] for f in data_fields if f in columns]
+                data['_source'] = [f for f in data_fields if f not in columns] or False
+                hit_fields = sorted(columns)
+
+        post = None
+        if (request.distinct or (request.order and 'scroll' in params)) and not validate:
+            #
+            # ORDER BY of scroll queries (that ElasticSearch doesn't sort) and DISTINCT are applied to the rows
+            #
+            if count or aggs:
+                raise SortError("DISTINCT is not supported with count(*) and aggregate functions")
+
+            post = {'order': [[x[0], x[1]] for x in request.order or []], 'distinct': bool(request.distinct),
+                    'skip': 0, 'limit': None}
+
+            if request.distinct and 'scroll' not in params:
+                #
+                # DISTINCT applies to all the matching rows: they are scrolled, and LIMIT applies to the distinct rows
+                #
+                if search_after:
+                    (post['skip'], post['limit']), search_after = search_after, None
+                    data.pop('size')
+                else:
+                    post['skip'], post['limit'] = data.pop('from', 0), data.pop('size', None)
+
+                if self.v5:
+                    params.update({'scroll': self.keepalive})
+                    data.update({'size': PAGE_SIZE, 'sort': ['_doc']})
+                else:
+                    params.update({'search_type': 'scan', 'scroll': self.keepalive, 'size': PAGE_SIZE})
+
+            # the ORDER BY columns that are not selected are fetched too
+            hidden = [x[0] for x in post['order'] if data_fields and x[0] not in data_fields]
+            if hidden and request.distinct:
+                raise SortError("the ORDER BY columns must be selected with DISTINCT")
+
+            fields_k = '_source' if self.v5 else 'fields'
+            hidden = [c for c in hidden if c not in METADATA]
+
+            if hidden and fields_k in data:
+                data[fields_k] = (data[fields_k] or []) + hidden
+                if fields_k == 'fields':
+                    hit_fields = data[fields_k]
 
         if validate:
             command = '/_validate/query'
@@ -218,56 +596,753 @@ class ElseSearch(object):
         #    command = '/_explain'
         #    params.update({'pretty': 'true'})
 
+        elif count and set(data) == set(['query']):
+            # a simple query: use the count API
+            command = '/_count'
+
+        elif count or aggs:
+            # filters, facets or aggregations: search with size 0
+            command = '/_search'
+            data['size'] = 0
+
+            if self.major >= 7:
+                data['track_total_hits'] = True
+
         else:
             command = '/_search'
 
         if request.routing:
-            command += '?routing=%s' % request.routing
+            params['routing'] = request.routing
+
+        output = outfile(request)
+
+        cache_ttl = request.cache if request.cache != '' else None
 
         command_path = request.index.replace(".", "/") + command
 
+        return {'index': request.index.split(".")[0], 'path': command_path, 'params': params, 'data': data,
+                'fields': data_fields, 'search_after': search_after, 'aggs': aggs, 'output': output,
+                'cache': cache_ttl, 'hit_fields': hit_fields, 'join': None, 'post': post}
+
+    def build_join(self, request):
+        """
+        Return the plan of a JOIN statement: for each side the query (with the WHERE conditions on its columns),
+        the join key and the columns to fetch, and which side column is each selected column
+        """
+        if self.major < 2:
+            raise JoinError("JOIN requires ElasticSearch 2.0 or later")
+
+        if request.facets or request.script or request.filter or request.groupby or request.routing:
+            raise JoinError("FACETS, SCRIPT, FILTER, GROUP BY and ROUTING are not supported with JOIN")
+
+        names = side_names(request)
+        if names[0] == names[1]:
+            raise JoinError("the joined indexes must have different names (use an alias)")
+
+        sides = [{'index': index, 'columns': []} for index in (request.index, request.join_index)]
+
+        fields = request.fields
+        if len(fields) == 1 and not isinstance(fields[0], basestring):
+            fields = fields[0]  # grouped column list
+        fields = [x for x in fields]
+
+        if fields == ['*']:
+            # all the fields of both mappings
+            fields = []
+            for name, side in zip(names, sides):
+                mapping = self.get_mapping(side['index'].split(".")[0])
+                if not mapping:
+                    raise JoinError("select * needs the mapping of %s" % side['index'])
+                fields.extend(name + '.' + c for c in source_columns(mapping))
+
+        if any(_aggregate_re.match(f) for f in fields):
+            raise JoinError("aggregate functions are not supported with JOIN")
+
+        columns = []
+        for f in fields:
+            n, column = resolve(f, names)
+            if column not in sides[n]['columns']:
+                sides[n]['columns'].append(column)
+            columns.append([n, sides[n]['columns'].index(column)])
+
+        keys = [resolve(c, names) for c in request.join_on]
+        if keys[0][0] == keys[1][0]:
+            raise JoinError("the ON condition must compare a column of each index")
+
+        conditions = split_conditions(request.query, names)
+
+        for (n, key), side in zip(sorted(keys), sides):
+            path = side['index'].replace(".", "/")
+            exact = self.exact_fields(side['index'].split(".")[0])
+
+            if self.dsl:
+                queries = [query_dsl(c, exact) for c in conditions[n]]
+            else:
+                queries = [{'query_string': {'query': str(c), 'default_operator': 'AND'}} for c in conditions[n]]
+
+            # the keys are looked up with terms queries, on the not analyzed multi-field of a text field
+            terms = keyword_field(key, exact) or key
+
+            source = [c for c in side['columns'] if c not in METADATA]
+            if key not in METADATA and key not in source:
+                source.append(key)
+
+            side.update({'path': path + '/_search', 'count_path': path + '/_count', 'key': key, 'terms': terms,
+                         'query': {'bool': {'must': queries}} if len(queries) > 1 else
+                                  queries[0] if queries else {'match_all': {}},
+                         '_source': source or False})
+
+        # LIMIT count or LIMIT start,count on the joined rows, LIMIT -1,size sets the size of the scroll pages
+        skip, limit, size = 0, None, PAGE_SIZE
+        if request.limit:
+            if len(request.limit) == 1:
+                limit = request.limit[0]
+            elif request.limit[0] < 0:
+                size = request.limit[1]
+            else:
+                skip, limit = request.limit[0], request.limit[1]
+
+        # ORDER BY and DISTINCT are applied to the joined rows
+        post = None
+        if request.order or request.distinct:
+            post = {'order': [[x[0], x[1]] for x in request.order or []], 'distinct': bool(request.distinct),
+                    'skip': skip, 'limit': limit}
+
+            if any(x[0] not in fields for x in post['order']):
+                raise SortError("the ORDER BY columns of a JOIN must be selected")
+
+        return {'index': request.index.split(".")[0], 'path': '', 'params': {}, 'data': {}, 'fields': fields,
+                'search_after': None, 'aggs': None, 'output': outfile(request), 'cache': None, 'hit_fields': None,
+                'join': {'sides': sides, 'columns': columns, 'skip': skip, 'limit': limit, 'size': size}, 'post': post}
+
+    def build_aggs(self, fields, groupby, order, limit):
+        """
+        Return the aggregations for a GROUP BY query (in 'request') and how to read the result rows.
+
+        The group columns are (nested) terms aggregations, or the sources of a composite aggregation
+        (paged with after_key) on 6.1 and later. Plain select columns are grouped by, as if they were
+        listed in GROUP BY. ORDER BY only applies to the group columns.
+        """
+        groups = [x for x in groupby or []]
+        metrics = {}
+        columns = []
+
+        for f in fields:
+            m = _aggregate_re.match(f)
+            if not m:
+                if f not in groups:
+                    groups.append(f)
+                columns.append(['key', groups.index(f)])
+            elif m.group(2) == '*':
+                columns.append(['count', None])
+            else:
+                name = 'm%d' % len(metrics)
+                metrics[name] = {AGGREGATES[m.group(1)]: {'field': m.group(2)}}
+                columns.append(['value', name])
+
+        orders = dict((x[0], x[1]) for x in order or [])
+
+        skip, size = 0, None
+        if limit:
+            if len(limit) > 1:
+                skip = max(limit[0], 0)
+            if limit[-1] >= 0 and (len(limit) == 1 or limit[0] >= 0):
+                size = limit[-1]
+
+        if not groups:
+            mode = 'metrics'
+            request = metrics
+
+        elif self.version and [int(x) for x in self.version.split('.')[:2]] >= [6, 1]:
+            mode = 'composite'
+            sources = []
+            for n, g in enumerate(groups):
+                sources.append({'g%d' % n: {'terms': {'field': g, 'order': orders.get(g, 'asc')}}})
+
+            request = {'groups': {'composite': {'size': min(skip + size, PAGE_SIZE) if size else PAGE_SIZE,
+                                                'sources': sources}}}
+            if metrics:
+                request['groups']['aggs'] = metrics
+
+        else:
+            mode = 'terms'
+            request = metrics
+            for n in reversed(range(len(groups))):
+                terms = {'field': groups[n], 'size': skip + size if size else MAX_BUCKETS}
+                if groups[n] in orders:
+                    terms['order'] = {'_term' if self.major < 6 else '_key': orders[groups[n]]}
+
+                request = {'g%d' % n: dict({'terms': terms}, **({'aggs': request} if request else {}))}
+
+        return {'mode': mode, 'columns': columns, 'groups': len(groups), 'skip': skip, 'limit': size,
+                'request': request}
+
+    def search(self, query, explain=False, validate=False):
+        timing = Timing() if self.timing else None
+
+        plan = self.compile(query, explain, validate, timing)
+        if plan is None:
+            return 1
+
+        # load (and cache) the mapping of the queried index
+        self.get_mapping(plan['index'])
+
+        command_path = plan['path']
+        params = plan['params']
+        data = plan['data']
+
         if self.debug:
             HTTPConnection.debuglevel = 1
 
-            print()
-            print("GET", command_path, params or '')
-            print("  ", pprint.pformat(data))
-            params.update({'pretty': 'true'})
+            # (the requests of a JOIN are printed when executed)
+            if not plan['join']:
+                print()
+                print("GET", command_path, params or '')
+                print("  ", pprint.pformat(data))
+                params.update({'pretty': 'true'})
         else:
             HTTPConnection.debuglevel = 0
 
         if self.print_query:
             print()
-            print("; ", _csval(query))
+            print("; ", csval(query))
             print()
 
-        total = None
-        print_fields = True
-        do_query = True
+        # INTO OUTFILE, or the output setting
+        output = plan['output'] or {'path': self.output}
 
-        while self.es and do_query:
-            try:
-                result = self.es.get(command_path, params=params, data=data)
-            except ConnectionError as err:
-                print("cannot connect to", self.es.url)
-                print(err)
+        try:
+            out = open_output(**output)
+        except IOError as err:
+            print("cannot open output:", err)
+            return 1
+
+        if timing and self.es:
+            stats = self.es.stats.snapshot()
+            start = time.time()
+
+        try:
+            return self.execute(plan, out, timing)
+        finally:
+            out.close()
+
+            if plan['output']:
+                print("%d rows written to %s" % (out.rows, output['path']))
+
+            if timing and self.es:
+                timing.transport(stats, self.es.stats.snapshot())
+                timing.done(out.rows, time.time() - start)
+                timing.report()
+
+    def profile(self, query):
+        """
+        Execute query with the profile API and print the per-shard query and collectors timing
+        """
+        plan = self.compile(query)
+        if plan is None:
+            return 1
+
+        if not self.es:
+            print("not connected")
+            return 1
+
+        if plan['join']:
+            print("JOIN statements can't be profiled")
+            return 1
+
+        # the first page of a search (count requests can't be profiled)
+        path = plan['path'].replace('/_count', '/_search')
+        params = dict((k, v) for k, v in plan['params'].iteritems() if k not in ('scroll', 'search_type'))
+        data = dict(plan['data'], profile=True)
+
+        if path != plan['path']:
+            data['size'] = 0
+
+        result = self.request(path, params, data)
+        if 'error' in result:
+            print("ERROR:", result['error'])
+            return 1
+
+        print("took: %s ms, hits: %s" % (result.get('took'), _total(result.get('hits', {}).get('total'))))
+        print()
+
+        for line in format_profile(result):
+            print(line)
+
+    def request(self, command_path, params, data, stream=False):
+        """
+        Execute a search request, return the result (an error result if the request failed)
+        """
+        try:
+            if stream:
+                return self.es.stream('GET', command_path, params=params, data=data)
+            return self.es.get(command_path, params=params, data=data)
+        except (ConnectionError, Timeout) as err:
+            return {'error': "cannot connect to %s: %s" % (self.es.url, err)}
+
+    def sized_request(self, key, command_path, params, data):
+        """
+        Execute the request, recording the time and bytes per document of the page for the adaptive page size
+        """
+        before = self.es.stats.snapshot()
+        result = self.request(command_path, params, data)
+
+        hits = result and result.get('hits', {}).get('hits')
+        if hits:
+            after = self.es.stats.snapshot()
+            elapsed = (after[1] - before[1]) + (after[2] - before[2])
+            self.page_sizer.observe(key, len(hits), elapsed, after[4] - before[4])
+
+        return result
+
+    def open_scroll(self, previous, scroll_id):
+        with self.scroll_lock:
+            self.scrolls.discard(previous)
+            self.scrolls.add(scroll_id)
+        return scroll_id
+
+    def clear_scrolls(self, scroll_ids=None):
+        """
+        Clear the given (or all the open) scroll contexts, so that they don't use resources on the cluster
+        until they expire
+        """
+        with self.scroll_lock:
+            scroll_ids = [s for s in (self.scrolls if scroll_ids is None else scroll_ids) if s in self.scrolls]
+            self.scrolls.difference_update(scroll_ids)
+
+        if not scroll_ids or not self.es:
+            return
+
+        if self.debug:
+            print()
+            print("DELETE _search/scroll", len(scroll_ids), "scroll ids")
+
+        try:
+            # scroll ids in the request body since 2.0
+            if self.major >= 2:
+                self.es.delete('_search/scroll', data={'scroll_id': scroll_ids})
+            else:
+                self.es.delete('_search/scroll/' + ','.join(scroll_ids))
+        except (ConnectionError, Timeout) as err:
+            if self.debug:
+                print("cannot clear scroll:", err)
+
+    def pages(self, command_path, params, data, stream=False, adapt=None):
+        """
+        Execute the request and yield the result pages (more than one for scroll requests).
+        If stream is True the hits of each page are decoded incrementally (as a HitStream).
+        If adapt is set, the pages are observed (as {adapt}) to tune the page size of the next requests.
+
+        The scroll context is cleared when all the pages are returned, or the generator is closed.
+        """
+        scrolling = False
+        scroll_id = None
+
+        try:
+            while self.es:
+                if scrolling and self.debug:
+                    print()
+                    print("GET", command_path, params or '')
+
+                if adapt:
+                    result = self.sized_request(adapt, command_path, params, data)
+                else:
+                    result = self.request(command_path, params, data, stream)
+
+                if result.get('_scroll_id'):
+                    scroll_id = self.open_scroll(scroll_id, result['_scroll_id'])
+
+                yield result
+
+                hits = result.get('hits', {}).get('hits')
+                if isinstance(hits, HitStream):
+                    hits.drain()  # whatever the caller didn't read
+
+                    if result.get('_scroll_id'):
+                        scroll_id = self.open_scroll(scroll_id, result['_scroll_id'])
+
+                if '_scroll_id' not in result:
+                    return
+
+                # the initial scan response doesn't return any hit
+                if scrolling and not result.get('hits', {}).get('hits'):
+                    return
+
+                # scan/scroll request
+                scrolling = True
+                command_path = '_search/scroll'
+                params = {'scroll': params['scroll'], 'scroll_id': result['_scroll_id']}
+                data = None
+        finally:
+            if scroll_id:
+                self.clear_scrolls([scroll_id])
+
+    def sliced_pages(self, command_path, params, data):
+        """
+        Execute a scroll request as a sliced scroll, fetching the slices in parallel.
+        A slice that fails returns an error page (and render stops at the first one)
+        """
+        def slice_pages(n):
+            sliced = dict(data, slice={'id': n, 'max': self.slices})
+            return lambda: self.pages(command_path, params, sliced)
+
+        pages = parallel_pages([slice_pages(n) for n in range(self.slices)])
+
+        try:
+            for n, result in pages:
+                result['_slice'] = n
+                yield result
+        finally:
+            pages.close()
+
+    def open_pit(self, command_path, params):
+        """
+        Open a point in time on the index of a search, return the result (with the point in time id)
+        """
+        index = command_path.split('/')[0]
+        pit_params = dict((k, v) for k, v in params.iteritems() if k in PIT_PARAMS)
+        pit_params['keep_alive'] = self.keepalive
+
+        if self.debug:
+            print()
+            print("POST", index + '/_pit', pit_params)
+
+        try:
+            return self.es.post(index + '/_pit', params=pit_params)
+        except (ConnectionError, Timeout) as err:
+            return {'error': "cannot connect to %s: %s" % (self.es.url, err)}
+
+    def close_pit(self, pit):
+        try:
+            self.es.delete('_pit', data={'id': pit})
+        except (ConnectionError, Timeout) as err:
+            if self.debug:
+                print("cannot close point in time:", err)
+
+    def search_after_pages(self, command_path, params, data, skip, count, adapt=None):
+        """
+        Execute a sorted request one page at a time, using the sort values of the last hit
+        to get the next page (search_after), skipping the first {skip} hits and returning {count} hits.
+        If adapt is set, the size of each page is tuned from the previous ones.
+
+        Since 7.12 the pages are searched in a point in time (that sorts the ties on _shard_doc), closed when
+        all the pages are returned or the generator is closed
+        """
+        page_size = data['size']
+        pit = None
+
+        if self.es and self.has_pit():
+            result = self.open_pit(command_path, params)
+            if 'id' not in result:
+                yield result
+                return
+
+            # the index (and routing) are those of the point in time
+            pit = result['id']
+            command_path = '_search'
+            params = dict((k, v) for k, v in params.iteritems() if k not in PIT_PARAMS)
+
+        try:
+            while self.es and count > 0:
+                if adapt:
+                    page_size = self.page_sizer.size(adapt, page_size)
+
+                size = min(page_size, skip + count)
+                data = dict(data, size=size)
+
+                if pit:
+                    data['pit'] = {'id': pit, 'keep_alive': self.keepalive}
+
+                if adapt:
+                    result = self.sized_request(adapt, command_path, params, data)
+                else:
+                    result = self.request(command_path, params, data)
+
+                # the point in time id can change between pages
+                pit = result.get('pit_id') or pit
+
+                hits = result.get('hits', {}).get('hits')
+                if not hits:
+                    yield result
+                    return
+
+                returned = len(hits)
+                last = hits[-1].get('sort')
+
+                if skip:
+                    skipped = min(skip, returned)
+                    hits = hits[skipped:]
+                    skip -= skipped
+
+                hits = hits[:count]
+                count -= len(hits)
+
+                result['hits']['hits'] = hits
+                yield result
+
+                if returned < size or last is None:
+                    return
+
+                data['search_after'] = last
+
+                if self.debug:
+                    print()
+                    print("GET", command_path, params or '')
+                    print("  ", pprint.pformat(data))
+        finally:
+            if pit:
+                self.close_pit(pit)
+
+    def composite_pages(self, command_path, params, data, count):
+        """
+        Execute a composite aggregation request, getting the next buckets after the last key
+        until there are no more buckets (or {count} buckets were returned)
+        """
+        while self.es:
+            result = self.request(command_path, params, data)
+
+            yield result
+
+            groups = result.get('aggregations', {}).get('groups')
+            if not groups or not groups['buckets']:
+                return
+
+            buckets = groups['buckets']
+            composite = data['aggs']['groups']['composite']
+
+            if count is not None:
+                count -= len(buckets)
+                if count <= 0:
+                    return
+
+            if len(buckets) < composite['size']:
                 return
 
+            # after_key was added in 6.3, before that it's the key of the last bucket
+            after = groups.get('after_key') or buckets[-1]['key']
+            data = dict(data, aggs={'groups': dict(data['aggs']['groups'], composite=dict(composite, after=after))})
+
             if self.debug:
                 print()
-                print("RESPONSE:", pprint.pformat(result))
+                print("GET", command_path, params or '')
+                print("  ", pprint.pformat(data))
+
+    def execute(self, plan, out, timing=None):
+        if plan['join']:
+            return self.execute_join(plan, out)
+
+        command_path, params, data = plan['path'], plan['params'], plan['data']
+        aggs = plan['aggs']
+        stream = self.stream and not aggs and 'facets' not in data and plan['fields'] != ['count(*)']
+
+        # scroll and streamed results are not cached
+        key = None
+        if self.cache and plan['cache'] != 0 and 'scroll' not in params and not stream:
+            key = cache_key(command_path, params, data)
+            cached = self.result_cache.get(key)
+
+            if cached is not None:
+                if self.debug:
+                    print("(cached result)")
+                return self.render((page for page in cached), plan['fields'], out, aggs, plan['hit_fields'],
+                                   plan['post'])
+
+        paged = True
+
+        # adaptive page size (the size of a scroll is fixed by its first request, search_after pages can vary)
+        adapt = plan['index'] if self.adaptive and self.v5 and not stream else None
+
+        if aggs and aggs['mode'] == 'composite' and 'aggs' in data:
+            count = aggs['skip'] + aggs['limit'] if aggs['limit'] is not None else None
+            pages = self.composite_pages(command_path, params, data, count)
+        elif plan['search_after']:
+            skip, count = plan['search_after']
+            pages = self.search_after_pages(command_path, params, data, skip, count, adapt)
+        elif self.slices > 1 and self.v5 and 'scroll' in params:
+            pages = self.sliced_pages(command_path, params, data)
+            paged = False  # already fetched in parallel
+        elif 'scroll' in params:
+            if adapt:
+                data = dict(data, size=self.page_sizer.size(adapt, data['size']))
+            pages = self.pages(command_path, params, data, stream, adapt)
+        else:
+            pages = self.pages(command_path, params, data, stream)
+            paged = False
+
+        # fetch the next page while the current one is rendered
+        # (not for streamed pages, that are decoded while rendering, or in debug mode, that prints the requests)
+        if paged and self.prefetch > 0 and not stream and not self.debug:
+            source = pages
+            pages = prefetch_pages(lambda: source, self.prefetch)
+
+            if timing:
+                timing.prefetch = True
+
+        results = pages
+
+        if key:
+            results = self.result_cache.record(key, results, plan['cache'])
+
+        if timing:
+            results = timing.record(results)
+
+        try:
+            return self.render(results, plan['fields'], out, aggs, plan['hit_fields'], plan['post'])
+        finally:
+            results.close()
+            pages.close()
+
+            # the scroll contexts left open by fetchers that were still running
+            self.clear_scrolls()
+
+    def count_hits(self, side):
+        result = self.request(side['count_path'], {}, {'query': side['query']})
+        if 'count' not in result:
+            raise JoinError("cannot count %s: %s" % (side['index'], result.get('error')))
+        return result['count']
+
+    def join_hits(self, side, query, size):
+        """
+        Scroll the hits of one side of a JOIN matching query, yielding the lists of hits of each page
+        """
+        data = {'query': query, '_source': side['_source']}
+
+        if self.v5:
+            params = {'scroll': self.keepalive}
+            data.update({'size': size, 'sort': ['_doc']})
+        else:
+            params = {'search_type': 'scan', 'scroll': self.keepalive, 'size': size}
+
+        if self.debug:
+            print()
+            print("GET", side['path'], params)
+            print("  ", pprint.pformat(data))
+
+        pages = self.pages(side['path'], params, data)
+
+        if self.prefetch > 0 and not self.debug:
+            source = pages
+            pages = prefetch_pages(lambda: source, self.prefetch)
+
+        try:
+            for result in pages:
+                if 'error' in result:
+                    raise JoinError(result['error'])
+                yield result['hits']['hits']
+        finally:
+            pages.close()
+
+    def execute_join(self, plan, out):
+        """
+        Execute a JOIN plan: the side with fewer matching documents is scrolled (the build side) and its join keys
+        are looked up, in batches, in the other side
+        """
+        join = plan['join']
+        sides, size = join['sides'], join['size']
+        pairs = None
+
+        try:
+            counts = [self.count_hits(side) for side in sides]
+            build = 0 if counts[0] <= counts[1] else 1
+            probe = 1 - build
+
+            if self.debug:
                 print()
+                print("JOIN: build side %s (%d documents), probe side %s (%d documents)" % (
+                    sides[build]['index'], counts[build], sides[probe]['index'], counts[probe]))
 
-            if '_scroll_id' in result:
-                # scan/scroll request
-                params['scroll_id'] = result['_scroll_id']
+            def probe_hits(side, values):
+                query = {'bool': {'filter': [{'terms': {side['terms']: values}}], 'must': [side['query']]}}
+                return self.join_hits(side, query, size)
 
-                if 'search_type' in params:
-                    params.pop('search_type')
-                    command_path = '_search/scroll'
-            else:
-                # done
-                do_query = False
+            # the build scroll is refreshed at half its keepalive while the hash table is looked up
+            pairs = hash_join(self.join_hits(sides[build], sides[build]['query'], size), probe_hits,
+                              sides[build], sides[probe], self.join_memory, refresh=_seconds(self.keepalive) / 2.0)
+
+            # (build row, probe row) to the selected columns
+            picks = [(0 if n == build else 1, pos) for n, pos in join['columns']]
+            skip, limit = join['skip'], join['limit']
+            rows = 0
+
+            writer = out
+            if plan['post']:
+                # LIMIT applies to the sorted rows
+                writer = self.row_sorter(out, plan['fields'], plan['post'])[0]
+                skip, limit = 0, None
+
+            out.write_header(plan['fields'])
+
+            for batch in pairs:
+                if skip >= len(batch):
+                    skip -= len(batch)
+                    continue
+
+                batch = batch[skip:] if limit is None else batch[skip:skip + limit - rows]
+                skip = 0
+
+                writer.write_rows([[pair[i][pos] for i, pos in picks] for pair in batch])
+                rows += len(batch)
+
+                if limit is not None and rows >= limit:
+                    break
+
+            if writer is not out:
+                writer.finish()
+
+            out.write_text()
+            out.write_text("total:  %d" % out.rows)
+        except JoinError as err:
+            print("ERROR:", err)
+            return 1
+        finally:
+            if pairs is not None:
+                pairs.close()
+
+            self.clear_scrolls()
+
+    def row_sorter(self, out, columns, post):
+        """
+        Return (sorter, columns, fetched columns) for the rows of columns sorted (and deduplicated), skipped
+        and limited as specified by post. The ORDER BY columns that are not selected are fetched too, and
+        removed by the sorter (or selected, with DISTINCT)
+        """
+        hidden = [x[0] for x in post['order'] if x[0] not in columns]
+        if post['distinct']:
+            columns, hidden = list(columns) + hidden, []
+
+        fetched = list(columns) + hidden
+        keys = [(fetched.index(c), seq == 'desc') for c, seq in post['order']]
+
+        if post['distinct']:
+            # sorted by all the columns, so that duplicates are consecutive
+            keys += [(n, False) for n in range(len(columns)) if n not in [k for k, _ in keys]]
+
+        sorter = RowSorter(out, keys, len(columns) if hidden else None, post['distinct'], self.sort_memory,
+                           post['skip'], post['limit'])
+        return sorter, columns, fetched
+
+    def render(self, pages, data_fields, out, aggs=None, hit_fields=None, post=None):
+        """
+        Render the result pages. The hits are projected to the data_fields columns (or those of the first hit),
+        reading the columns in hit_fields from the hit "fields" (doc values or stored fields).
+        With post, the rows are sorted (and deduplicated) before they are written.
+        Return 1 if the request failed (an error or an invalid query)
+        """
+        totals = {}
+        print_fields = True
+        project = None
+        writer = out
+        count = data_fields == ['count(*)']
+
+        if aggs:
+            skip, limit = aggs['skip'], aggs['limit']
+
+        for result in pages:
+            if self.debug:
+                out.flush()
+                print()
+                print("RESPONSE:", pprint.pformat(result))
+                print()
 
             if 'valid' in result:
                 if 'explanations' in result:
@@ -277,56 +1352,78 @@ class ElseSearch(object):
                             print(k, ':', v)
                 else:
                     print("valid:", result['valid'])
-                return
+                return 0 if result['valid'] else 1
 
             if 'error' in result:
                 print("ERROR:", result['error'])
-                return
+                return 1
 
-            if 'shards' in result and 'failures' in result['_shards']:
+            if '_shards' in result and 'failures' in result['_shards']:
                 failures = result['_shards']['failures']
                 for f in failures:
                     print("ERROR:", f['reason'])
-                return
+                return 1
 
-            if 'hits' in result:
-                hits = result['hits']
-                total = hits['total']
+            if aggs and 'aggregations' in result:
+                if print_fields:
+                    print_fields = False
+                    out.write_header(data_fields)
+
+                rows = agg_rows(result, aggs)
 
-                if data_fields and not self.v5:
-                    if print_fields:
-                        print_fields = False
-                        print(_csvline(data_fields))
+                if skip:
+                    skipped = min(skip, len(rows))
+                    rows = rows[skipped:]
+                    skip -= skipped
 
-                    for _ in hits['hits']:
-                        result_fields = _['fields'] if 'fields' in _ else {}
-                        print(_csvline([_.get(x) or result_fields.get(x) for x in data_fields]))
+                if limit is not None:
+                    rows = rows[:limit]
+                    limit -= len(rows)
+
+                out.write_rows(rows)
+
+            elif count:
+                if 'count' in result:
+                    n = result['count']
                 else:
-                    if hits['hits']:
-                        if print_fields:
-                            print_fields = False
-                            print(_csvline(hits['hits'][0]['_source'].keys()))
-                    else:
-                        do_query = False
+                    n = _total(result['hits']['total'])
+
+                out.write_header(['count'])
+                out.write_rows([[n]])
+
+            elif 'hits' in result:
+                hits = result['hits']
+
+                for batch in hit_batches(hits['hits']):
+                    if project is None:
+                        if not data_fields and not batch:
+                            continue
+
+                        # compiled once per query
+                        columns = fetched = data_fields or hit_columns(batch[0])
+                        if post:
+                            writer, columns, fetched = self.row_sorter(out, columns, post)
+
+                        project = compile_projector(fetched, hit_fields or ())
+                        out.write_header(columns)
 
-                    for _ in hits['hits']:
-                        print(_csvline([_csval(x) for x in _['_source'].values()]))
+                    writer.write_rows(map(project, batch))
+
+                totals[result.get('_slice')] = hits['total']
 
             if 'facets' in result:
                 for facet in result['facets']:
-                    print()
-                    print("%s,count" % _csval(facet))
+                    out.write_text()
+                    out.write_text("%s,count" % csval(facet))
 
-                    for _ in result['facets'][facet]['terms']:
-                        t = _['term']
-                        c = _['count']
-                        print("%s,%s" % (_csval(t), c))
+                    out.write_rows([(_['term'], _['count']) for _ in result['facets'][facet]['terms']])
 
-            if do_query and self.debug:
-                print()
-                print("GET", command_path, params or '')
-                print("  ", pprint.pformat(data))
+        if writer is not out:
+            writer.finish()
 
-        if total is not None:
-            print()
-            print("total: ", total)
+            if self.debug:
+                print("sorted %d rows (%d runs)" % (writer.count, writer.spilled))
+
+        if totals:
+            out.write_text()
+            out.write_text("total:  %s" % sum(_total(t) for t in totals.values()))
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+#
+# Client-side ORDER BY and DISTINCT of result rows (for scroll queries, that are not sorted by ElasticSearch,
+# and JOINs), with an external merge sort: rows are sorted in memory up to a memory budget, then written
+# as a sorted run to a temporary file. When all the rows are written the runs are merged (k-way) into the
+# output writer. DISTINCT rows are sorted by all their columns and the duplicates dropped while merging.
+#
+
+from __future__ import print_function
+
+import heapq
+import json
+import marshal
+import tempfile
+
+from itertools import islice
+
+from projector import row_size
+
+# memory budget (estimated size of the rows) of the sort, and rows per block in the run files
+SORT_MEMORY = 64 * 1024 * 1024
+BLOCK_SIZE = 1000
+
+_NONE = object()
+
+
+class SortError(Exception):
+    pass
+
+
+class Descending(object):
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __ne__(self, other):
+        return self.value != other.value
+
+
+def sort_value(v):
+    # numbers before strings before arrays and objects (as JSON), missing values last
+    if v is None:
+        return (3, None)
+    if isinstance(v, (int, long, float)):
+        return (0, v)
+    if isinstance(v, basestring):
+        return (1, v)
+    return (2, json.dumps(v, sort_keys=True))
+
+
+def sort_key(keys):
+    """
+    Return the sort key function for keys, a list of (column index, descending). Missing values are last
+    in both directions
+    """
+    def column_key(i, descending):
+        if descending:
+            return lambda row: (row[i] is None, Descending(sort_value(row[i])))
+        return lambda row: sort_value(row[i])
+
+    getters = [column_key(i, descending) for i, descending in keys]
+    if len(getters) == 1:
+        return getters[0]
+
+    return lambda row: tuple(get(row) for get in getters)
+
+
+def unique(rows, key):
+    # drop the consecutive duplicates of sorted rows (rows can be lists or tuples, their keys are compared)
+    previous = _NONE
+    for row in rows:
+        k = key(row)
+        if k != previous:
+            yield row
+        previous = k
+
+
+def read_run(run):
+    while True:
+        try:
+            block = marshal.load(run)
+        except EOFError:
+            return
+
+        for row in block:
+            yield row
+
+
+class RowSorter(object):
+    """
+    A sink for rows (like output writers) that sorts them by keys (a list of (column index, descending)),
+    optionally dropping the duplicate rows, and writes them to out when finished: after skipping {skip} rows,
+    at most {limit} rows, and only the first {width} columns of each row (if set)
+    """
+
+    def __init__(self, out, keys, width=None, distinct=False, memory=SORT_MEMORY, skip=0, limit=None):
+        self.out = out
+        self.key = sort_key(keys)
+        self.width = width
+        self.distinct = distinct
+        self.memory = memory
+        self.skip = skip
+        self.limit = limit
+
+        self.rows = []
+        self.size = 0
+        self.runs = []
+        self.count = 0
+        self.spilled = 0
+
+    def write_rows(self, rows):
+        self.rows.extend(rows)
+        self.size += sum(row_size(row) for row in rows)
+        self.count += len(rows)
+
+        if self.size >= self.memory:
+            self.spill()
+
+    def sorted_rows(self):
+        rows = self.rows
+        rows.sort(key=self.key)
+
+        self.rows = []
+        self.size = 0
+
+        return unique(rows, self.key) if self.distinct else rows
+
+    def spill(self):
+        """
+        Write the rows in memory as a sorted run
+        """
+        run = tempfile.TemporaryFile(prefix='elseql-sort-')
+
+        rows = iter(self.sorted_rows())
+        while True:
+            block = list(islice(rows, BLOCK_SIZE))
+            if not block:
+                break
+            marshal.dump(block, run)
+
+        run.seek(0)
+        self.runs.append(run)
+        self.spilled += 1
+
+    def merged(self):
+        if not self.runs:
+            return self.sorted_rows()
+
+        if self.rows:
+            self.spill()
+
+        key = self.key
+
+        def decorate(n, run):
+            # (the run number breaks the ties, so that rows are never compared)
+            return ((key(row), n, row) for row in read_run(run))
+
+        rows = (row for _, _, row in heapq.merge(*[decorate(n, run) for n, run in enumerate(self.runs)]))
+        return unique(rows, key) if self.distinct else rows
+
+    def finish(self):
+        """
+        Write the sorted rows to the output and remove the runs
+        """
+        try:
+            rows = self.merged()
+
+            if self.width is not None:
+                rows = (row[:self.width] for row in rows)
+
+            rows = islice(rows, self.skip, self.skip + self.limit if self.limit is not None else None)
+
+            while True:
+                block = list(islice(rows, BLOCK_SIZE))
+                if not block:
+                    break
+                self.out.write_rows(block)
+        finally:
+            self.close()
+
+    def close(self):
+        for run in self.runs:
+            run.close()
+
+        self.runs = []
+        self.rows = []
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+#
+# Per-statement timing (parse, build, network, server, decode, render) and
+# a condensed view of the ElasticSearch profile API results.
+#
+
+from __future__ import print_function
+
+import time
+
+from collections import OrderedDict
+
+DESCRIPTION_WIDTH = 60
+
+
+class Timing(object):
+    """
+    The time spent in each phase of the execution of a statement
+    """
+
+    def __init__(self):
+        self.phases = OrderedDict((p, 0.0) for p in ('parse', 'build', 'network', 'decode', 'render'))
+        self.took = 0  # ElasticSearch "took", in ms
+        self.requests = 0
+        self.bytes_received = 0
+        self.bytes_decoded = 0
+        self.rows = 0
+        self.prefetch = False  # pages fetched in the background, while rendering
+        self.waited = 0.0  # time spent waiting for the next page
+        self.start = time.time()
+        self.execute = 0.0
+        self.total = 0.0
+
+    def add(self, phase, elapsed):
+        self.phases[phase] += elapsed
+
+    def record(self, pages):
+        """
+        Yield the result pages, adding up the server time and the time spent waiting for them
+        """
+        pages = iter(pages)
+
+        while True:
+            start = time.time()
+            result = next(pages, None)
+            self.waited += time.time() - start
+
+            if result is None:
+                return
+
+            yield result
+
+            # (when the page has been read, for streamed responses)
+            if isinstance(result, dict) and isinstance(result.get('took'), (int, long)):
+                self.took += result['took']
+
+    def transport(self, before, after):
+        """
+        Add the transport statistics between the before and after snapshots ((requests, elapsed, decode time,
+        bytes received, bytes decoded) from TransportStats.snapshot)
+        """
+        requests, elapsed, decode, received, decoded = [b - a for a, b in zip(before, after)]
+
+        self.requests += requests
+        self.phases['network'] += elapsed
+        self.phases['decode'] += decode
+        self.bytes_received += received
+        self.bytes_decoded += decoded
+
+    def done(self, rows, execute_time):
+        # render is what's left of the execution time (it includes decoding for streamed responses),
+        # or when prefetching (network and decode overlap rendering) what isn't spent waiting for the pages
+        self.rows = rows
+        if self.prefetch:
+            self.phases['render'] = max(0.0, execute_time - self.waited)
+        else:
+            self.phases['render'] = max(0.0, execute_time - self.phases['network'] - self.phases['decode'])
+        self.execute = execute_time
+        self.total = time.time() - self.start
+
+    def report(self):
+        print()
+        print("timing:")
+
+        for phase, elapsed in self.phases.iteritems():
+            line = "  %-12s %10.3f ms" % (phase, elapsed * 1000)
+
+            if phase == 'network':
+                line += "  (%d requests, %d bytes received, %d bytes decoded)" % (
+                    self.requests, self.bytes_received, self.bytes_decoded)
+
+            print(line)
+            if phase == 'network':
+                print("  %-12s %10d ms" % ('server took', self.took))
+
+        if self.prefetch:
+            overlap = self.phases['network'] + self.phases['decode'] + self.phases['render'] - self.execute
+            print("  %-12s %10.3f ms" % ('overlapped', max(0.0, overlap) * 1000))
+
+        rate = self.rows / self.total if self.total else 0
+        print("  %-12s %10.3f ms  (%d rows, %.1f rows/s)" % ('total', self.total * 1000, self.rows, rate))
+
+
+def nanos(item):
+    # time_in_nanos since 6.0, a "1.234ms" string before
+    if 'time_in_nanos' in item:
+        return item['time_in_nanos']
+
+    t = item.get('time', '0ms')
+    return float(t[:-2]) * 1000000 if t.endswith('ms') else 0
+
+
+def ms(n):
+    return "%10.3f ms" % (n / 1000000.0)
+
+
+def describe(item, key='description'):
+    text = " ".join(unicode(item.get(key, '')).split())
+    if len(text) > DESCRIPTION_WIDTH:
+        text = text[:DESCRIPTION_WIDTH - 3] + '...'
+    return text
+
+
+def format_query(query, depth=0):
+    lines = ["%s  %s%s %s" % (ms(nanos(query)), '  ' * depth, query.get('type', ''), describe(query))]
+    for child in query.get('children', []):
+        lines.extend(format_query(child, depth + 1))
+    return lines
+
+
+def format_collector(collector, depth=0):
+    lines = ["%s  %s%s (%s)" % (ms(nanos(collector)), '  ' * depth, collector.get('name', ''), collector.get('reason', ''))]
+    for child in collector.get('children', []):
+        lines.extend(format_collector(child, depth + 1))
+    return lines
+
+
+def format_profile(result):
+    """
+    Return the lines of a condensed per-shard view of the profile section of a search result
+    """
+    lines = []
+
+    for shard in result.get('profile', {}).get('shards', []):
+        lines.append("shard %s" % shard.get('id'))
+
+        for search in shard.get('searches', []):
+            lines.append("  query:")
+            for query in search.get('query', []):
+                lines.extend("    " + l for l in format_query(query))
+
+            lines.append("    %s  rewrite" % ms(search.get('rewrite_time', 0)))
+
+            lines.append("  collectors:")
+            for collector in search.get('collector', []):
+                lines.extend("    " + l for l in format_collector(collector))
+
+        if shard.get('aggregations'):
+            lines.append("  aggregations:")
+            for agg in shard['aggregations']:
+                lines.extend("    " + l for l in format_query(agg))
+
+    return lines
@@ -0,0 +1,410 @@
+#!/usr/bin/env python
+#
+# HTTP transport for ElasticSearch requests.
+#
+# Transports are shared by host: the same (bounded) pool of keep-alive connections is reused
+# across queries and across ElseSearch instances (i.e. when changing port or credentials in the shell).
+# Responses are requested gzip-compressed and request bodies can optionally be compressed.
+#
+# A transport can spread the requests over a list of nodes (host1:9200,host2:9200, or sniffed
+# from _nodes/http), round-robin or to the node with the lowest latency. A node that can't be
+# reached is marked dead for a (growing) backoff time and the request is retried on the next node.
+#
+
+from __future__ import print_function
+
+import json
+import re
+import threading
+import time
+import zlib
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, ConnectTimeout, Timeout
+from requests.packages.urllib3.exceptions import NewConnectionError
+
+from collections import OrderedDict
+
+from jsonstream import stream_response, DEFAULT_BATCH_SIZE
+
+DEFAULT_POOL_SIZE = 10
+
+# seconds to connect to a node (there is no read timeout by default: aggregations, counts on large
+# indexes and scroll pages can take as long as they need)
+CONNECT_TIMEOUT = 10
+
+# node selection
+BALANCE = ('round-robin', 'latency')
+
+# backoff (seconds) of a dead node: doubles at each failure, up to MAX_DEAD_TIME
+DEAD_TIME = 1.0
+MAX_DEAD_TIME = 60.0
+
+# read size for streamed responses
+CHUNK_SIZE = 64 * 1024
+
+_transports = {}
+_transports_lock = threading.Lock()
+
+
+def _gzip(data):
+    c = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return c.compress(data) + c.flush()
+
+
+def _url(host):
+    if '//' not in host:
+        host = 'http://' + host
+    return host.rstrip('/')
+
+
+def _publish_url(address, scheme):
+    # 1.x: inet[/127.0.0.1:9200], 7.x: hostname/127.0.0.1:9200, otherwise 127.0.0.1:9200
+    m = re.match(r'^(?:inet\[)?([^/]*)/?(.*?)\]?$', address)
+    hostname, address = m.groups() if m.group(2) else ('', m.group(1))
+    ip, _, port = address.rpartition(':')
+    return '%s://%s:%s' % (scheme, hostname or ip, port)
+
+
+def _retriable(err, method, path):
+    # a request that wasn't sent can be retried on another node, and so can any request that doesn't
+    # move a scroll forward (if the node failed after executing it the retry would skip a page)
+    reason = getattr(err.args[0], 'reason', None) if err.args else None
+    if isinstance(err, ConnectTimeout) or isinstance(reason, NewConnectionError):
+        return True
+
+    return method == 'DELETE' or not path.strip('/').endswith('_search/scroll')
+
+
+class Node(object):
+
+    def __init__(self, url):
+        self.url = url
+        self.requests = 0
+        self.failures = 0
+        self.active = 0
+        self.dead_until = 0
+        self.latency = None  # moving average of the response time
+
+    def status(self, now):
+        if self.dead_until > now:
+            return 'dead (retry in %.1fs)' % (self.dead_until - now)
+        return 'alive'
+
+
+class TransportStats(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        self.errors = 0
+        self.failovers = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.bytes_decoded = 0
+        self.elapsed = 0.0
+        self.decode_elapsed = 0.0
+
+    def add(self, sent, received, decoded, elapsed, error=False):
+        with self.lock:
+            self.requests += 1
+            self.errors += 1 if error else 0
+            self.bytes_sent += sent
+            self.bytes_received += received
+            self.bytes_decoded += decoded
+            self.elapsed += elapsed
+
+    def add_failover(self):
+        with self.lock:
+            self.failovers += 1
+
+    def add_decode(self, elapsed):
+        with self.lock:
+            self.decode_elapsed += elapsed
+
+    def snapshot(self):
+        return (self.requests, self.elapsed, self.decode_elapsed, self.bytes_received, self.bytes_decoded)
+
+    def stats(self):
+        n = self.requests or 1
+
+        return OrderedDict([
+            ('requests', self.requests),
+            ('errors', self.errors),
+            ('failovers', self.failovers),
+            ('bytes sent', self.bytes_sent),
+            ('bytes received', self.bytes_received),
+            ('bytes decoded', self.bytes_decoded),
+            ('compression ratio', round(float(self.bytes_decoded) / self.bytes_received, 2)
+                if self.bytes_received else 0),
+            ('total time (ms)', round(self.elapsed * 1000, 3)),
+            ('avg time (ms)', round(self.elapsed * 1000 / n, 3)),
+            ('decode time (ms)', round(self.decode_elapsed * 1000, 3)),
+            ('avg bytes received', self.bytes_received / n),
+        ])
+
+
+class Transport(object):
+
+    def __init__(self, url, pool_size=DEFAULT_POOL_SIZE, connect_timeout=CONNECT_TIMEOUT, read_timeout=None):
+        seeds = [_url(h) for h in url.split(',') if h.strip()]
+
+        self.url = ','.join(seeds)
+        self.nodes = [Node(u) for u in seeds]
+        self.balance = BALANCE[0]
+        self.timeout = (connect_timeout, read_timeout)
+        self.compress = False
+        self.stats = TransportStats()
+        self.lock = threading.Lock()
+        self.next_node = 0
+        self.pool_size = pool_size
+        self.pools = 0
+
+        self.session = requests.Session()
+        self.mount(len(seeds))
+        self.session.headers.update({
+            'Content-Type': 'application/json',
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive'
+        })
+
+    def set_auth(self, creds):
+        self.session.auth = tuple(creds) if creds else None
+
+    def mount(self, nodes):
+        # a connection pool per node (urllib3 discards the least recently used pool when there are more nodes)
+        adapter = HTTPAdapter(pool_connections=nodes, pool_maxsize=self.pool_size, pool_block=True)
+
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.pools = nodes
+
+    def select(self, tried):
+        """
+        Return the next node for a request (None if all the nodes were tried): the next alive node
+        (round-robin) or the alive node with the lowest latency, or the dead node to be retried first
+        """
+        now = time.time()
+
+        with self.lock:
+            nodes = [n for n in self.nodes if n not in tried]
+            if not nodes:
+                return None
+
+            alive = [n for n in nodes if n.dead_until <= now]
+
+            if not alive:
+                node = min(nodes, key=lambda n: n.dead_until)
+            elif self.balance == 'latency':
+                # nodes not measured yet first, and account for the requests in progress (parallel pages)
+                node = min(alive, key=lambda n: ((n.latency or 0) * (1 + n.active), n.active, n.requests))
+            else:
+                self.next_node += 1
+                node = alive[self.next_node % len(alive)]
+
+            node.active += 1
+            return node
+
+    def release(self, node, elapsed=None, failed=False):
+        """
+        Release a node selected for a request, that failed or took {elapsed} seconds (neither if it was
+        interrupted by another error)
+        """
+        with self.lock:
+            node.active -= 1
+
+            if failed:
+                node.failures += 1
+                node.dead_until = time.time() + min(DEAD_TIME * 2 ** (node.failures - 1), MAX_DEAD_TIME)
+            elif elapsed is not None:
+                node.requests += 1
+                node.failures = 0
+                node.dead_until = 0
+                node.latency = elapsed if node.latency is None else (node.latency + elapsed) / 2
+
+    def send(self, method, path, **kwargs):
+        """
+        Send the request to the next node, failing over to the other nodes when it can't be reached
+        """
+        tried = []
+        error = None
+
+        while True:
+            node = self.select(tried)
+            if node is None:
+                raise error or ConnectionError("no node to connect to")
+
+            start = time.time()
+            elapsed = None
+            failed = False
+
+            try:
+                response = self.session.request(method, "/".join((node.url, path.lstrip('/'))),
+                                                timeout=self.timeout, **kwargs)
+                elapsed = time.time() - start
+            except (ConnectionError, Timeout) as err:
+                failed = True
+                tried.append(node)
+
+                if not _retriable(err, method, path):
+                    raise
+
+                error = err
+
+                self.stats.add_failover()
+                continue
+            finally:
+                self.release(node, elapsed, failed)
+
+            return response
+
+    def sniff(self):
+        """
+        Replace the list of nodes with the nodes of the cluster that have HTTP enabled (from _nodes/http).
+        Return the list of node urls
+        """
+        result = self.get('_nodes/http')
+        scheme = self.nodes[0].url.split('://')[0]
+
+        urls = []
+        for info in ((result or {}).get('nodes') or {}).itervalues():
+            address = info.get('http', {}).get('publish_address') or info.get('http_address')
+            if address:
+                urls.append(_publish_url(address, scheme))
+
+        if urls:
+            with self.lock:
+                known = dict((n.url, n) for n in self.nodes)
+                self.nodes = [known.get(u) or Node(u) for u in sorted(set(urls))]
+
+            if len(self.nodes) > self.pools:
+                self.mount(len(self.nodes))
+
+        return [n.url for n in self.nodes]
+
+    def node_stats(self):
+        """
+        Return (url, status, requests, failures, latency in ms) for each node
+        """
+        now = time.time()
+
+        with self.lock:
+            return [(n.url, n.status(now), n.requests, n.failures,
+                     round(n.latency * 1000, 3) if n.latency is not None else None) for n in self.nodes]
+
+    def encode(self, data, headers):
+        headers = dict(headers or {})
+
+        if data is not None and not isinstance(data, basestring):
+            data = json.dumps(data)
+
+        if data and self.compress:
+            data = _gzip(data)
+            headers['Content-Encoding'] = 'gzip'
+
+        return data, headers
+
+    def request(self, method, path, params=None, data=None, headers=None):
+        data, headers = self.encode(data, headers)
+
+        start = time.time()
+        error = True
+        received = decoded = 0
+
+        try:
+            response = self.send(method, path, params=params, data=data, headers=headers)
+
+            content = response.content
+            received = int(response.headers.get('content-length') or len(content))
+            decoded = len(content)
+            error = response.status_code >= 400
+        finally:
+            self.stats.add(len(data or ''), received, decoded, time.time() - start, error)
+
+        if not content:
+            return response.status_code < 300
+
+        start = time.time()
+
+        try:
+            return json.loads(content)
+        except ValueError:
+            if error:
+                return {'error': content, 'status': response.status_code}
+            raise
+        finally:
+            self.stats.add_decode(time.time() - start)
+
+    def stream(self, method, path, params=None, data=None, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Like request, but a successful search response is decoded incrementally while reading
+        the hits (see jsonstream.stream_response)
+        """
+        data, headers = self.encode(data, None)
+
+        start = time.time()
+        response = None
+
+        try:
+            response = self.send(method, path, params=params, data=data, headers=headers, stream=True)
+        finally:
+            if response is None:
+                self.stats.add(len(data or ''), 0, 0, time.time() - start, True)
+
+        if response.status_code >= 300:
+            content = response.content
+            self.stats.add(len(data or ''), len(content), len(content), time.time() - start, True)
+
+            try:
+                return json.loads(content)
+            except ValueError:
+                return {'error': content, 'status': response.status_code}
+
+        def chunks():
+            # only the time waiting for the response is counted, not the time spent by the caller
+            elapsed = time.time() - start
+            decoded = 0
+
+            try:
+                content = response.iter_content(CHUNK_SIZE)
+                while True:
+                    t = time.time()
+                    chunk = next(content, None)
+                    elapsed += time.time() - t
+
+                    if chunk is None:
+                        break
+
+                    decoded += len(chunk)
+                    yield chunk
+            finally:
+                response.close()
+                self.stats.add(len(data or ''), response.raw.tell() or decoded, decoded, elapsed)
+
+        return stream_response(chunks(), batch_size)
+
+    def get(self, path='', params=None, data=None):
+        return self.request('GET', path, params, data)
+
+    def post(self, path='', params=None, data=None, headers=None):
+        return self.request('POST', path, params, data, headers)
+
+    def delete(self, path='', params=None, data=None):
+        return self.request('DELETE', path, params, data)
+
+
+def get_transport(url, creds=None):
+    """
+    Return the shared transport for url, setting its credentials
+    """
+    with _transports_lock:
+        transport = _transports.get(url)
+        if transport is None:
+            transport = _transports[url] = Transport(url)
+
+    transport.set_auth(creds)
+    return transport
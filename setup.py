@@ -51,13 +51,13 @@ SETUP_OPTIONS = dict(
                 ],
 
     install_requires=['pyparsing' + pyparsing_version,
-                      'rawes',
+                      'requests',
                       'cmd2',
                       ],
 
     entry_points="""
     [console_scripts]
-    elseql=elseql.elseql:run_command
+    elseql=elseql.cli:run_command
     """
     )
 
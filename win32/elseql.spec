@@ -1,6 +1,6 @@
 # -*- mode: python -*-
 a = Analysis(['elseql_run.py'],
-             hiddenimports=['rawes','pyparsing','cmd2'],
+             hiddenimports=['requests','pyparsing','cmd2'],
              hookspath=None)
 pyz = PYZ(a.pure)
 exe = EXE(pyz,